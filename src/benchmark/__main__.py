@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from src.benchmark.runner import compare_reports, load_corpus, run_benchmark
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.benchmark",
+        description="Run a corpus of queries through the workflows and report their usage.",
+    )
+    parser.add_argument("corpus", help="JSONL file of {id, sql} objects or a SQL file")
+    parser.add_argument(
+        "--workflows",
+        default="lgraph,lgraph_dynamic,flow,crew,reflective_loop,planning",
+        help="Comma separated workflows to run",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per query and workflow")
+    parser.add_argument("--output", default="benchmark_report.json", help="Report file")
+    parser.add_argument("--baseline", help="Report to compare with, e.g. of the main branch")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative change in the worse direction counted as a regression",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # imported here, so `--help` works without the workflows' dependencies
+    from src.benchmark.workflows import WORKFLOWS
+
+    names = [name.strip() for name in args.workflows.split(",") if name.strip()]
+    unknown = set(names) - set(WORKFLOWS)
+    if unknown:
+        logger.error(f"Unknown workflows {sorted(unknown)}, use some of {list(WORKFLOWS)}")
+        return 2
+
+    corpus = load_corpus(args.corpus)
+    report = asyncio.run(
+        run_benchmark(corpus, {name: WORKFLOWS[name] for name in names}, repeat=args.repeat)
+    )
+    if args.baseline:
+        with open(args.baseline) as file:
+            report["comparison"] = compare_reports(report, json.load(file), args.tolerance)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2, default=str)
+
+    for name, workflow in report["workflows"].items():
+        summary = workflow["summary"]
+        logger.info(
+            f"{name}: median {summary['wall_seconds']['median']:.1f}s,"
+            f" {summary['llm_calls']:.1f} LLM calls,"
+            f" {summary['input_tokens'] + summary['output_tokens']:.0f} tokens,"
+            f" {summary['bytes_billed'] / 1024**3:.3f} GB billed,"
+            f" improvement {summary['improvement']}, {summary['errors']} errors"
+        )
+    regressions = report.get("comparison", {}).get("regressions", [])
+    if regressions:
+        logger.error(f"Regressions against {args.baseline}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from statistics import median
+from typing import Awaitable, Callable, Optional
+
+from src.common.trials import summarize
+from src.common.usage import recording
+
+logger = logging.getLogger(__name__)
+
+# Summary metrics compared with the baseline, True if higher is better
+COMPARED_METRICS = {
+    "wall_seconds": False,
+    "llm_calls": False,
+    "input_tokens": False,
+    "output_tokens": False,
+    "bq_jobs": False,
+    "bytes_billed": False,
+    "errors": False,
+    "improvement": True,
+}
+USAGE_METRICS = ("llm_calls", "input_tokens", "output_tokens", "bq_jobs", "bytes_billed")
+
+_STATEMENT_END_RE = re.compile(r";\s*(?:\n|$)")
+
+
+@dataclass
+class WorkflowRun:
+    """Outcome of one workflow run."""
+
+    result: dict
+    # score of the final query relative to the original one, None if there is none
+    improvement: Optional[float] = None
+
+
+Workflow = Callable[[str], Awaitable[WorkflowRun]]
+
+
+def load_corpus(path: str) -> list[dict]:
+    """
+    Args:
+        path: A JSONL file with one `{"id": ..., "sql": ...}` object per line, or a SQL file
+            with the queries separated by semicolons at the end of a line.
+
+    Returns:
+        The queries with their `id` and `sql`.
+    """
+    with open(path) as file:
+        content = file.read()
+    if path.endswith(".jsonl"):
+        queries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    else:
+        queries = [{"sql": sql} for sql in _STATEMENT_END_RE.split(content) if sql.strip()]
+    return [
+        {"id": str(query.get("id") or f"q{index + 1}"), "sql": query["sql"].strip()}
+        for index, query in enumerate(queries)
+    ]
+
+
+async def run_workflow(workflow: Workflow, sql: str) -> dict:
+    """
+    Run a workflow once and record its usage.
+
+    Returns:
+        The run's `wall_seconds`, `improvement`, `error` and per-node `usage`.
+    """
+    with recording() as recorder:
+        start_time = time.monotonic()
+        improvement, error = None, None
+        try:
+            improvement = (await workflow(sql)).improvement
+        except Exception as e:
+            logger.exception(e)
+            error = f"{e}"
+        wall_seconds = time.monotonic() - start_time
+    return {
+        "wall_seconds": wall_seconds,
+        "improvement": improvement,
+        "error": error,
+        "usage": recorder.report(),
+    }
+
+
+def summarize_runs(runs: list[dict]) -> dict:
+    """
+    Args:
+        runs: Runs of one workflow, as returned by `run_workflow`.
+
+    Returns:
+        The wall time summary, the mean usage per run (in total and per node), the error
+        count and the median improvement of the successful runs.
+    """
+    improvements = [run["improvement"] for run in runs if run["improvement"] is not None]
+    summary = {
+        "runs": len(runs),
+        "errors": sum(1 for run in runs if run["error"]),
+        "wall_seconds": summarize([run["wall_seconds"] for run in runs]),
+        "improvement": median(improvements) if improvements else None,
+    }
+    for metric in USAGE_METRICS:
+        summary[metric] = sum(run["usage"]["totals"][metric] for run in runs) / len(runs)
+
+    nodes: dict[str, dict] = {}
+    for run in runs:
+        for node, stats in run["usage"]["nodes"].items():
+            totals = nodes.setdefault(node, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                totals[key] += value
+    summary["nodes"] = {
+        node: {key: value / len(runs) for key, value in stats.items()}
+        for node, stats in sorted(nodes.items())
+    }
+    return summary
+
+
+async def run_benchmark(
+    corpus: list[dict], workflows: dict[str, Workflow], repeat: int = 1
+) -> dict:
+    """
+    Run every query of the corpus through every workflow, one run at a time so runs don't
+    compete for resources and per-node timings stay meaningful.
+
+    Args:
+        corpus: Queries with their `id` and `sql`.
+        workflows: Workflows to benchmark by name.
+        repeat: Runs per query and workflow.
+
+    Returns:
+        The report: every run and a summary per workflow.
+    """
+    report = {"corpus": [query["id"] for query in corpus], "repeat": repeat, "workflows": {}}
+    for name, workflow in workflows.items():
+        runs = []
+        for query in corpus:
+            for iteration in range(repeat):
+                logger.info(f"Benchmarking {name} on {query['id']} ({iteration + 1}/{repeat})")
+                run = await run_workflow(workflow, query["sql"])
+                runs.append({"query_id": query["id"], "iteration": iteration, **run})
+        report["workflows"][name] = {"summary": summarize_runs(runs), "runs": runs}
+    return report
+
+
+def _metric(summary: dict, metric: str) -> Optional[float]:
+    value = summary.get(metric)
+    return value["median"] if isinstance(value, dict) else value
+
+
+def compare_reports(report: dict, baseline: dict, tolerance: float = 0.2) -> dict:
+    """
+    Compare the workflow summaries of a report with a stored baseline report.
+
+    Args:
+        report: Current report.
+        baseline: Baseline report.
+        tolerance: Relative change of a metric in its worse direction tolerated before it
+            counts as a regression, e.g. 0.2 for 20%.
+
+    Returns:
+        The baseline and current value and relative change of every metric of the workflows
+        both reports have, and the `regressions` as "workflow.metric" names.
+    """
+    comparison = {"workflows": {}, "regressions": []}
+    for name, workflow in report["workflows"].items():
+        if name not in baseline.get("workflows", {}):
+            continue
+        base_summary = baseline["workflows"][name]["summary"]
+        metrics = {}
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            base = _metric(base_summary, metric)
+            current = _metric(workflow["summary"], metric)
+            if base is None or current is None:
+                continue
+            # a change from 0 has no relative size, any change in the worse direction counts
+            change = (current - base) / abs(base) if base else None
+            worse = (base - current if higher_is_better else current - base) / (abs(base) or 1)
+            metrics[metric] = {"baseline": base, "current": current, "change": change}
+            if worse > (tolerance if base else 0):
+                comparison["regressions"].append(f"{name}.{metric}")
+        comparison["workflows"][name] = metrics
+    return comparison
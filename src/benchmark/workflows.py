@@ -0,0 +1,180 @@
+import importlib
+import json
+import time
+from typing import Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src.benchmark.runner import Workflow, WorkflowRun
+from src.common import usage
+from src.common.usage import UsageRecorder, current_recorder
+
+
+class NodeUsageHandler(BaseCallbackHandler):
+    """Records the wall time of every LangGraph node run and the token usage of its LLM calls."""
+
+    # run in the event loop, so node start and end times aren't skewed by executor queueing
+    run_inline = True
+
+    def __init__(self, recorder: UsageRecorder):
+        self.recorder = recorder
+        self._node_runs: dict[UUID, tuple[str, float]] = {}
+        self._llm_nodes: dict[UUID, Optional[str]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # nested chains of a node share its metadata, only the node run itself has its name
+        if node and kwargs.get("name") == node:
+            self._node_runs[run_id] = (node, time.monotonic())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self._finish_node(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        self._finish_node(run_id)
+
+    def _finish_node(self, run_id: UUID):
+        node_run = self._node_runs.pop(run_id, None)
+        if node_run is not None:
+            self.recorder.add_node_run(node_run[0], time.monotonic() - node_run[1])
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs):
+        self._llm_nodes[run_id] = (metadata or {}).get("langgraph_node")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        input_tokens, output_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage_metadata = getattr(generation, "message", None)
+                usage_metadata = getattr(usage_metadata, "usage_metadata", None) or {}
+                input_tokens += usage_metadata.get("input_tokens", 0)
+                output_tokens += usage_metadata.get("output_tokens", 0)
+        node = self._llm_nodes.pop(run_id, None) or usage.DEFAULT_NODE
+        self.recorder.add_llm_call(input_tokens, output_tokens, node=node)
+
+
+def _improvement(results: Optional[dict]) -> Optional[float]:
+    return (results or {}).get("score")
+
+
+async def _run_graph(chain, inputs: dict, run_config: dict) -> WorkflowRun:
+    callbacks = [*run_config.get("callbacks", []), NodeUsageHandler(current_recorder())]
+    state = await chain.ainvoke(inputs, config={**run_config, "callbacks": callbacks})
+    if "error" in state:
+        raise RuntimeError(state["error"])
+    return WorkflowRun(result=state, improvement=_improvement(state.get("optimized_sql_res")))
+
+
+async def run_lgraph(sql: str) -> WorkflowRun:
+    from src.lgraph import main
+    from src.lgraph.models import SqlImprovementState
+
+    return await _run_graph(main.get_chain(), SqlImprovementState(sql=sql), main.RUN_CONFIG)
+
+
+async def run_lgraph_dynamic(sql: str) -> WorkflowRun:
+    from src.lgraph import main_dynamic
+    from src.lgraph.models import SqlImprovementState
+
+    inputs = SqlImprovementState(sql=sql, attempt=0, improvements=[])
+    return await _run_graph(main_dynamic.get_chain(), inputs, main_dynamic.RUN_CONFIG)
+
+
+_crewai_events_registered = False
+
+
+def _register_crewai_events():
+    """Record the flow methods and crew tasks as nodes, once per process."""
+    global _crewai_events_registered
+    if _crewai_events_registered:
+        return
+    from crewai.utilities.events import (
+        MethodExecutionFailedEvent,
+        MethodExecutionFinishedEvent,
+        MethodExecutionStartedEvent,
+        TaskCompletedEvent,
+        TaskFailedEvent,
+        TaskStartedEvent,
+        crewai_event_bus,
+    )
+
+    from src.crewai.llm import register_node_events
+
+    # attributes the usage of the methods and tasks to them
+    register_node_events()
+    started: dict[tuple[int, str], float] = {}
+
+    def on_started(source, name: str):
+        if current_recorder() is not None:
+            started[id(source), name] = time.monotonic()
+
+    def on_finished(source, name: str):
+        start_time = started.pop((id(source), name), None)
+        recorder = current_recorder()
+        if recorder is not None and start_time is not None:
+            recorder.add_node_run(name, time.monotonic() - start_time)
+
+    crewai_event_bus.on(MethodExecutionStartedEvent)(
+        lambda source, event: on_started(source, event.method_name)
+    )
+    for event_type in (MethodExecutionFinishedEvent, MethodExecutionFailedEvent):
+        crewai_event_bus.on(event_type)(
+            lambda source, event: on_finished(source, event.method_name)
+        )
+    crewai_event_bus.on(TaskStartedEvent)(lambda source, event: on_started(source, source.name))
+    for event_type in (TaskCompletedEvent, TaskFailedEvent):
+        crewai_event_bus.on(event_type)(lambda source, event: on_finished(source, source.name))
+    _crewai_events_registered = True
+
+
+async def run_flow(sql: str) -> WorkflowRun:
+    from src.crewai.analyze_sql_flow import SqlAnalysisFlow
+
+    _register_crewai_events()
+    flow = SqlAnalysisFlow()
+    flow.state["sql"] = sql
+    # the output of the last step, verify_optimized_sql
+    result = await flow.kickoff_async()
+    return WorkflowRun(result=result, improvement=_improvement(result.get("optimized_sql_res")))
+
+
+def _same_sql(a: str, b: str) -> bool:
+    return a.split() == b.split()
+
+
+def _crew_improvement(tasks_output, chosen_sql: str, original_sql: str) -> Optional[float]:
+    """Score of the chosen query in the crew's last benchmark, 1.0 if it kept the original."""
+    from src.crewai.models import ImprovementsAnalysis
+
+    if _same_sql(chosen_sql, original_sql):
+        return 1.0
+    analyses = [t.pydantic for t in tasks_output if isinstance(t.pydantic, ImprovementsAnalysis)]
+    for analysis in reversed(analyses):
+        for index, improvement in enumerate(analysis.improvements):
+            if _same_sql(improvement.improved_sql, chosen_sql) and index < len(analysis.scores):
+                return analysis.scores[index]
+    return None
+
+
+def _crew_workflow(module: str, class_name: str) -> Workflow:
+    async def run_crew(sql: str) -> WorkflowRun:
+        _register_crewai_events()
+        crew_class = getattr(importlib.import_module(module), class_name)
+        crew_output = await crew_class().crew().kickoff_async(inputs={"sql_query": sql})
+        result = json.loads(crew_output.pydantic.json())
+        improvement = _crew_improvement(crew_output.tasks_output, result["chosen_sql"], sql)
+        return WorkflowRun(result=result, improvement=improvement)
+
+    return run_crew
+
+
+WORKFLOWS: dict[str, Workflow] = {
+    "lgraph": run_lgraph,
+    "lgraph_dynamic": run_lgraph_dynamic,
+    "flow": run_flow,
+    "crew": _crew_workflow("src.crewai.sql_optimizer_crew", "SqlAnalysisCrew"),
+    "reflective_loop": _crew_workflow("src.crewai.reflective_crew", "ReflectiveLoopCrew"),
+    "planning": _crew_workflow("src.crewai.sql_optimizer_planning_crew", "SqlAnalysisPlanningCrew"),
+}
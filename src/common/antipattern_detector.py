@@ -0,0 +1,263 @@
+import logging
+from typing import Iterator
+
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import traverse_scope
+
+from src.common.constants import SQL_ANTIPATTERNS
+from src.common.sql_parser import (
+    DIALECT,
+    SqlParseError,
+    cte_names,
+    is_cte_reference,
+    parse_sql,
+)
+
+logger = logging.getLogger(__name__)
+
+# Thresholds for the "too much of something" antipatterns
+MAX_JOINS = 4
+MAX_OR_CONDITIONS = 2
+MAX_SUBQUERY_DEPTH = 2
+MAX_CTES = 5
+
+SUGGESTIONS = {
+    "FTS001": "Filter on partitioning or clustering columns so BigQuery can prune the scan.",
+    "IJN001": "Replace the cartesian product with a JOIN on the related columns.",
+    "LDT001": "Select only the required columns and limit the returned rows.",
+    "NIN001": "Use NOT EXISTS or a LEFT JOIN ... IS NULL anti-join instead of NOT IN.",
+    "WNC001": "Exclude NULLs in the subquery or use NOT EXISTS, NOT IN yields no rows on NULL.",
+    "ORC001": "Replace chained OR conditions with IN (...) or UNION ALL of selective branches.",
+    "NJN001": "Flatten the nested joins into a single join level or a CTE.",
+    "SRT001": "Remove ORDER BY from the subquery, only the outermost ORDER BY is guaranteed.",
+    "ODR001": "Order by column names or aliases instead of positions.",
+    "UNN001": "Use UNION ALL unless duplicate rows really have to be removed.",
+    "NSC001": "Rewrite the scalar subquery as a JOIN or a window function.",
+    "NSQ001": "Flatten the nested subqueries into CTEs or joins.",
+    "CJN001": "Pre-aggregate or split the join chain into CTEs.",
+    "CTE001": "Merge CTEs which are only used once into the main query.",
+    "UNC001": "Remove the unused CTE.",
+    "ISJ001": "Replace the correlated self-referencing subquery with a window function.",
+    "DSD001": "Drop DISTINCT, GROUP BY already returns unique rows.",
+    "CND001": "Use IS NULL / IS NOT NULL, comparisons with NULL are never true.",
+    "ADC001": "Give the derived column an explicit alias.",
+    "ALS001": "Give every table in a multi-table query an alias.",
+    "WCD001": "List the required columns explicitly instead of SELECT *.",
+}
+
+# Antipatterns detected from the AST. The LLM is only asked about the remaining codes.
+STATIC_ANTIPATTERN_CODES = frozenset(SUGGESTIONS)
+
+_CATALOG = {
+    code: antipattern
+    for antipatterns in SQL_ANTIPATTERNS.values()
+    for code, antipattern in antipatterns.items()
+}
+
+
+def _location(node: exp.Expression) -> str:
+    # the BigQuery generator folds "x = NULL" into "NULL", keep comparisons readable
+    dialect = None if isinstance(node, (exp.EQ, exp.NEQ)) else DIALECT
+    snippet = " ".join(node.sql(dialect=dialect).split())
+    if len(snippet) > 80:
+        snippet = snippet[:77] + "..."
+    lines = [i.meta["line"] for i in node.find_all(exp.Identifier) if "line" in i.meta]
+    return f"line {min(lines)}: {snippet}" if lines else snippet
+
+
+def _finding(code: str, node: exp.Expression) -> dict:
+    antipattern = _CATALOG[code]
+    return {
+        "code": code,
+        "name": antipattern["name"],
+        "description": antipattern["description"],
+        "impact": antipattern["impact"],
+        "location": _location(node),
+        "suggestion": SUGGESTIONS[code],
+    }
+
+
+def _is_tautology(condition: exp.Expression) -> bool:
+    if isinstance(condition, exp.Boolean):
+        return condition.this is True
+    return (
+        isinstance(condition, exp.EQ)
+        and isinstance(condition.this, exp.Literal)
+        and condition.this == condition.expression
+    )
+
+
+def _reads_table(select: exp.Select, ctes: set[str]) -> bool:
+    source = select.args.get("from_")
+    table = source.this if source else None
+    return isinstance(table, exp.Table) and not is_cte_reference(table, ctes)
+
+
+def _check_select(select: exp.Select, ctes: set[str], is_root: bool) -> Iterator[tuple]:
+    projections = select.expressions
+    has_star = any(isinstance(p, exp.Star) or p.is_star for p in projections)
+    where = select.args.get("where")
+
+    if has_star:
+        yield "WCD001", select
+        if is_root and not select.args.get("limit"):
+            yield "LDT001", select
+    if _reads_table(select, ctes) and (where is None or _is_tautology(where.this)):
+        yield "FTS001", where or select
+
+    joins = select.args.get("joins") or []
+    aliases = {t.alias_or_name for t in select.find_all(exp.Table)}
+    for join in joins:
+        source = join.this
+        correlated_array = isinstance(source, exp.Table) and source.db in aliases
+        if (
+            not join.args.get("on")
+            and not join.args.get("using")
+            and join.args.get("kind", "") in ("", "CROSS")
+            and not isinstance(source, (exp.Unnest, exp.Lateral))
+            and not correlated_array
+        ):
+            yield "IJN001", join
+        if isinstance(source, exp.Subquery) and source.this.args.get("joins"):
+            yield "NJN001", join
+    if len(joins) >= MAX_JOINS:
+        yield "CJN001", select
+
+    if where is not None and len(list(where.find_all(exp.Or))) >= MAX_OR_CONDITIONS:
+        yield "ORC001", where
+
+    if select.args.get("distinct") and select.args.get("group"):
+        yield "DSD001", select
+
+    order = select.args.get("order")
+    if order is not None:
+        for ordered in order.expressions:
+            if isinstance(ordered.this, exp.Literal) and not ordered.this.is_string:
+                yield "ODR001", order
+                break
+        if not is_root and not select.args.get("limit"):
+            yield "SRT001", order
+
+    for projection in projections:
+        if isinstance(projection.unalias(), exp.Subquery):
+            yield "NSC001", projection
+        elif is_root and not isinstance(projection, (exp.Alias, exp.Column, exp.Star)):
+            yield "ADC001", projection
+
+    # joined tables of this SELECT, not of its subqueries, without UNNESTed arrays
+    sources = [select.args["from_"].this] if select.args.get("from_") else []
+    tables = [
+        source
+        for source in sources + [join.this for join in joins]
+        if isinstance(source, exp.Table) and source.db and source.db not in aliases
+    ]
+    if len(tables) > 1 and any(not table.alias for table in tables):
+        yield "ALS001", select
+
+
+def _check_statement(statement: exp.Expression) -> Iterator[tuple]:
+    ctes = list(statement.find_all(exp.CTE))
+    names = cte_names(statement)
+    if len(ctes) > MAX_CTES:
+        yield "CTE001", statement.args.get("with_") or statement
+    referenced = {t.name.lower() for t in statement.find_all(exp.Table) if not t.db}
+    for cte in ctes:
+        if cte.alias.lower() not in referenced:
+            yield "UNC001", cte
+
+    root = statement if isinstance(statement, exp.Select) else None
+    for select in statement.find_all(exp.Select):
+        yield from _check_select(select, names, is_root=select is root)
+        depth = len([a for a in _ancestors(select) if isinstance(a, exp.Select)])
+        if depth > MAX_SUBQUERY_DEPTH:
+            yield "NSQ001", select
+
+    for union in statement.find_all(exp.Union):
+        if union.args.get("distinct"):
+            yield "UNN001", union
+
+    for not_in in statement.find_all(exp.Not):
+        if isinstance(not_in.this, exp.In) and not_in.this.args.get("query"):
+            yield "NIN001", not_in
+            subquery = not_in.this.args["query"]
+            if not any(isinstance(n.this, exp.Is) for n in subquery.find_all(exp.Not)):
+                yield "WNC001", not_in
+
+    for comparison in statement.find_all(exp.EQ, exp.NEQ):
+        if isinstance(comparison.expression, exp.Null) or isinstance(comparison.this, exp.Null):
+            yield "CND001", comparison
+
+    yield from _check_correlated_self_joins(statement)
+
+
+def _ancestors(node: exp.Expression) -> Iterator[exp.Expression]:
+    parent = node.parent
+    while parent is not None:
+        yield parent
+        parent = parent.parent
+
+
+def _scope_tables(scope) -> set[str]:
+    return {
+        ".".join(part for part in (source.catalog, source.db, source.name) if part)
+        for source in scope.sources.values()
+        if isinstance(source, exp.Table)
+    }
+
+
+def _check_correlated_self_joins(statement: exp.Expression) -> Iterator[tuple]:
+    try:
+        scopes = traverse_scope(statement)
+    except SqlglotError as e:
+        logger.debug(f"Scope analysis failed: {e}")
+        return
+    for scope in scopes:
+        # correlated UNNESTs and derived tables read the outer row on purpose
+        if scope.is_subquery and scope.is_correlated_subquery and scope.parent is not None:
+            if _scope_tables(scope) & _scope_tables(scope.parent):
+                yield "ISJ001", scope.expression
+
+
+def detect_antipatterns(sql: str) -> list[dict]:
+    """
+    Detect the mechanically detectable antipatterns (`STATIC_ANTIPATTERN_CODES`) in a query.
+
+    Args:
+        sql: BigQuery SQL to analyze.
+
+    Returns:
+        Antipattern dicts with code, name, description, impact, location and suggestion,
+        the same shape the LLM based detection produces.
+
+    Raises:
+        SqlParseError: If the SQL can't be parsed.
+    """
+    findings = []
+    seen = set()
+    for statement in parse_sql(sql):
+        for code, node in _check_statement(statement):
+            finding = _finding(code, node)
+            key = (code, finding["location"])
+            if key not in seen:
+                seen.add(key)
+                findings.append(finding)
+    return findings
+
+
+def detect_static_antipatterns(sql: str) -> tuple[list[dict], frozenset[str]]:
+    """
+    Run the static detection if the query can be parsed.
+
+    Args:
+        sql: BigQuery SQL to analyze.
+
+    Returns:
+        The static findings and the codes which were checked, so the LLM doesn't have to.
+        Both are empty for queries that can't be parsed.
+    """
+    try:
+        return detect_antipatterns(sql), STATIC_ANTIPATTERN_CODES
+    except SqlParseError as e:
+        logger.info(f"Static antipattern detection skipped: {e}")
+        return [], frozenset()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import logging
+import os
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def read_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Split a streamed body into its non-empty lines without buffering the whole body."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _analyze_line(
+    index: int, line: bytes, analyze: Callable[[dict], Awaitable[dict]]
+) -> dict:
+    try:
+        item = json.loads(line)
+        if not str(item.get("sql") or "").strip():
+            raise ValueError("SQL query cannot be empty!")
+    except (ValueError, AttributeError) as e:
+        return {"index": index, "error": f"Invalid batch line: {e}"}
+
+    entry = {"index": index, "id": item.get("id", item.get("request_id"))}
+    try:
+        return {**entry, **await analyze(item)}
+    except Exception as e:
+        logger.exception(e)
+        return {**entry, "error": str(e)}
+
+
+async def run_batch(
+    chunks: AsyncIterable[bytes],
+    analyze: Callable[[dict], Awaitable[dict]],
+    max_workers: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Analyze a JSONL batch of queries on a bounded worker pool.
+
+    Results are yielded as soon as they finish, so one slow query doesn't hold back the
+    others, and the input is read only as fast as workers free up, so memory stays flat
+    regardless of the batch size.
+
+    Args:
+        chunks: Body of the batch, one JSON object with a `sql` key (and an optional `id` or
+            `request_id`) per line.
+        analyze: Analyzes one batch item and returns the fields of its result line.
+        max_workers: Number of queries analyzed at once, defaults to the BATCH_MAX_WORKERS
+            environment variable.
+
+    Returns:
+        NDJSON lines with the `index` of the input line, its `id` and the analysis result or
+        the `error` it failed with, in completion order.
+    """
+    max_workers = max_workers or int(os.getenv("BATCH_MAX_WORKERS", "4"))
+    pending: asyncio.Queue = asyncio.Queue(maxsize=max_workers)
+    results: asyncio.Queue = asyncio.Queue(maxsize=max_workers)
+
+    async def produce():
+        try:
+            index = 0
+            async for line in read_lines(chunks):
+                await pending.put((index, line))
+                index += 1
+        except Exception as e:
+            logger.exception(e)
+            await results.put({"error": f"Reading the batch failed: {e}"})
+        finally:
+            for _ in range(max_workers):
+                await pending.put(None)
+
+    async def work():
+        while (item := await pending.get()) is not None:
+            await results.put(await _analyze_line(*item, analyze))
+        await results.put(None)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(max_workers)]
+    try:
+        finished = 0
+        while finished < max_workers:
+            result = await results.get()
+            if result is None:
+                finished += 1
+                continue
+            yield (json.dumps(result, default=str) + "\n").encode("utf-8")
+    finally:
+        # the client may disconnect mid-batch, don't leave queries running for nobody
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
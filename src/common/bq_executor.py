@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from google.cloud import bigquery
+
+from src.common.budget import BudgetTracker, JobLimits, current_budget
+from src.common.throttle import BIGQUERY_THROTTLE, Throttle, get_throttle
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncJobExecutor:
+    """
+    Runs BigQuery query jobs from asyncio code without blocking the event loop.
+
+    Every blocking client call (job insert, job reload, cancel) is pushed to a worker thread,
+    while the waiting between state polls happens on the event loop. A throttle caps how many
+    jobs are running at once, so a burst of requests queues up locally instead of flooding
+    BigQuery with concurrent interactive queries, and retries the jobs failing on quota errors.
+    """
+
+    def __init__(
+        self,
+        throttle: Optional[Throttle] = None,
+        poll_interval_seconds: float = 0.25,
+        max_poll_interval_seconds: float = 2.0,
+    ):
+        """
+        Args:
+            throttle: Throttle of the jobs, defaults to the process-wide BigQuery throttle.
+            poll_interval_seconds: Delay before the first job state poll.
+            max_poll_interval_seconds: Upper bound for the exponentially growing poll delay.
+        """
+        self.throttle = throttle or get_throttle(BIGQUERY_THROTTLE)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_poll_interval_seconds = max_poll_interval_seconds
+        self._jobs: dict[str, bigquery.QueryJob] = {}
+
+    @property
+    def active_jobs(self) -> list[str]:
+        """IDs of the jobs submitted by this executor which are still running."""
+        return list(self._jobs)
+
+    async def run(
+        self,
+        client: bigquery.Client,
+        sql: str,
+        job_config: Optional[bigquery.QueryJobConfig] = None,
+    ) -> bigquery.QueryJob:
+        """
+        Submit a query job and wait until it is done.
+
+        Cancelling the awaiting task also cancels the job on the BigQuery side. Jobs run within
+        a `budget_scope` are limited by its budget, and cancelled when they exceed it.
+
+        Args:
+            client: BigQuery client used to submit and poll the job.
+            sql: The query to run.
+            job_config: Optional job configuration.
+
+        Returns:
+            The finished job, with its statistics loaded.
+
+        Raises:
+            google.api_core.exceptions.GoogleAPICallError: If the job finished with an error.
+            src.common.budget.BudgetExceededError: If the job would exceed or exceeded its budget.
+        """
+        return await self.throttle.acall(self._run, client, sql, job_config)
+
+    async def _run(
+        self, client: bigquery.Client, sql: str, job_config: Optional[bigquery.QueryJobConfig]
+    ) -> bigquery.QueryJob:
+        budget, limits = None, None
+        if not (job_config and job_config.dry_run):
+            budget = current_budget()
+        if budget is not None:
+            job_config, limits = await asyncio.to_thread(
+                budget.prepare_job, client, sql, job_config
+            )
+        job = await asyncio.to_thread(client.query, sql, job_config=job_config)
+        if job.dry_run:
+            return job
+
+        self._jobs[job.job_id] = job
+        try:
+            await self._wait(job, budget, limits)
+        except asyncio.CancelledError:
+            logger.info(f"Cancelling BigQuery job {job.job_id}")
+            await asyncio.shield(asyncio.to_thread(job.cancel))
+            raise
+        finally:
+            self._jobs.pop(job.job_id, None)
+            if budget is not None:
+                budget.record(job)
+
+        if job.error_result:
+            error = budget.job_error(job, limits) if budget is not None else None
+            if error is not None:
+                raise error
+            # result() maps the job error to the matching google.api_core exception, a quota
+            # error is retried by the throttle
+            await asyncio.to_thread(job.result)
+        return job
+
+    async def _wait(
+        self,
+        job: bigquery.QueryJob,
+        budget: Optional[BudgetTracker] = None,
+        limits: Optional[JobLimits] = None,
+    ):
+        interval = self.poll_interval_seconds
+        while True:
+            await asyncio.to_thread(job.reload)
+            if job.state == "DONE":
+                return
+            if budget is not None:
+                await asyncio.to_thread(budget.check_job, job, limits)
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval_seconds)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Request cancellation of a running job.
+
+        Args:
+            job_id: ID of a job submitted by this executor.
+
+        Returns:
+            True if the job was known to the executor and a cancel request was sent.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        await asyncio.to_thread(job.cancel)
+        return True
+
+    async def cancel_all(self):
+        """Request cancellation of every running job, e.g. on application shutdown."""
+        await asyncio.gather(*(self.cancel(job_id) for job_id in self.active_jobs))
+
+
+_executor: Optional[AsyncJobExecutor] = None
+
+
+def get_job_executor() -> AsyncJobExecutor:
+    """Process-wide executor, so the concurrency cap holds across all clients and workflows."""
+    global _executor
+    if _executor is None:
+        _executor = AsyncJobExecutor(
+            poll_interval_seconds=float(os.getenv("BQ_JOB_POLL_INTERVAL_SECONDS", "0.25")),
+        )
+    return _executor
@@ -0,0 +1,123 @@
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+
+from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+logger = logging.getLogger(__name__)
+
+
+def keepalive_socket_options(idle_seconds: int) -> list[tuple[int, int, int]]:
+    """
+    Args:
+        idle_seconds: Idle time of a connection before TCP keep-alive probes are sent, 0 to
+            leave keep-alive off.
+
+    Returns:
+        urllib3 socket options enabling TCP keep-alive where the platform supports them.
+    """
+    if idle_seconds <= 0:
+        return []
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, "TCP_KEEPIDLE"):  # Linux, TCP_KEEPALIVE on macOS has another meaning
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle_seconds))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, idle_seconds // 4)))
+    return options
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTP adapter keeping up to `pool_maxsize` connections per host alive for reuse."""
+
+    def __init__(self, keepalive_seconds: int = 0, **kwargs):
+        """
+        Args:
+            keepalive_seconds: See `keepalive_socket_options`.
+            **kwargs: Arguments of `requests.adapters.HTTPAdapter`.
+        """
+        # set before the base class creates the pool manager
+        self.socket_options = [
+            *HTTPConnection.default_socket_options,
+            *keepalive_socket_options(keepalive_seconds),
+        ]
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class BigQueryClientPool:
+    """
+    Shares one `bigquery.Client` per project, location and credentials across all workflows.
+
+    The clients send their requests through an HTTP session with a connection pool sized for
+    parallel fan-out: the default pool of 10 connections per host makes concurrent job inserts,
+    polls and table lookups wait for a connection, or open and discard extra ones ("Connection
+    pool is full").
+    """
+
+    def __init__(self, pool_size: int = 32, keepalive_seconds: int = 60):
+        """
+        Args:
+            pool_size: Connections kept per host.
+            keepalive_seconds: See `keepalive_socket_options`.
+        """
+        self.pool_size = pool_size
+        self.keepalive_seconds = keepalive_seconds
+        self._lock = threading.Lock()
+        # the credentials are kept with their client, so their id isn't reused meanwhile
+        self._clients: dict[tuple, tuple[bigquery.Client, object]] = {}
+
+    def get(
+        self, project_id: str, credentials=None, location: Optional[str] = None
+    ) -> bigquery.Client:
+        """
+        Args:
+            project_id: Google Cloud project ID.
+            credentials: Google credentials, the application default credentials if None.
+            location: Default location of the client's jobs.
+
+        Returns:
+            The shared client, created on first use.
+        """
+        key = (project_id, location, id(credentials))
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = (self._create(project_id, credentials, location), credentials)
+            return self._clients[key][0]
+
+    def _create(self, project_id: str, credentials, location: Optional[str]) -> bigquery.Client:
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+
+        if credentials is None:
+            credentials, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+        session = AuthorizedSession(credentials)
+        adapter = PooledHTTPAdapter(
+            keepalive_seconds=self.keepalive_seconds, pool_maxsize=self.pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        logger.info(f"Created BigQuery client for {project_id} with {self.pool_size} connections")
+        return bigquery.Client(
+            project=project_id, credentials=credentials, _http=session, location=location
+        )
+
+
+_pool: Optional[BigQueryClientPool] = None
+
+
+def get_bq_client_pool() -> BigQueryClientPool:
+    """Process-wide pool, sized by BQ_HTTP_POOL_SIZE and BQ_HTTP_KEEPALIVE_SECONDS."""
+    global _pool
+    if _pool is None:
+        _pool = BigQueryClientPool(
+            pool_size=int(os.getenv("BQ_HTTP_POOL_SIZE", "32")),
+            keepalive_seconds=int(os.getenv("BQ_HTTP_KEEPALIVE_SECONDS", "60")),
+        )
+    return _pool
@@ -0,0 +1,284 @@
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from typing import Iterator, Optional
+
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+# BigQuery bills at least 10 MB for every table a query references
+MIN_BYTES_BILLED_PER_TABLE = 10 * 1024 * 1024
+# The server-side timeout of a job is set past its local deadline, so the poller cancels it and
+# reports why before BigQuery stops it, the timeout only covers a poller which is gone
+JOB_TIMEOUT_MARGIN_SECONDS = 5.0
+
+_tracker: contextvars.ContextVar[Optional["BudgetTracker"]] = contextvars.ContextVar(
+    "budget_tracker", default=None
+)
+
+
+class BudgetExceededError(Exception):
+    """A BigQuery job would exceed, or exceeded, the budget of its request."""
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """
+    Limits of the BigQuery jobs run for one request, None for no limit.
+
+    The `job_*` limits hold for every job, e.g. one candidate query, the `total_*` limits for
+    all jobs of the request together.
+    """
+
+    job_bytes_billed: Optional[int] = None
+    job_slot_millis: Optional[int] = None
+    job_seconds: Optional[float] = None
+    total_bytes_billed: Optional[int] = None
+    total_slot_millis: Optional[int] = None
+    total_seconds: Optional[float] = None
+
+
+def get_query_budget(endpoint: str) -> QueryBudget:
+    """
+    Args:
+        endpoint: Name of the endpoint (the view function) serving the request.
+
+    Returns:
+        The budget of the endpoint in the QUERY_BUDGETS environment variable, a JSON object of
+        `QueryBudget` fields per endpoint, falling back to its "default" entry.
+
+    Raises:
+        ValueError: If a budget has an unknown field.
+    """
+    budgets = json.loads(os.getenv("QUERY_BUDGETS") or "{}")
+    budget = budgets.get(endpoint, budgets.get("default", {}))
+    unknown = set(budget) - {field.name for field in fields(QueryBudget)}
+    if unknown:
+        raise ValueError(f"Unknown query budget fields: {sorted(unknown)}")
+    return QueryBudget(**budget)
+
+
+def _min(*limits: Optional[float]) -> Optional[float]:
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+
+def _remaining(limit: Optional[float], used: float) -> Optional[float]:
+    return None if limit is None else limit - used
+
+
+def rejected_results(sql: str, error: Exception, dry_run: bool = False) -> dict:
+    """
+    Args:
+        sql: Query which exceeded its budget.
+        error: The `BudgetExceededError`.
+        dry_run: Whether the query was scored by a dry run.
+
+    Returns:
+        A metadata dict with the keys of the BigQuery clients' `execute_sql_query` and the
+        `error`, which scores the query 0 instead of failing the request.
+    """
+    return {
+        "total_bytes_processed": 0,
+        "total_bytes_billed": 0,
+        "billing_tier": 0,
+        "execution_time_seconds": 0.0,
+        "cache_hit": False,
+        "num_dml_affected_rows": 0,
+        "dry_run": dry_run,
+        "sql": sql,
+        "error": str(error),
+    }
+
+
+@dataclass
+class JobLimits:
+    """Limits of one job: its own budget, capped by what is left of the request's."""
+
+    bytes_billed: Optional[int] = None
+    slot_millis: Optional[int] = None
+    seconds: Optional[float] = None
+    # monotonic time the job has to be done by
+    deadline: Optional[float] = None
+
+
+class BudgetTracker:
+    """
+    Enforces a `QueryBudget` on the BigQuery jobs of a request and sums up what they consumed.
+
+    The tracker is thread-safe. Jobs are checked against the tracker active in their context
+    (see `budget_scope`), so concurrent requests have separate budgets.
+    """
+
+    def __init__(self, budget: QueryBudget):
+        """
+        Args:
+            budget: Limits of the request.
+        """
+        self.budget = budget
+        self.started = time.monotonic()
+        self.bytes_billed = 0
+        self.slot_millis = 0
+        self.jobs = 0
+        self.cancelled_jobs = 0
+        self._lock = threading.Lock()
+
+    def job_limits(self) -> JobLimits:
+        """
+        Returns:
+            The limits of a job starting now.
+
+        Raises:
+            BudgetExceededError: If the request's budget is used up.
+        """
+        budget = self.budget
+        with self._lock:
+            left = {
+                "bytes billed": _remaining(budget.total_bytes_billed, self.bytes_billed),
+                "slot milliseconds": _remaining(budget.total_slot_millis, self.slot_millis),
+                "seconds": _remaining(budget.total_seconds, time.monotonic() - self.started),
+            }
+        for name, remaining in left.items():
+            if remaining is not None and remaining <= 0:
+                raise BudgetExceededError(f"The request used up its budget of {name}")
+        seconds = _min(budget.job_seconds, left["seconds"])
+        return JobLimits(
+            bytes_billed=_min(budget.job_bytes_billed, left["bytes billed"]),
+            slot_millis=_min(budget.job_slot_millis, left["slot milliseconds"]),
+            seconds=seconds,
+            deadline=time.monotonic() + seconds if seconds is not None else None,
+        )
+
+    def prepare_job(
+        self, client: bigquery.Client, sql: str, job_config: Optional[bigquery.QueryJobConfig]
+    ) -> tuple[bigquery.QueryJobConfig, JobLimits]:
+        """
+        Get the limits of a job and check its dry run estimate against them.
+
+        Args:
+            client: Client the job will be run with.
+            sql: Query of the job.
+            job_config: Configuration of the job.
+
+        Returns:
+            The configuration with the limits enforced by BigQuery: `maximum_bytes_billed` and
+            `job_timeout_ms`, which cancels the job server-side even if this process dies.
+
+        Raises:
+            BudgetExceededError: If the estimate exceeds the bytes billed limit. The estimate is
+                the bytes processed of a dry run, but at least the minimum BigQuery bills for the
+                tables it references.
+        """
+        limits = self.job_limits()
+        job_config = job_config or bigquery.QueryJobConfig()
+        if limits.bytes_billed is not None:
+            dry_run = client.query(
+                sql, job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+            )
+            estimate = max(
+                dry_run.total_bytes_processed or 0,
+                MIN_BYTES_BILLED_PER_TABLE * len(dry_run.referenced_tables or []),
+            )
+            if estimate > limits.bytes_billed:
+                raise BudgetExceededError(
+                    f"The query would process {estimate} bytes, "
+                    f"over its budget of {limits.bytes_billed} bytes billed"
+                )
+            job_config.maximum_bytes_billed = int(limits.bytes_billed)
+        if limits.seconds is not None:
+            job_config.job_timeout_ms = math.ceil(
+                (limits.seconds + JOB_TIMEOUT_MARGIN_SECONDS) * 1000
+            )
+        return job_config, limits
+
+    def check_job(self, job: bigquery.QueryJob, limits: JobLimits):
+        """
+        Cancel a running job which exceeded its deadline or slot time.
+
+        Raises:
+            BudgetExceededError: If the job was cancelled.
+        """
+        reason = None
+        if limits.deadline is not None and time.monotonic() > limits.deadline:
+            reason = f"it ran over its budget of {limits.seconds:.1f} seconds"
+        elif limits.slot_millis is not None and (job.slot_millis or 0) > limits.slot_millis:
+            reason = f"it used over its budget of {limits.slot_millis} slot milliseconds"
+        if reason is None:
+            return
+        logger.warning(f"Cancelling BigQuery job {job.job_id}: {reason}")
+        job.cancel()
+        with self._lock:
+            self.cancelled_jobs += 1
+        raise BudgetExceededError(f"Job {job.job_id} was cancelled, {reason}")
+
+    def job_error(self, job: bigquery.QueryJob, limits: JobLimits) -> Optional[BudgetExceededError]:
+        """
+        Map the error of a job BigQuery stopped at a limit set by `prepare_job`.
+
+        Returns:
+            The budget error of a job which failed on its bytes billed limit or timed out,
+            counted as a cancelled job, None if the job failed for another reason.
+        """
+        error = job.error_result or {}
+        reason = error.get("reason")
+        if reason == "bytesBilledLimitExceeded" and limits.bytes_billed is not None:
+            exceeded = f"its budget of {limits.bytes_billed} bytes billed"
+        elif reason == "timeout" and limits.seconds is not None:
+            exceeded = f"its budget of {limits.seconds:.1f} seconds"
+        else:
+            return None
+        logger.warning(f"BigQuery stopped job {job.job_id}: {error.get('message')}")
+        with self._lock:
+            self.cancelled_jobs += 1
+        return BudgetExceededError(f"Job {job.job_id} was cancelled, it exceeded {exceeded}")
+
+    def wait(self, job: bigquery.QueryJob, limits: JobLimits, poll_interval_seconds: float = 0.5):
+        """Wait for a job to be done, cancelling it when it exceeds its limits."""
+        while not job.done():
+            self.check_job(job, limits)
+            time.sleep(poll_interval_seconds)
+
+    def record(self, job: bigquery.QueryJob):
+        """Add the bytes billed and slot time of a finished or cancelled job."""
+        with self._lock:
+            self.jobs += 1
+            self.bytes_billed += job.total_bytes_billed or 0
+            self.slot_millis += job.slot_millis or 0
+
+    def report(self) -> dict:
+        """The `limits` of the request and what its jobs `consumed`."""
+        with self._lock:
+            consumed = {
+                "bytes_billed": self.bytes_billed,
+                "slot_millis": self.slot_millis,
+                "seconds": round(time.monotonic() - self.started, 3),
+                "jobs": self.jobs,
+                "cancelled_jobs": self.cancelled_jobs,
+            }
+        limits = {name: limit for name, limit in asdict(self.budget).items() if limit is not None}
+        return {"limits": limits, "consumed": consumed}
+
+
+@contextmanager
+def budget_scope(budget: QueryBudget) -> Iterator[BudgetTracker]:
+    """Make a new tracker of the budget the active one of the current context."""
+    tracker = BudgetTracker(budget)
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        try:
+            _tracker.reset(token)
+        except ValueError:  # a stream closed in another context, e.g. on client disconnect
+            pass
+
+
+def current_budget() -> Optional[BudgetTracker]:
+    return _tracker.get()
@@ -0,0 +1,32 @@
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from src.common.throttle import LLM_THROTTLE, get_throttle
+
+
+class ThrottledChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    `ChatGoogleGenerativeAI` sending its requests through the shared LLM throttle, see
+    `get_throttle`. Cached and replayed generations don't reach the model, so they aren't
+    throttled.
+    """
+
+    @classmethod
+    def lc_id(cls) -> list[str]:
+        # serialized as the model it throttles, the LLM cache and recordings are keyed by it
+        return ChatGoogleGenerativeAI.lc_id()
+
+    def _generate(self, *args, **kwargs):
+        return get_throttle(LLM_THROTTLE).call(super()._generate, *args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        return await get_throttle(LLM_THROTTLE).acall(super()._agenerate, *args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        # a stream can't be retried once it yielded, it only waits for its turn
+        with get_throttle(LLM_THROTTLE).slot():
+            yield from super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with get_throttle(LLM_THROTTLE).aslot():
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Optional
+
+from src.common.llm_response_cache import get_llm_response_cache
+from src.common.replay import OFF, get_replay_mode
+from src.common.schema_context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Cached contents are reused until this share of their TTL passed, so no request races the expiry
+REUSE_SHARE = 0.9
+
+
+class Prompt(str):
+    """
+    Prompt text made of a static `prefix`, shared by many calls (instructions, the antipattern
+    catalog, the tables and query of an analysis), and the `suffix` specific to one call.
+
+    It is a plain string to every LLM, `ainvoke_prompt` sends the prefix as cached content.
+    """
+
+    prefix: str
+    suffix: str
+
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+
+class ContextCacheRegistry:
+    """
+    Registers prompt prefixes as Gemini cached contents, once per model and prefix, so the calls
+    sharing a prefix only send (and pay full price for) their suffix.
+
+    Prefixes shorter than the model's minimum cached content size are never registered. A
+    failed registration, e.g. by a model without context caching, is remembered for the TTL,
+    so the prompts are sent in full meanwhile. Concurrent first uses of a prefix wait for one
+    registration instead of each creating (and paying for) a cached content.
+    """
+
+    def __init__(self, min_tokens: int = 4096, ttl_seconds: int = 600):
+        """
+        Args:
+            min_tokens: Estimated tokens a prefix needs to be registered.
+            ttl_seconds: Lifetime of the cached contents.
+        """
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (cached content name, None if registering failed, and monotonic expiry time)
+        self._entries: dict[str, tuple[Optional[str], float]] = {}
+        self._inflight: dict[str, Future] = {}
+
+    def get(self, llm: Any, prefix: str) -> Optional[str]:
+        """
+        Args:
+            llm: `ChatGoogleGenerativeAI` the prompt is sent to.
+            prefix: Static prompt prefix.
+
+        Returns:
+            The name of the prefix's cached content, registered on first use, or None if the
+            prefix has to be sent with the prompt.
+        """
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None
+        key = hashlib.sha256(f"{llm.model}\n{prefix}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        name = None
+        try:
+            name = self._create(llm, prefix)
+        finally:
+            with self._lock:
+                self._entries = {k: e for k, e in self._entries.items() if e[1] > now}
+                self._entries[key] = (name, now + self.ttl_seconds * REUSE_SHARE)
+                del self._inflight[key]
+            future.set_result(name)
+        return name
+
+    def _create(self, llm: Any, prefix: str) -> Optional[str]:
+        from google.ai import generativelanguage_v1beta as genai
+        from google.protobuf import duration_pb2
+
+        api_key = None
+        if not llm.credentials and llm.google_api_key is not None:
+            api_key = llm.google_api_key.get_secret_value()
+        try:
+            client = genai.CacheServiceClient(
+                credentials=llm.credentials,
+                client_options={"api_key": api_key} if api_key else None,
+            )
+            cached_content = client.create_cached_content(
+                cached_content=genai.CachedContent(
+                    model=llm.model,
+                    contents=[genai.Content(role="user", parts=[genai.Part(text=prefix)])],
+                    ttl=duration_pb2.Duration(seconds=self.ttl_seconds),
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Unable to cache the prompt prefix for {llm.model}, sending it: {e}")
+            return None
+        logger.info(f"Cached a prompt prefix for {llm.model} as {cached_content.name}")
+        return cached_content.name
+
+
+_context_cache_registry: Optional[ContextCacheRegistry] = None
+
+
+def get_context_cache_registry() -> Optional[ContextCacheRegistry]:
+    """
+    Process-wide registry, None unless GEMINI_CONTEXT_CACHE is enabled, or if calls are recorded
+    or replayed (recordings are keyed by the full prompt).
+
+    Off by default: the prompt prefixes (the antipattern catalog and instructions, about 500
+    tokens, or the schema context capped by SCHEMA_CONTEXT_MAX_TOKENS plus the query) are far
+    below Gemini's minimum cached content size, so no prefix would be registered anyway.
+    """
+    global _context_cache_registry
+    if os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() != "true" or get_replay_mode() != OFF:
+        return None
+    if _context_cache_registry is None:
+        _context_cache_registry = ContextCacheRegistry(
+            min_tokens=int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096")),
+            ttl_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "600")),
+        )
+    return _context_cache_registry
+
+
+async def ainvoke_prompt(llm: Any, prompt: str, **kwargs):
+    """
+    Invoke a LangChain chat model with a prompt, sending the static prefix of a `Prompt` as
+    cached content where the model supports it and the node's responses aren't cached.
+
+    Args:
+        llm: Chat model, context caching is used with `ChatGoogleGenerativeAI`.
+        prompt: Prompt text.
+        **kwargs: Arguments of `ainvoke`.
+
+    Returns:
+        The model's message.
+    """
+    registry = get_context_cache_registry()
+    response_cache = get_llm_response_cache()
+    # a cached content name would change the response cache key with every registration
+    if response_cache is not None and response_cache.enabled():
+        registry = None
+    name = None
+    if isinstance(prompt, Prompt) and registry is not None and hasattr(llm, "cached_content"):
+        name = await asyncio.to_thread(registry.get, llm, prompt.prefix)
+    if name is None:
+        return await llm.ainvoke(str(prompt), **kwargs)
+    return await llm.ainvoke(prompt.suffix, cached_content=name, **kwargs)
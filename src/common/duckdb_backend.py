@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import duckdb
+from sqlglot import exp
+
+from src.common.query_plan import plan_summary
+from src.common.sql_parser import cte_names, is_cte_reference, parse_sql
+
+logger = logging.getLogger(__name__)
+
+DIALECT = "duckdb"
+
+# BigQuery functions DuckDB lacks, defined as macros so transpiled queries still run. The
+# hashes only have to be stable within the process, e.g. for the equivalence fingerprints.
+# format_values renders a row, or an array of rows, as the JSON of its values by column
+# position, standing in for BigQuery's FORMAT('%T', ...).
+_MACROS = (
+    "CREATE MACRO farm_fingerprint(value) AS CAST(hash(value) >> 1 AS BIGINT)",
+    """
+    CREATE MACRO format_values(value) AS CAST(
+      CASE WHEN json_type(to_json(value)) = 'ARRAY'
+      THEN to_json(
+        list_transform(json_extract(to_json(value), '$[*]'), r -> json_extract(r, '$.*'))
+      )
+      ELSE to_json(json_extract(to_json(value), '$.*'))
+      END AS VARCHAR
+    )
+    """,
+)
+
+
+def _scan_columns(extra_info: dict, columns: set[str]) -> set[str]:
+    projections = extra_info.get("Projections") or []
+    if isinstance(projections, str):
+        projections = projections.split("\n")
+    scanned = {c.strip() for c in projections} & columns
+    # filter columns pushed into the scan aren't always projected
+    for key in ("Filters", "Dynamic Filters"):
+        filters = extra_info.get(key) or ""
+        if isinstance(filters, list):
+            filters = " ".join(filters)
+        scanned |= {c for c in columns if re.search(rf"\b{re.escape(c)}\b", filters)}
+    return scanned
+
+
+def _table_scans(node: dict):
+    if node.get("operator_type") == "TABLE_SCAN":
+        yield node.get("extra_info") or {}
+    for child in node.get("children", []):
+        yield from _table_scans(child)
+
+
+def _operator_seconds(node: dict) -> float:
+    own = node.get("operator_timing", node.get("timing", 0.0)) or 0.0
+    return own + sum(_operator_seconds(child) for child in node.get("children", []))
+
+
+class DuckDBBackend:
+    """
+    Runs BigQuery SQL against local Parquet fixtures, so the graphs and crews can be exercised
+    without BigQuery.
+
+    Fixtures are laid out as `<fixtures_dir>/<dataset>/<table>.parquet` or, for tables split
+    over several files, `<fixtures_dir>/<dataset>/<table>/*.parquet`. Every fixture is exposed
+    as the view `<dataset>.<table>`, the project of a table reference is ignored. Queries are
+    transpiled from BigQuery to DuckDB SQL with sqlglot and their stats are synthesized from
+    DuckDB's profiler: bytes processed are the uncompressed sizes of the Parquet columns the
+    table scans read (BigQuery's on-demand billing model), slot milliseconds are the summed
+    operator times.
+    """
+
+    def __init__(self, fixtures_dir: str, default_dataset: Optional[str] = None):
+        """
+        Args:
+            fixtures_dir: Directory holding one subdirectory of Parquet files per dataset.
+            default_dataset: Dataset used for table references without one.
+
+        Raises:
+            FileNotFoundError: If the fixtures directory doesn't exist.
+        """
+        root = Path(fixtures_dir)
+        if not root.is_dir():
+            raise FileNotFoundError(f"DuckDB fixtures directory {fixtures_dir} not found")
+        self.default_dataset = default_dataset
+        self.connection = duckdb.connect()
+        for macro in _MACROS:
+            self.connection.execute(macro)
+        # "dataset.table" -> Parquet files, and the glob the scans report them under
+        self.tables: dict[str, list[Path]] = {}
+        self._scan_paths: dict[str, str] = {}
+        for dataset in sorted(p for p in root.iterdir() if p.is_dir()):
+            self.connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{dataset.name}"')
+            for entry in sorted(dataset.iterdir()):
+                if entry.is_dir():
+                    path, files = entry / "*.parquet", sorted(entry.glob("*.parquet"))
+                elif entry.suffix == ".parquet":
+                    path, files = entry, [entry]
+                else:
+                    continue
+                name = entry.stem
+                location = str(path).replace("'", "''")
+                self.connection.execute(
+                    f'CREATE VIEW "{dataset.name}"."{name}" AS'
+                    f" SELECT * FROM read_parquet('{location}')"
+                )
+                self.tables[f"{dataset.name}.{name}"] = files
+                self._scan_paths[str(path)] = f"{dataset.name}.{name}"
+        logger.info(f"DuckDB backend serving {len(self.tables)} tables from {fixtures_dir}")
+        self._column_bytes: dict[str, dict[str, int]] = {}
+
+    def table_key(self, table_id: str) -> str:
+        """
+        Args:
+            table_id: Table reference, "table", "dataset.table" or "project.dataset.table".
+
+        Returns:
+            The "dataset.table" name of the fixture.
+
+        Raises:
+            KeyError: If there is no fixture for the table.
+        """
+        parts = table_id.replace("`", "").split(".")
+        dataset = parts[-2] if len(parts) > 1 else self.default_dataset
+        key = f"{dataset}.{parts[-1]}"
+        if key not in self.tables:
+            raise KeyError(f"No DuckDB fixture for table {table_id}")
+        return key
+
+    def _qualify(self, sql: str) -> list[exp.Expression]:
+        statements = []
+        for statement in parse_sql(sql):
+            statement = statement.copy()
+            ctes = cte_names(statement)
+            for table in statement.find_all(exp.Table):
+                if not isinstance(table.this, exp.Identifier):
+                    continue  # table valued functions
+                if is_cte_reference(table, ctes):
+                    continue
+                table.set("catalog", None)
+                if not table.db and self.default_dataset:
+                    table.set("db", exp.to_identifier(self.default_dataset))
+            for format_ in statement.find_all(exp.Format):
+                if format_.this.name == "%T" and len(format_.expressions) == 1:
+                    format_.replace(
+                        exp.Anonymous(this="format_values", expressions=format_.expressions)
+                    )
+            statements.append(statement)
+        return statements
+
+    def transpile(self, sql: str) -> list[str]:
+        """
+        Args:
+            sql: BigQuery SQL, one or more statements.
+
+        Returns:
+            The DuckDB SQL of every statement, with table references pointing to the fixtures.
+
+        Raises:
+            SqlParseError: If the SQL can't be parsed.
+        """
+        return [statement.sql(dialect=DIALECT) for statement in self._qualify(sql)]
+
+    def column_bytes(self, key: str) -> dict[str, int]:
+        """Uncompressed bytes of every top-level column of a fixture table."""
+        if key not in self._column_bytes:
+            sizes: dict[str, int] = {}
+            cursor = self.connection.cursor()
+            for file in self.tables[key]:
+                rows = cursor.execute(
+                    "SELECT path_in_schema, total_uncompressed_size FROM parquet_metadata(?)",
+                    [str(file)],
+                ).fetchall()
+                for path, size in rows:
+                    column = path.split(",")[0].strip()
+                    sizes[column] = sizes.get(column, 0) + (size or 0)
+            self._column_bytes[key] = sizes
+        return self._column_bytes[key]
+
+    def _scanned_bytes(self, profile: dict) -> int:
+        total = 0
+        for extra_info in _table_scans(profile):
+            # DuckDB 1.2 and older don't report the files of a Parquet scan, see the Pipfile pin
+            key = self._scan_paths.get(extra_info.get("Filename(s)", ""))
+            if key is None:
+                continue
+            sizes = self.column_bytes(key)
+            total += sum(sizes[c] for c in _scan_columns(extra_info, set(sizes)))
+        return total
+
+    def execute(self, sql: str) -> dict:
+        """
+        Run a query and synthesize the stats BigQuery would report for it.
+
+        Args:
+            sql: BigQuery SQL to run.
+
+        Returns:
+            A metadata dict with the keys of the BigQuery clients' `execute_sql_query`.
+        """
+        statements = self.transpile(sql)
+        cursor = self.connection.cursor()
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_path = os.path.join(tmp, "profile.json")
+            cursor.execute("PRAGMA enable_profiling = 'json'")
+            cursor.execute(f"PRAGMA profiling_output = '{profile_path}'")
+            bytes_processed, server_time, operator_time = 0, 0.0, 0.0
+            affected_rows = 0
+            start_time = time.time()
+            for statement in statements:
+                rows = cursor.execute(statement).fetchall()
+                with open(profile_path) as file:
+                    profile = json.load(file)
+                bytes_processed += self._scanned_bytes(profile)
+                server_time += profile.get("latency", profile.get("timing", 0.0)) or 0.0
+                operator_time += _operator_seconds(profile)
+                if cursor.description and cursor.description[0][0] == "Count" and rows:
+                    affected_rows += rows[0][0] or 0  # DML statements return one "Count" row
+            end_time = time.time()
+
+        return {
+            "total_bytes_processed": bytes_processed,
+            "total_bytes_billed": bytes_processed,
+            "billing_tier": 0,
+            "execution_time_seconds": end_time - start_time,
+            "cache_hit": False,
+            "num_dml_affected_rows": affected_rows,
+            "dry_run": False,
+            "sql": sql,
+            "server_time_seconds": server_time,
+            "slot_millis": int(operator_time * 1000),
+            "shuffle_output_bytes": 0,
+            "shuffle_output_bytes_spilled": 0,
+            "query_plan": [],
+            "plan_summary": plan_summary([]),
+        }
+
+    def dry_run(self, sql: str) -> dict:
+        """
+        Validate a query and estimate its bytes without executing it.
+
+        The estimate counts every column of the referenced tables which the query names, or
+        all of them for a `SELECT *`.
+
+        Args:
+            sql: BigQuery SQL to validate.
+
+        Returns:
+            A metadata dict with the keys of the BigQuery clients' `dry_run_sql_query`.
+        """
+        metadata = {
+            "total_bytes_processed": 0,
+            "total_bytes_billed": 0,
+            "billing_tier": 0,
+            "execution_time_seconds": 0.0,
+            "cache_hit": False,
+            "num_dml_affected_rows": 0,
+            "dry_run": True,
+            "referenced_tables": [],
+            "error": None,
+            "sql": sql,
+        }
+        cursor = self.connection.cursor()
+        try:
+            statements = self._qualify(sql)
+            for statement in statements:
+                cursor.execute(f"EXPLAIN {statement.sql(dialect=DIALECT)}")
+        except (duckdb.Error, ValueError) as e:
+            logger.info(f"Dry run failed: {e}")
+            metadata["error"] = f"{e}"
+            return metadata
+
+        names, star, tables = set(), False, []
+        for statement in statements:
+            names |= {column.name for column in statement.find_all(exp.Column)}
+            star = star or statement.find(exp.Star) is not None
+            for table in statement.find_all(exp.Table):
+                key = f"{table.db}.{table.name}"
+                if key in self.tables and key not in tables:
+                    tables.append(key)
+        for key in tables:
+            metadata["total_bytes_processed"] += sum(
+                size for column, size in self.column_bytes(key).items() if star or column in names
+            )
+        metadata["referenced_tables"] = tables
+        metadata["total_bytes_billed"] = metadata["total_bytes_processed"]
+        return metadata
+
+    def query_rows(self, sql: str) -> list[dict]:
+        """Run a query and return its rows as dicts."""
+        cursor = self.connection.cursor()
+        rows = []
+        for statement in self.transpile(sql):
+            result = cursor.execute(statement)
+            columns = [column[0] for column in result.description or []]
+            rows = [dict(zip(columns, row, strict=True)) for row in result.fetchall()]
+        return rows
+
+    def table_metadata(self, table_id: str) -> dict:
+        """
+        Args:
+            table_id: Table reference, "table", "dataset.table" or "project.dataset.table".
+
+        Returns:
+            The fields of `SchemaInfo` with BigQuery column types, row count, uncompressed size
+            and the modification time of the newest fixture file.
+
+        Raises:
+            KeyError: If there is no fixture for the table.
+        """
+        key = self.table_key(table_id)
+        dataset, table = key.split(".")
+        cursor = self.connection.cursor()
+        columns = [
+            {
+                "column_name": name,
+                "column_type": exp.DataType.build(column_type, dialect=DIALECT).sql("bigquery"),
+            }
+            for name, column_type, *_ in cursor.execute(
+                f'DESCRIBE "{dataset}"."{table}"'
+            ).fetchall()
+        ]
+        row_count = sum(
+            cursor.execute("SELECT num_rows FROM parquet_file_metadata(?)", [str(f)]).fetchone()[0]
+            for f in self.tables[key]
+        )
+        modified = max((f.stat().st_mtime for f in self.tables[key]), default=None)
+        return {
+            "table_name": table,
+            "dataset_name": dataset,
+            "columns": columns,
+            "row_count": row_count,
+            "size_bytes": sum(self.column_bytes(key).values()),
+            "last_modified": datetime.fromtimestamp(modified, timezone.utc).isoformat()
+            if modified is not None
+            else None,
+        }
+
+
+_backend: Optional[DuckDBBackend] = None
+
+
+def get_duckdb_backend() -> DuckDBBackend:
+    """Process-wide backend, so every client and workflow shares the fixture views."""
+    from src.common.env_setup import BQ_DEFAULT_DATASET, DUCKDB_FIXTURES_DIR
+
+    global _backend
+    if _backend is None:
+        _backend = DuckDBBackend(DUCKDB_FIXTURES_DIR, BQ_DEFAULT_DATASET)
+    return _backend
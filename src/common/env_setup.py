@@ -1,19 +1,35 @@
 import json
 import logging
 import os
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
-from google.cloud import aiplatform
-from google.oauth2 import service_account
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langfuse import Langfuse
-from langfuse.callback import CallbackHandler
+
+# the frameworks are imported by the functions using them, so importing the settings is cheap
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langfuse import Langfuse
+    from langfuse.callback import CallbackHandler
 
 load_dotenv()
 
 GCP_REGION = os.getenv("GCP_REGION", "us-central1")
 GCP_PROJECT = os.getenv("GCP_PROJECT", "gd-gcp-rnd-analytical-platform")
 GCP_MODE = os.getenv("GCP_MODE", "LOCAL")
+# Dataset assumed for table references which don't specify one
+BQ_DEFAULT_DATASET = os.getenv("BQ_DEFAULT_DATASET")
+# Run the queries against BigQuery ("bigquery") or local Parquet fixtures ("duckdb")
+SQL_BACKEND = os.getenv("SQL_BACKEND", "bigquery").lower()
+DUCKDB_FIXTURES_DIR = os.getenv("DUCKDB_FIXTURES_DIR", "fixtures")
+# Score candidate queries from dry runs (estimated bytes only) instead of executing them
+BQ_DRY_RUN_SCORING = os.getenv("BQ_DRY_RUN_SCORING", "false").lower() == "true"
+# Run every scored query this many times (after the warm-up runs) and use median timings
+BQ_BENCHMARK_TRIALS = int(os.getenv("BQ_BENCHMARK_TRIALS", "1"))
+BQ_BENCHMARK_WARMUP = int(os.getenv("BQ_BENCHMARK_WARMUP", "0"))
+# Check that optimized queries return the same rows as the original before accepting them
+VERIFY_EQUIVALENCE = os.getenv("VERIFY_EQUIVALENCE", "true").lower() == "true"
+# Get antipatterns, suggestions and the optimized query from one structured LLM call
+FUSED_ANALYSIS = os.getenv("FUSED_ANALYSIS", "false").lower() == "true"
 
 logging.basicConfig(
     format=f"%(asctime)s: %(levelname)s - %(message)s",
@@ -24,7 +40,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def setup_langfuse() -> Langfuse:
+def setup_langfuse() -> "Langfuse":
+    from langfuse import Langfuse
+
     langfuse = Langfuse(
         secret_key=os.getenv("LANGFUSE_PRIVATE_KEY", "[NOT_FILLED]"),
         public_key=os.getenv("LANGFUSE_PUBLIC_KEY", "[NOT_FILLED]"),
@@ -33,7 +51,9 @@ def setup_langfuse() -> Langfuse:
     return langfuse
 
 
-def setup_langfuse_callback() -> CallbackHandler:
+def setup_langfuse_callback() -> "CallbackHandler":
+    from langfuse.callback import CallbackHandler
+
     # langfuse = setup_langfuse()
     langfuse_handler = CallbackHandler(
         os.getenv("LANGFUSE_PUBLIC_KEY", "[NOT_FILLED]"),
@@ -45,10 +65,14 @@ def setup_langfuse_callback() -> CallbackHandler:
 
 
 def setup_aiplatform():
-    if GCP_MODE == "WIF":
+    from google.cloud import aiplatform
+    from google.oauth2 import service_account
+
+    GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if GCP_MODE == "WIF" or not GOOGLE_APPLICATION_CREDENTIALS:
+        # workload identity or the application default credentials
         aiplatform.init(location=GCP_REGION, project=GCP_PROJECT)
     else:
-        GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         if json.loads(GOOGLE_APPLICATION_CREDENTIALS)["type"] == "authorized_user":
             with open("credentials.json", "w") as file:
                 file.write(GOOGLE_APPLICATION_CREDENTIALS)  # dev env only
@@ -63,17 +87,26 @@ def setup_aiplatform():
             return credentials
 
 
-def create_llm(model_name="gemini-2.0-flash", temperature=1.0, callbacks=None):
+def create_llm(
+    model_name="gemini-2.0-flash", temperature=1.0, callbacks=None
+) -> "ChatGoogleGenerativeAI":
     """
     Creates a Langchain ChatGoogleGenerativeAI LLM.
 
     Args:
         model_name (str): The name of the Google Gemini model to use.
         temperature (float): The temperature setting for the model.
+        callbacks: LangChain callbacks of the model.
 
     Returns:
         ChatGoogleGenerativeAI: A Langchain ChatGoogleGenerativeAI LLM.
     """
+    from src.common.chat_models import ThrottledChatGoogleGenerativeAI
+    from src.common.llm_cache import get_llm_cache
 
-    llm = ChatGoogleGenerativeAI(model=model_name, temperature=temperature, callbacks=callbacks)
+    # records or replays the generations when REPLAY_MODE is set, else caches the responses
+    # of the nodes opted in with LLM_CACHE_NODES, the requests share the LLM quota throttle
+    llm = ThrottledChatGoogleGenerativeAI(
+        model=model_name, temperature=temperature, callbacks=callbacks, cache=get_llm_cache()
+    )
     return llm
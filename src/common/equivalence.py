@@ -0,0 +1,255 @@
+import asyncio
+import logging
+from typing import Awaitable, Optional, TypeVar
+
+from sqlglot import exp
+
+from src.common.sql_parser import DIALECT, SqlParseError, parse_sql
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EQUIVALENT = "equivalent"
+DIFFERENT = "different"
+INCONCLUSIVE = "inconclusive"
+
+# Rows are rendered as literals with FORMAT('%T'), which prints the values by column position
+# without the column names: renaming an output column keeps the fingerprint, reordering the
+# columns changes it.
+# FLOAT64 values are printed with a `.` or exponent (inf and NaN as a CAST to FLOAT64), which
+# `has_float` looks for outside of quoted strings: float aggregates aren't bit-stable, e.g. a
+# SUM depends on the order it adds up rows in.
+_HAS_FLOAT = r"""REGEXP_CONTAINS(
+    REGEXP_REPLACE({text}, r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'', ''),
+    r'[0-9][.eE]|FLOAT64'
+  )"""
+
+# Every row is fingerprinted together with its occurrence number, so pairs of duplicate rows
+# don't cancel each other out in the XOR
+_UNORDERED_FINGERPRINT = """
+SELECT
+  COUNT(*) AS row_count,
+  BIT_XOR(FARM_FINGERPRINT(CONCAT(row_text, '#', CAST(occurrence AS STRING)))) AS fingerprint,
+  LOGICAL_OR({has_float}) AS has_float
+FROM (
+  SELECT row_text, ROW_NUMBER() OVER (PARTITION BY row_text) AS occurrence
+  FROM (SELECT FORMAT('%T', t) AS row_text FROM ({sql}) AS t)
+)
+"""
+
+# ARRAY() keeps the order of its subquery's ORDER BY
+_ORDERED_FINGERPRINT = """
+SELECT
+  ARRAY_LENGTH(result_rows) AS row_count,
+  FARM_FINGERPRINT(FORMAT('%T', result_rows)) AS fingerprint,
+  {has_float} AS has_float
+FROM (SELECT ARRAY({sql}) AS result_rows)
+"""
+
+
+def _is_total_order(select: exp.Select) -> bool:
+    # ties of an ORDER BY covering every output column are identical rows, any other ORDER BY
+    # may return tied rows in any order
+    projections = select.expressions
+    if any(projection.is_star for projection in projections):
+        return False
+    keys = set()
+    for ordered in select.args["order"].expressions:
+        key = ordered.this
+        if isinstance(key, exp.Literal) and key.is_int and 0 < int(key.name) <= len(projections):
+            key = projections[int(key.name) - 1]
+            keys.add(key.alias_or_name)
+            key = key.unalias()
+        elif isinstance(key, exp.Column) and not key.table:
+            keys.add(key.name)
+        keys.add(key.sql(dialect=DIALECT))
+    return all(
+        projection.alias_or_name in keys or projection.unalias().sql(dialect=DIALECT) in keys
+        for projection in projections
+    )
+
+
+def plan_equivalence_check(sql: str) -> tuple[Optional[bool], Optional[str]]:
+    """
+    Decide how the results of a query can be compared.
+
+    Args:
+        sql: The original query.
+
+    Returns:
+        Whether the row order is compared, only if the query ends with an ORDER BY over every
+        output column (other sort keys may have ties, which come back in any order), or None
+        and the reason if the results can't be compared.
+    """
+    try:
+        statements = parse_sql(sql)
+    except SqlParseError as e:
+        return None, f"{e}"
+    if len(statements) != 1 or not isinstance(statements[0], exp.Query):
+        return None, "Only single SELECT statements can be compared"
+    query = statements[0]
+    has_order = query.args.get("order") is not None
+    # the ordered fingerprint needs SELECT AS STRUCT, set operations only get the unordered one
+    total_order = has_order and isinstance(query, exp.Select) and _is_total_order(query)
+    if query.args.get("limit") is not None and not total_order:
+        if not has_order:
+            return None, "LIMIT without ORDER BY returns arbitrary rows"
+        return None, "LIMIT with an ORDER BY on possibly tied keys returns arbitrary rows"
+    return total_order, None
+
+
+def build_fingerprint_query(sql: str, order_sensitive: bool) -> str:
+    """
+    Wrap a query in a BigQuery-side aggregate, so only its fingerprint crosses the wire.
+
+    Args:
+        sql: Query to fingerprint.
+        order_sensitive: Whether the fingerprint depends on the row order.
+
+    Returns:
+        SQL returning a single row with `row_count`, `fingerprint` and whether the rows have
+        FLOAT64 values (`has_float`).
+
+    Raises:
+        SqlParseError: If an order-sensitive fingerprint is requested for a query that
+            isn't a single SELECT statement.
+    """
+    if not order_sensitive:
+        return _UNORDERED_FINGERPRINT.format(
+            sql=sql.strip().rstrip(";"), has_float=_HAS_FLOAT.format(text="row_text")
+        )
+    statements = parse_sql(sql)
+    if len(statements) != 1 or not isinstance(statements[0], exp.Select):
+        raise SqlParseError("Order-sensitive fingerprints need a single SELECT statement")
+    select = statements[0].copy()
+    select.set("kind", "STRUCT")
+    return _ORDERED_FINGERPRINT.format(
+        sql=select.sql(dialect=DIALECT),
+        has_float=_HAS_FLOAT.format(text="FORMAT('%T', result_rows)"),
+    )
+
+
+def _verdict(order_sensitive: bool, original: dict, optimized: dict) -> dict:
+    if original["row_count"] != optimized["row_count"]:
+        status, reason = DIFFERENT, "Row count differs from the original query"
+    elif original["fingerprint"] == optimized["fingerprint"]:
+        status, reason = EQUIVALENT, None
+    elif original.get("has_float") or optimized.get("has_float"):
+        status = INCONCLUSIVE
+        reason = "Fingerprint differs, but FLOAT64 values may differ only by rounding"
+    else:
+        status, reason = DIFFERENT, "Fingerprint differs from the original query"
+    return {
+        "status": status,
+        "order_sensitive": order_sensitive,
+        "reason": reason,
+        "original": original,
+        "optimized": optimized,
+    }
+
+
+def _inconclusive(reason: str, order_sensitive: Optional[bool] = None) -> dict:
+    return {
+        "status": INCONCLUSIVE,
+        "order_sensitive": order_sensitive,
+        "reason": reason,
+        "original": None,
+        "optimized": None,
+    }
+
+
+def _prepare(original_sql: str, optimized_sql: str):
+    order_sensitive, reason = plan_equivalence_check(original_sql)
+    if reason:
+        return None, reason
+    try:
+        queries = (
+            build_fingerprint_query(original_sql, order_sensitive),
+            build_fingerprint_query(optimized_sql, order_sensitive),
+        )
+    except SqlParseError as e:
+        return None, f"{e}"
+    return (order_sensitive, queries), None
+
+
+def check_equivalence(bq_client, original_sql: str, optimized_sql: str) -> dict:
+    """
+    Check that two queries return the same rows without downloading them.
+
+    Args:
+        bq_client: Client with a blocking `query_single_row(sql) -> dict` method.
+        original_sql: The original query.
+        optimized_sql: The rewritten query.
+
+    Returns:
+        The `status` ("equivalent", "different" or "inconclusive"), whether the row order was
+        compared, the `reason` for a non equivalent status and both fingerprints.
+    """
+    prepared, reason = _prepare(original_sql, optimized_sql)
+    if reason:
+        return _inconclusive(reason)
+    order_sensitive, (original_query, optimized_query) = prepared
+    try:
+        original = bq_client.query_single_row(original_query)
+        optimized = bq_client.query_single_row(optimized_query)
+    except Exception as e:
+        logger.info(f"Equivalence check failed: {e}")
+        return _inconclusive(f"Fingerprint query failed: {e}", order_sensitive)
+    return _verdict(order_sensitive, original, optimized)
+
+
+async def check_equivalence_async(bq_client, original_sql: str, optimized_sql: str) -> dict:
+    """Asyncio variant of `check_equivalence`, both fingerprints are computed concurrently."""
+    prepared, reason = _prepare(original_sql, optimized_sql)
+    if reason:
+        return _inconclusive(reason)
+    order_sensitive, (original_query, optimized_query) = prepared
+    try:
+        original, optimized = await asyncio.gather(
+            bq_client.query_single_row(original_query),
+            bq_client.query_single_row(optimized_query),
+        )
+    except Exception as e:
+        logger.info(f"Equivalence check failed: {e}")
+        return _inconclusive(f"Fingerprint query failed: {e}", order_sensitive)
+    return _verdict(order_sensitive, original, optimized)
+
+
+async def measure_with_equivalence(
+    measurement: Awaitable[T], bq_client, original_sql: str, optimized_sql: str
+) -> tuple[T, dict]:
+    """
+    Await the measurement of an optimized query while its equivalence is checked.
+
+    If the measurement fails, e.g. because it's over budget, the equivalence check is
+    cancelled, which cancels its fingerprint jobs rather than letting them bill for a rejected
+    query.
+
+    Args:
+        measurement: Run of the optimized query.
+        bq_client: Client with an async `query_single_row(sql) -> dict` method.
+        original_sql: The original query.
+        optimized_sql: The rewritten query.
+
+    Returns:
+        The measurement's result and the `check_equivalence_async` verdict.
+    """
+    check = asyncio.ensure_future(check_equivalence_async(bq_client, original_sql, optimized_sql))
+    try:
+        result = await measurement
+    except BaseException:
+        check.cancel()
+        raise
+    return result, await check
+
+
+def equivalence_note(results: Optional[dict]) -> str:
+    """Prompt sentence rejecting an optimized query whose results differ from the original."""
+    equivalence = (results or {}).get("equivalence") or {}
+    if equivalence.get("status") != DIFFERENT:
+        return ""
+    return (
+        "The optimized SQL returns DIFFERENT rows than the original SQL,"
+        " it is not a valid optimization regardless of its score."
+    )
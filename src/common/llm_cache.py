@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumpd, load
+
+from src.common.llm_response_cache import LLMResponseCache, get_llm_response_cache
+from src.common.replay import OFF, REPLAY, ReplayStore, get_replay_mode, get_replay_store
+
+
+class ReplayCache(BaseCache):
+    """
+    LangChain LLM cache recording or replaying every generation through a `ReplayStore`.
+
+    Unlike a regular cache, recording never serves a hit, so every prompt reaches the model
+    and gets recorded, while replaying never misses: an unrecorded prompt raises
+    `ReplayMissError`. Bound tools and model parameters are part of LangChain's `llm_string`,
+    so tool calling models are recorded per tool set.
+    """
+
+    def __init__(self, store: ReplayStore):
+        """
+        Args:
+            store: Recordings.
+        """
+        self.store = store
+        self._lock = threading.Lock()
+        # start time of the prompts being generated, to record their latency
+        self._started: dict[str, float] = {}
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.store.key("llm", [prompt, llm_string])
+        if self.store.mode != REPLAY:
+            with self._lock:
+                self._started[key] = time.monotonic()
+            return None
+        generations, delay = self.store.replay(key)
+        time.sleep(delay)
+        return [load(generation) for generation in generations]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        key = self.store.key("llm", [prompt, llm_string])
+        with self._lock:
+            started = self._started.pop(key, None)
+        seconds = time.monotonic() - started if started is not None else 0.0
+        self.store.record(key, [dumpd(generation) for generation in return_val], seconds)
+
+    def clear(self, **kwargs: Any):
+        """Recordings are only removed by deleting the store."""
+
+
+def get_replay_cache() -> Optional[ReplayCache]:
+    """LLM cache of the process-wide recordings, None if record/replay is disabled."""
+    store = get_replay_store()
+    return ReplayCache(store) if store is not None else None
+
+
+class NodeResponseCache(BaseCache):
+    """LangChain LLM cache serving the generations of the nodes an `LLMResponseCache` caches."""
+
+    def __init__(self, cache: LLMResponseCache):
+        """
+        Args:
+            cache: Responses.
+        """
+        self.cache = cache
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if not self.cache.enabled():
+            return None
+        generations = self.cache.get(self.cache.key(llm_string, prompt))
+        if generations is None:
+            return None
+        return [load(generation) for generation in generations]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        if self.cache.enabled():
+            key = self.cache.key(llm_string, prompt)
+            self.cache.put(key, [dumpd(generation) for generation in return_val])
+
+    def clear(self, **kwargs: Any):
+        self.cache.store.clear()
+
+
+def get_llm_cache() -> Optional[BaseCache]:
+    """
+    LangChain cache of `create_llm`: the recordings while REPLAY_MODE is set, else the
+    response cache of the opted-in nodes, if any.
+    """
+    if get_replay_mode() != OFF:
+        return get_replay_cache()
+    cache = get_llm_response_cache()
+    return NodeResponseCache(cache) if cache is not None else None
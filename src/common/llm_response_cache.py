@@ -0,0 +1,98 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from src.common.replay import OFF, get_replay_mode
+from src.common.sqlite_store import SqliteStore
+from src.common.usage import current_node
+
+logger = logging.getLogger(__name__)
+
+# Nodes, flow methods and crew tasks whose LLM responses are cached by default: table
+# extraction and antipattern detection, but not the rewrites, which should vary between runs,
+# nor the "reanalyze" loop node, which would get the response of the first analysis back
+DEFAULT_CACHED_NODES = (
+    "identify_tables,get_tables,sql_query_analysis,"
+    "find_antipatterns,antipatterns,identify_antipatterns"
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Prompt with all whitespace runs collapsed, so indentation and blank lines don't matter."""
+    return " ".join(prompt.split())
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of LLM responses for the workflow nodes opted in to it.
+
+    Responses are keyed by the model and its parameters (the temperature among them) and the
+    normalized prompt, so identical steps of different requests, e.g. the table extraction of
+    the same query, are served from the cache. Whether the running code belongs to an opted-in
+    node is told by `usage.current_node`: the LangGraph node, or the flow method or crew task.
+    """
+
+    def __init__(self, store: SqliteStore, nodes: frozenset[str]):
+        """
+        Args:
+            store: On-disk store of the responses.
+            nodes: Names of the nodes whose responses are cached.
+        """
+        self.store = store
+        self.nodes = nodes
+
+    def enabled(self) -> bool:
+        """Whether the responses of the current node are cached."""
+        return current_node() in self.nodes
+
+    @staticmethod
+    def key(model: str, prompt: str, parameters: Any = None) -> str:
+        """
+        Args:
+            model: Model name or LangChain's `llm_string` of the model and its parameters.
+            prompt: Prompt text or serialized messages.
+            parameters: Further JSON serializable parameters, e.g. the temperature and tools.
+
+        Returns:
+            Hex digest identifying the request.
+        """
+        data = json.dumps([model, normalize_prompt(prompt), parameters], default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.store.get(key)
+
+    def put(self, key: str, value: Any):
+        self.store.put(key, value)
+
+
+_llm_response_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_response_cache() -> Optional[LLMResponseCache]:
+    """
+    Process-wide LLM response cache, None if LLM_CACHE_ENABLED is false, no node is opted in
+    with LLM_CACHE_NODES or calls are recorded or replayed.
+    """
+    global _llm_response_cache
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() != "true" or get_replay_mode() != OFF:
+        return None
+    nodes = frozenset(
+        node.strip() for node in os.getenv("LLM_CACHE_NODES", DEFAULT_CACHED_NODES).split(",")
+    ) - {""}
+    if not nodes:
+        return None
+    if _llm_response_cache is None:
+        ttl = os.getenv("LLM_CACHE_TTL_SECONDS", "86400")
+        _llm_response_cache = LLMResponseCache(
+            SqliteStore(
+                os.getenv("LLM_CACHE_PATH", ".cache/llm.sqlite"),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+                ttl_seconds=float(ttl) if ttl else None,
+            ),
+            nodes,
+        )
+        logger.info(f"Caching the LLM responses of {sorted(nodes)}")
+    return _llm_response_cache
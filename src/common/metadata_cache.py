@@ -0,0 +1,168 @@
+import asyncio
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    version: Optional[str]
+    expires_at: float
+
+
+def _last_modified(schema_info) -> Optional[str]:
+    if isinstance(schema_info, dict):
+        return schema_info.get("last_modified")
+    return getattr(schema_info, "last_modified", None)
+
+
+class TableMetadataCache:
+    """
+    Thread-safe LRU cache for `SchemaInfo` objects with a TTL.
+
+    Every lookup returns its own copy of the metadata, so a caller modifying it doesn't change
+    what the other requests get. An expired entry is reloaded: checking the table's modified
+    time costs the same `get_table` call as loading its metadata. Concurrent lookups of the
+    same missing table are coalesced into a single load.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0, clock=time.monotonic):
+        """
+        Args:
+            max_entries: Number of tables kept before the least recently used one is evicted.
+            ttl_seconds: How long an entry is served without checking the table again.
+            clock: Monotonic time source, in seconds.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached metadata for a table, loading it on a miss.
+
+        Args:
+            key: Fully qualified table ID.
+            loader: Fetches fresh metadata for the table.
+
+        Returns:
+            A copy of the cached or freshly loaded metadata.
+        """
+        value, future, owner = self._claim(key)
+        if future is None:
+            return copy.deepcopy(value)
+        if not owner:
+            return copy.deepcopy(future.result())
+        return copy.deepcopy(self._resolve(key, future, loader))
+
+    async def aget(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Asyncio variant of `get`; the blocking loader runs in a worker thread."""
+        value, future, owner = self._claim(key)
+        if future is None:
+            return copy.deepcopy(value)
+        if not owner:
+            return copy.deepcopy(await asyncio.wrap_future(future))
+        return copy.deepcopy(await asyncio.to_thread(self._resolve, key, future, loader))
+
+    def version(self, key: str) -> Optional[str]:
+        """`last_modified` of the cached table, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.version if entry else None
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one table from the cache, or every table if no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the current number of cached tables."""
+        with self._lock:
+            return {**self._counters, "size": len(self._entries)}
+
+    def _claim(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry.value, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _resolve(self, key: str, future: Future, loader):
+        try:
+            value = self._load(key, loader)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _load(self, key: str, loader):
+        value = loader()
+        with self._lock:
+            self._counters["misses"] += 1
+            self._entries[key] = _Entry(
+                value=value,
+                version=_last_modified(value),
+                expires_at=self._clock() + self.ttl_seconds,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        return value
+
+
+_caches: dict[str, TableMetadataCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_table_metadata_cache(name: str = "default") -> TableMetadataCache:
+    """
+    Process-wide cache shared by every client of the same flavour.
+
+    Args:
+        name: Cache namespace, one per `SchemaInfo` model type.
+
+    Returns:
+        The cache registered under the name, created on first use.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = TableMetadataCache(
+                max_entries=int(os.getenv("TABLE_METADATA_CACHE_SIZE", "1024")),
+                ttl_seconds=float(os.getenv("TABLE_METADATA_CACHE_TTL_SECONDS", "3600")),
+            )
+        return _caches[name]
@@ -0,0 +1,44 @@
+from pydantic import BaseModel, Field
+
+# Structured LLM outputs shared by the LangGraph and CrewAI workflows
+
+
+class Antipattern(BaseModel):
+    """Represents a single identified SQL antipattern."""
+
+    code: str
+    name: str
+    description: str
+    impact: str
+    location: str
+    suggestion: str
+
+
+class ProposedImprovement(BaseModel):
+    """A single proposed improvement to the original query."""
+
+    improved_sql: str
+    rationale: str
+
+
+class QuerySuggestions(BaseModel):
+    """
+    Contains the original SQL plus multiple ProposedImprovements.
+    Each improvement is a candidate new query plus rationale.
+    """
+
+    original_sql: str
+    improvements: list[ProposedImprovement]
+
+
+class FusedAnalysis(BaseModel):
+    """
+    Antipatterns, improvement suggestions and the optimized query, returned together by one
+    structured LLM call.
+    """
+
+    antipatterns: list[Antipattern]
+    suggestions: QuerySuggestions
+    optimized_sql: str = Field(
+        description="The best optimized query, the original query if it can't be improved"
+    )
@@ -0,0 +1,128 @@
+# Slowest worker computing this many times longer than the average one means skewed keys
+SKEW_RATIO = 3.0
+# Average share of the time workers spend waiting to be scheduled
+WAIT_RATIO = 0.5
+# Share of the query's slot time above which a stage is reported even without other issues
+DOMINANT_SHARE = 0.25
+MAX_BOTTLENECKS = 3
+
+
+def summarize_stage(entry) -> dict:
+    """
+    Args:
+        entry: `google.cloud.bigquery.job.QueryPlanEntry` of a finished job.
+
+    Returns:
+        The stage's name, sizes, worker time ratios, shuffle stats and step kinds.
+    """
+    return {
+        "id": entry.entry_id,
+        "name": entry.name,
+        "records_read": entry.records_read or 0,
+        "records_written": entry.records_written or 0,
+        "slot_ms": entry.slot_ms or 0,
+        "parallel_inputs": entry.parallel_inputs or 0,
+        "wait_ratio_avg": entry.wait_ratio_avg or 0.0,
+        "wait_ratio_max": entry.wait_ratio_max or 0.0,
+        "compute_ratio_avg": entry.compute_ratio_avg or 0.0,
+        "compute_ratio_max": entry.compute_ratio_max or 0.0,
+        "shuffle_output_bytes": entry.shuffle_output_bytes or 0,
+        "shuffle_output_bytes_spilled": entry.shuffle_output_bytes_spilled or 0,
+        "steps": [step.kind for step in entry.steps],
+    }
+
+
+def plan_statistics(job) -> dict:
+    """
+    Query plan derived stats of a finished BigQuery job.
+
+    Args:
+        job: Finished query job.
+
+    Returns:
+        Total shuffle and spilled bytes, the per-stage plan and its bottleneck summary.
+    """
+    stages = [summarize_stage(entry) for entry in job.query_plan or []]
+    return {
+        "shuffle_output_bytes": sum(s["shuffle_output_bytes"] for s in stages),
+        "shuffle_output_bytes_spilled": sum(s["shuffle_output_bytes_spilled"] for s in stages),
+        "query_plan": stages,
+        "plan_summary": plan_summary(stages),
+    }
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _stage_issues(stage: dict) -> list[str]:
+    issues = []
+    is_join = "JOIN" in stage["steps"] or "join" in stage["name"].lower()
+    if (
+        stage["parallel_inputs"] > 1
+        and stage["compute_ratio_avg"] > 0
+        and stage["compute_ratio_max"] / stage["compute_ratio_avg"] >= SKEW_RATIO
+    ):
+        ratio = stage["compute_ratio_max"] / stage["compute_ratio_avg"]
+        kind = "join" if is_join else "stage"
+        issues.append(f"skewed {kind}, the slowest worker computes {ratio:.1f}x the average")
+    if stage["shuffle_output_bytes_spilled"]:
+        spilled = _format_bytes(stage["shuffle_output_bytes_spilled"])
+        issues.append(f"spills {spilled} of shuffle output to disk")
+    if "repartition" in stage["name"].lower():
+        issues.append("repartitions its input")
+    if (
+        stage["wait_ratio_avg"] >= WAIT_RATIO
+        and stage["wait_ratio_avg"] > stage["compute_ratio_avg"]
+    ):
+        issues.append("workers mostly wait for slots")
+    return issues
+
+
+def find_bottlenecks(stages: list[dict], limit: int = MAX_BOTTLENECKS) -> list[dict]:
+    """
+    Pick the stages worth optimizing.
+
+    Args:
+        stages: Stages as returned by `summarize_stage`.
+        limit: Maximum number of stages returned.
+
+    Returns:
+        Stages with issues (skew, spills, repartitioning, slot waits) or a dominant share of
+        the slot time, most expensive first.
+    """
+    total_slot_ms = sum(stage["slot_ms"] for stage in stages) or 1
+    bottlenecks = []
+    for stage in stages:
+        share = stage["slot_ms"] / total_slot_ms
+        issues = _stage_issues(stage)
+        if issues or share >= DOMINANT_SHARE:
+            bottlenecks.append({"stage": stage, "slot_share": share, "issues": issues})
+    bottlenecks.sort(key=lambda b: b["slot_share"], reverse=True)
+    return bottlenecks[:limit]
+
+
+def plan_summary(stages: list[dict]) -> str:
+    """
+    Compact, prompt ready description of the bottleneck stages.
+
+    Args:
+        stages: Stages as returned by `summarize_stage`.
+
+    Returns:
+        One line per bottleneck stage, empty if the plan has none.
+    """
+    lines = []
+    for bottleneck in find_bottlenecks(stages):
+        stage = bottleneck["stage"]
+        line = (
+            f"{stage['name']}: {bottleneck['slot_share']:.0%} of slot time,"
+            f" {stage['records_read']:,} rows read, {stage['records_written']:,} written"
+        )
+        if bottleneck["issues"]:
+            line += "; " + "; ".join(bottleneck["issues"])
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,229 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import typing
+from typing import Any, Awaitable, Callable, Optional
+
+from src.common.sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+# Calls of the SQL clients which are recorded, everything else (e.g. scoring) runs as usual
+RECORDED_METHODS = frozenset(
+    {
+        "execute_sql_query",
+        "benchmark_sql_query",
+        "query_single_row",
+        "dry_run_sql_query",
+        "get_sql_query_stats",
+        "get_table_metadata",
+        "get_table_metadata_by_ref",
+        "get_table_versions",
+    }
+)
+
+
+class ReplayMissError(LookupError):
+    """A call has no recording to replay."""
+
+
+def get_replay_mode() -> str:
+    """
+    Record/replay mode of this deployment, read from the REPLAY_MODE environment variable.
+
+    Raises:
+        ValueError: If the variable isn't "off", "record" or "replay".
+    """
+    mode = os.getenv("REPLAY_MODE", OFF).lower()
+    if mode not in (OFF, RECORD, REPLAY):
+        raise ValueError(f"Unknown REPLAY_MODE {mode}, use one of off, record or replay")
+    return mode
+
+
+def _to_json(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return value
+
+
+class ReplayStore:
+    """
+    Recordings of LLM and BigQuery calls, keyed by the call's kind and arguments.
+
+    Identical calls are told apart by their order: the n-th call with the same key in this
+    process records into, and replays from, the n-th recording of that key. Replays wrap around
+    when a workflow makes more identical calls than were recorded, so the same recording can be
+    replayed over and over, e.g. by a benchmark.
+    """
+
+    def __init__(self, store: SqliteStore, mode: str, latency_scale: float = 0.0):
+        """
+        Args:
+            store: On-disk store of the recordings.
+            mode: "record" runs calls and stores their results, "replay" serves stored results.
+            latency_scale: Replayed calls sleep for their recorded duration times this factor,
+                0 replays instantly.
+        """
+        self.store = store
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._calls: dict[str, int] = {}
+
+    @staticmethod
+    def key(kind: str, payload: Any) -> str:
+        """Hex digest identifying a call."""
+        data = json.dumps([kind, payload], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _next_call(self, key: str) -> int:
+        with self._lock:
+            call = self._calls.get(key, 0)
+            self._calls[key] = call + 1
+        return call
+
+    def record(self, key: str, value: Any, seconds: float):
+        """Store the result of the next call with the key and how long it took."""
+        call = self._next_call(key)
+        with self._lock:
+            recordings = self.store.get(key) or []
+            entry = {"value": _to_json(value), "seconds": seconds}
+            if call < len(recordings):
+                recordings[call] = entry
+            else:
+                recordings.append(entry)
+            self.store.put(key, recordings)
+
+    def replay(self, key: str) -> tuple[Any, float]:
+        """
+        Args:
+            key: Call key.
+
+        Returns:
+            The recorded result of the next call with the key and the latency to simulate.
+
+        Raises:
+            ReplayMissError: If the call was never recorded.
+        """
+        recordings = self.store.get(key)
+        if not recordings:
+            raise ReplayMissError(f"No recording for call {key}, record it with REPLAY_MODE=record")
+        entry = recordings[self._next_call(key) % len(recordings)]
+        return entry["value"], entry["seconds"] * self.latency_scale
+
+    def call(self, kind: str, payload: Any, fn: Callable[[], Any]) -> Any:
+        """
+        Record or replay a blocking call.
+
+        Args:
+            kind: Type of the call, e.g. the method name.
+            payload: JSON serializable arguments identifying the call.
+            fn: Makes the actual call.
+
+        Returns:
+            The call's result, in replay mode as JSON (pydantic models are dumped).
+        """
+        key = self.key(kind, payload)
+        if self.mode == REPLAY:
+            value, delay = self.replay(key)
+            time.sleep(delay)
+            return value
+        start_time = time.monotonic()
+        value = fn()
+        self.record(key, value, time.monotonic() - start_time)
+        return value
+
+    async def acall(self, kind: str, payload: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Asyncio variant of `call`, `fn` returns the awaitable making the actual call."""
+        key = self.key(kind, payload)
+        if self.mode == REPLAY:
+            value, delay = await asyncio.to_thread(self.replay, key)
+            await asyncio.sleep(delay)
+            return value
+        start_time = time.monotonic()
+        value = await fn()
+        await asyncio.to_thread(self.record, key, value, time.monotonic() - start_time)
+        return value
+
+
+class ReplayClient:
+    """
+    Wraps a SQL client (`BigQueryClient` or `DuckDBClient` of either app) so the calls in
+    `RECORDED_METHODS` are recorded or replayed, replayed pydantic models are rebuilt from the
+    method's return annotation.
+    """
+
+    def __init__(self, client, store: ReplayStore):
+        """
+        Args:
+            client: Wrapped client, its other attributes are passed through.
+            store: Recordings.
+        """
+        self._client = client
+        self._store = store
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name not in RECORDED_METHODS:
+            return attr
+        model = typing.get_type_hints(attr).get("return")
+        store = self._store
+
+        def restore(value):
+            if store.mode == REPLAY and hasattr(model, "model_validate"):
+                return model.model_validate(value)
+            return value
+
+        if inspect.iscoroutinefunction(attr):
+
+            @functools.wraps(attr)
+            async def recorded_async(*args, **kwargs):
+                return restore(
+                    await store.acall(name, [args, kwargs], lambda: attr(*args, **kwargs))
+                )
+
+            return recorded_async
+
+        @functools.wraps(attr)
+        def recorded(*args, **kwargs):
+            return restore(store.call(name, [args, kwargs], lambda: attr(*args, **kwargs)))
+
+        return recorded
+
+
+_replay_store: Optional[ReplayStore] = None
+
+
+def get_replay_store() -> Optional[ReplayStore]:
+    """Process-wide recordings, None unless REPLAY_MODE is "record" or "replay"."""
+    global _replay_store
+    mode = get_replay_mode()
+    if mode == OFF:
+        return None
+    if _replay_store is None:
+        _replay_store = ReplayStore(
+            SqliteStore(
+                os.getenv("REPLAY_STORE", ".cache/replay.sqlite"),
+                max_entries=int(os.getenv("REPLAY_MAX_ENTRIES", "100000")),
+            ),
+            mode,
+            latency_scale=float(os.getenv("REPLAY_LATENCY_SCALE", "0")),
+        )
+        logger.info(f"REPLAY_MODE={mode}, recordings in {_replay_store.store.path}")
+    return _replay_store
+
+
+def replay_client(client):
+    """The client wrapped in a `ReplayClient` if record/replay is enabled, else the client."""
+    store = get_replay_store()
+    return ReplayClient(client, store) if store is not None else client
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Optional
+
+from src.common.sql_parser import DIALECT, SqlParseError, parse_sql
+from src.common.sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r"--[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a query, insensitive to comments, whitespace and keyword case.
+
+    Args:
+        sql: BigQuery SQL.
+
+    Returns:
+        The query regenerated from its syntax tree, or (if it can't be parsed) the query with
+        comments removed and whitespace collapsed.
+    """
+    try:
+        return ";\n".join(s.sql(dialect=DIALECT, comments=False) for s in parse_sql(sql))
+    except SqlParseError:
+        return " ".join(_COMMENT_RE.sub(" ", sql).split()).rstrip(";")
+
+
+def sql_fingerprint(sql: str, table_versions: dict[str, Optional[str]], workflow: str) -> str:
+    """
+    Result cache key of a query.
+
+    Args:
+        sql: BigQuery SQL.
+        table_versions: `last_modified` of every table the query references, so the key
+            changes as soon as one of them is modified.
+        workflow: Name of the workflow producing the result.
+
+    Returns:
+        Hex digest identifying the query, the referenced table versions and the workflow.
+    """
+    payload = json.dumps(
+        {
+            "workflow": workflow,
+            "sql": normalize_sql(sql),
+            "tables": sorted(table_versions.items()),
+        }
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_result_cache: Optional[SqliteStore] = None
+
+
+def get_result_cache() -> Optional[SqliteStore]:
+    """Process-wide store of final workflow results, None if result caching is disabled."""
+    global _result_cache
+    if os.getenv("RESULT_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _result_cache is None:
+        ttl = os.getenv("RESULT_CACHE_TTL_SECONDS")
+        _result_cache = SqliteStore(
+            os.getenv("RESULT_CACHE_PATH", ".cache/results.sqlite"),
+            max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000")),
+            ttl_seconds=float(ttl) if ttl else None,
+        )
+    return _result_cache
@@ -0,0 +1,150 @@
+import logging
+import os
+from typing import Any, Optional
+
+from sqlglot import exp
+
+from src.common.sql_parser import SqlParseError, parse_sql
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token of schema text, good enough to keep prompts within a budget
+CHARS_PER_TOKEN = 4
+
+
+def get_token_budget() -> int:
+    """Token budget of the schema context of a prompt, 0 for no limit."""
+    return int(os.getenv("SCHEMA_CONTEXT_MAX_TOKENS", "1000"))
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def partition_column(table) -> Optional[str]:
+    """
+    Args:
+        table: `google.cloud.bigquery.Table`.
+
+    Returns:
+        The column the table is partitioned by, "_PARTITIONTIME" for ingestion-time partitioning,
+        None if it isn't partitioned.
+    """
+    if table.time_partitioning is not None:
+        return table.time_partitioning.field or "_PARTITIONTIME"
+    if table.range_partitioning is not None:
+        return table.range_partitioning.field
+    return None
+
+
+def _field(info: Any, name: str, default=None):
+    # SchemaInfo is a TypedDict in the LangGraph app and a pydantic model in the CrewAI app
+    if isinstance(info, dict):
+        return info.get(name, default)
+    return getattr(info, name, default)
+
+
+def _table_id(info: Any) -> str:
+    parts = [_field(info, "gcp_project_name"), _field(info, "dataset_name")]
+    return ".".join([*filter(None, parts), _field(info, "table_name")])
+
+
+def referenced_names(sql: str) -> Optional[set[str]]:
+    """
+    Args:
+        sql: BigQuery SQL.
+
+    Returns:
+        The lower-cased identifiers of the query, a superset of the columns it references, or
+        None if it selects `*` or can't be parsed, so it may need any column.
+    """
+    try:
+        statements = parse_sql(sql)
+    except SqlParseError as e:
+        logger.debug(f"Schema context without column pruning: {e}")
+        return None
+    names = set()
+    for statement in statements:
+        for star in statement.find_all(exp.Star):
+            if star.find_ancestor(exp.AggFunc) is None:  # COUNT(*) needs no columns
+                return None
+        # struct fields are parsed as column or table parts, so every identifier is collected
+        names.update(identifier.name.lower() for identifier in statement.find_all(exp.Identifier))
+    return names
+
+
+def _table_header(info: Any) -> str:
+    details = [f"{_field(info, 'row_count')} rows", f"{_field(info, 'size_bytes')} bytes"]
+    if _field(info, "partition_column"):
+        details.append(f"partitioned by {_field(info, 'partition_column')}")
+    if _field(info, "clustering_columns"):
+        details.append(f"clustered by {', '.join(_field(info, 'clustering_columns'))}")
+    return f"{_table_id(info)}: {', '.join(details)}"
+
+
+def _table_columns(info: Any, names: Optional[set[str]]) -> tuple[list[str], int]:
+    """Columns of the table in prompt order, partition and cluster keys first, and the count of
+    columns the query doesn't reference."""
+    keys = [_field(info, "partition_column"), *(_field(info, "clustering_columns") or [])]
+    keys = [key.lower() for key in keys if key]
+    wanted = None if names is None else names.union(keys)
+    columns = _field(info, "columns") or []
+    selected = [
+        column
+        for column in columns
+        if wanted is None or _field(column, "column_name").lower() in wanted
+    ]
+    selected.sort(key=lambda column: _field(column, "column_name").lower() not in keys)
+    rendered = [f"{_field(c, 'column_name')} {_field(c, 'column_type')}" for c in selected]
+    return rendered, len(columns) - len(selected)
+
+
+def build_schema_context(
+    sql: str, schema_info: Optional[list[Any]], max_tokens: Optional[int] = None
+) -> str:
+    """
+    Describe the tables of a query for an LLM prompt, compactly and within a token budget.
+
+    Every table gets a line with its size and partition and cluster keys, followed by its
+    columns as "name TYPE" pairs: only the columns the query references, besides the partition
+    and cluster keys, so wide tables don't inflate the prompt. Columns beyond the budget are
+    left out and counted.
+
+    Args:
+        sql: Query the tables are used by.
+        schema_info: `SchemaInfo` of the tables, of either app.
+        max_tokens: Token budget, by default SCHEMA_CONTEXT_MAX_TOKENS, 0 for no limit.
+
+    Returns:
+        The schema context, empty without tables.
+    """
+    if not schema_info:
+        return ""
+    max_tokens = get_token_budget() if max_tokens is None else max_tokens
+    names = referenced_names(sql)
+    lines = ["The query uses the following tables, with the columns it references:"]
+    tables = []
+    for info in schema_info:
+        lines.append(_table_header(info))
+        tables.append(_table_columns(info, names))
+    # the budget left after the headers is shared equally by the tables
+    budget = max_tokens - estimate_tokens("\n".join(lines)) if max_tokens else None
+    per_table = budget // len(tables) if budget is not None else None
+
+    context = [lines[0]]
+    for header, (columns, omitted) in zip(lines[1:], tables, strict=True):
+        included = []
+        used = 0
+        for column in columns:
+            tokens = estimate_tokens(column) + 1
+            if per_table is not None and used + tokens > per_table:
+                break
+            included.append(column)
+            used += tokens
+        omitted += len(columns) - len(included)
+        context.append(header)
+        if included:
+            context.append(f"  {', '.join(included)}")
+        if omitted:
+            context.append(f"  ({omitted} more columns not shown)")
+    return "\n".join(context)
@@ -0,0 +1,145 @@
+import json
+import math
+import os
+from typing import Optional
+
+# Metrics compared with the original query and their default weights
+DEFAULT_WEIGHTS = {
+    "total_bytes_billed": 0.4,
+    "slot_millis": 0.3,
+    "execution_time_seconds": 0.3,
+}
+# Metrics a dry run doesn't measure
+TIMING_METRICS = frozenset({"slot_millis", "execution_time_seconds"})
+# Added to both sides of a ratio, so free or instant queries don't divide by zero
+_FLOORS = {
+    "total_bytes_billed": 1.0,
+    "slot_millis": 1.0,
+    "execution_time_seconds": 0.001,
+}
+# Objectives of the Pareto front, both minimized
+PARETO_METRICS = ("total_bytes_billed", "execution_time_seconds")
+
+
+def get_scoring_weights() -> dict[str, float]:
+    """
+    Metric weights of this deployment, read from the SCORING_WEIGHTS environment variable
+    (a JSON object) and normalized to sum up to 1.
+
+    Raises:
+        ValueError: If the variable names an unknown metric or no positive weight.
+    """
+    weights = json.loads(os.getenv("SCORING_WEIGHTS") or "null") or DEFAULT_WEIGHTS
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown scoring metrics: {sorted(unknown)}")
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Scoring weights must contain a positive weight")
+    return {metric: weight / total for metric, weight in weights.items()}
+
+
+def _value(results: dict, metric: str) -> Optional[float]:
+    if results.get("dry_run") and metric in TIMING_METRICS:
+        return None
+    if metric == "execution_time_seconds" and results.get("server_time_seconds") is not None:
+        # the job's own run time, the wall-clock time adds client and network latency
+        return results["server_time_seconds"]
+    return results.get(metric)
+
+
+def _is_rejected(results: dict) -> bool:
+    equivalence = results.get("equivalence") or {}
+    return bool(results.get("error")) or equivalence.get("status") == "different"
+
+
+def score_candidates(
+    baseline: dict, candidates: list[dict], weights: Optional[dict[str, float]] = None
+) -> dict:
+    """
+    Score query results relative to the original query.
+
+    A score is the weighted geometric mean of the improvement ratios (original / candidate)
+    of the weighted metrics: the original scores 1.0, a candidate which halves every metric
+    scores 2.0 and one which doubles them scores 0.5. Metrics one of the two results doesn't
+    have (e.g. timings of dry runs) are left out. Latency is the server-side time of the job
+    where the results have it, the wall-clock `execution_time_seconds` otherwise. Failed
+    candidates and candidates returning different rows than the original score 0.
+
+    Args:
+        baseline: Metadata dict of the original query.
+        candidates: Metadata dicts of the candidates.
+        weights: Metric weights, defaults to `get_scoring_weights()`.
+
+    Returns:
+        The `scores` and `ratios` of every candidate, the candidate indexes `ranking` from
+        best to worst and the `pareto_front` indexes of candidates no other candidate beats
+        on both bytes billed and latency.
+    """
+    weights = weights or get_scoring_weights()
+    scores, ratios = [], []
+    for candidate in candidates:
+        candidate_ratios = {}
+        for metric in weights:
+            base, value = _value(baseline, metric), _value(candidate, metric)
+            if base is not None and value is not None:
+                floor = _FLOORS[metric]
+                candidate_ratios[metric] = (base + floor) / (value + floor)
+        ratios.append(candidate_ratios)
+
+        total_weight = sum(weights[metric] for metric in candidate_ratios)
+        if _is_rejected(candidate) or baseline.get("error"):
+            scores.append(0.0)
+        elif not total_weight:
+            scores.append(1.0)
+        else:
+            log_score = sum(weights[m] * math.log(r) for m, r in candidate_ratios.items())
+            scores.append(math.exp(log_score / total_weight))
+
+    ranking = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    return {
+        "scores": scores,
+        "ratios": ratios,
+        "ranking": ranking,
+        "pareto_front": pareto_front(candidates),
+    }
+
+
+def pareto_front(candidates: list[dict]) -> list[int]:
+    """
+    Args:
+        candidates: Metadata dicts of the candidates.
+
+    Returns:
+        Indexes of the successful, equivalent candidates which aren't dominated on bytes
+        billed and latency by another candidate.
+    """
+    points = {
+        i: tuple(_value(candidate, metric) or 0 for metric in PARETO_METRICS)
+        for i, candidate in enumerate(candidates)
+        if not _is_rejected(candidate)
+    }
+    return [
+        i
+        for i, point in points.items()
+        if not any(
+            other != point and all(o <= p for o, p in zip(other, point, strict=True))
+            for other in points.values()
+        )
+    ]
+
+
+def evaluate_query(
+    results: dict, baseline: Optional[dict] = None, weights: Optional[dict[str, float]] = None
+) -> dict:
+    """
+    Args:
+        results: Metadata dict of the evaluated query.
+        baseline: Metadata dict of the original query, None if `results` is the original.
+        weights: Metric weights, defaults to `get_scoring_weights()`.
+
+    Returns:
+        The relative `score` (1.0 for the original, higher is better) and the metadata.
+    """
+    scored = score_candidates(baseline or results, [results], weights)
+    return {"score": scored["scores"][0], "ratios": scored["ratios"][0], "metadata": results}
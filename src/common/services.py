@@ -0,0 +1,119 @@
+import functools
+import json
+import os
+import threading
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def shared(factory: Callable[..., T]) -> Callable[..., T]:
+    """
+    Decorator turning a factory into the getter of a process-wide service: the service is
+    created on first use, once per arguments, and shared by every workflow using it.
+
+    Creation holds the factory's lock, so concurrent first uses (e.g. crews kicked off in
+    threads) don't create a service twice.
+    """
+    services: dict[tuple, T] = {}
+    lock = threading.Lock()
+
+    @functools.wraps(factory)
+    def get(*args, **kwargs) -> T:
+        key = (args, tuple(sorted(kwargs.items())))
+        with lock:
+            if key not in services:
+                services[key] = factory(*args, **kwargs)
+            return services[key]
+
+    get.cache_clear = services.clear
+    return get
+
+
+@shared
+def get_credentials():
+    """
+    Vertex AI initialized once per process, see `setup_aiplatform`. Skipped with
+    REPLAY_MODE=replay, which calls neither Gemini nor BigQuery.
+    """
+    from src.common.replay import REPLAY, get_replay_mode
+
+    if get_replay_mode() == REPLAY:
+        return None
+
+    from src.common.env_setup import setup_aiplatform
+
+    return setup_aiplatform()
+
+
+@shared
+def get_langfuse_callback():
+    from src.common.env_setup import setup_langfuse_callback
+
+    return setup_langfuse_callback()
+
+
+@shared
+def get_lgraph_llm():
+    """LangChain Gemini model of the LangGraph workflows, traced by Langfuse."""
+    from src.common.env_setup import create_llm
+
+    get_credentials()
+    return create_llm(callbacks=[get_langfuse_callback()])
+
+
+@shared
+def get_lgraph_bq_client():
+    """Async BigQuery client of the LangGraph workflows."""
+    from src.common.env_setup import GCP_PROJECT
+    from src.lgraph.bq_client import create_bq_client
+
+    return create_bq_client(project_id=GCP_PROJECT, credentials=get_credentials())
+
+
+def _vertex_credentials() -> Optional[dict]:
+    credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not credentials:
+        return None  # workload identity or application default credentials
+    # `setup_aiplatform` replaces the JSON of authorized user credentials by the file it wrote
+    if os.path.isfile(credentials):
+        with open(credentials) as file:
+            return json.load(file)
+    return json.loads(credentials)
+
+
+@shared
+def get_crewai_llm(temperature: float, response_format: Optional[Any] = None):
+    """
+    Args:
+        temperature: Sampling temperature.
+        response_format: Pydantic model the completions have to be JSON of.
+
+    Returns:
+        The Gemini `crewai.LLM` of the CrewAI flow and crews with these settings.
+    """
+    from src.crewai.llm import create_llm
+
+    get_credentials()
+    kwargs = {"response_format": response_format} if response_format is not None else {}
+    credentials = _vertex_credentials()
+    if credentials is not None:
+        kwargs["vertex_credentials"] = credentials
+    return create_llm(model="gemini/gemini-2.0-flash", temperature=temperature, **kwargs)
+
+
+@shared
+def get_crewai_bq_client():
+    """BigQuery client of the CrewAI flow and crews."""
+    from src.common.env_setup import GCP_PROJECT
+    from src.crewai.bq_client import create_bq_client
+
+    return create_bq_client(project_id=GCP_PROJECT, credentials=get_credentials())
+
+
+@shared
+def init_weave():
+    """Weave tracing of the CrewAI app."""
+    import weave
+
+    return weave.init(project_name="sql-optimizer-crew")
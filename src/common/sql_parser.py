@@ -0,0 +1,116 @@
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+logger = logging.getLogger(__name__)
+
+DIALECT = "bigquery"
+
+
+class SqlParseError(ValueError):
+    """The query can not be analyzed locally and has to be handled by the LLM."""
+
+
+@dataclass
+class TableReferences:
+    """Tables referenced by a query."""
+
+    tables: list[str] = field(default_factory=list)  # fully-qualified 'project.dataset.table'
+    ctes: list[str] = field(default_factory=list)
+    aliases: dict[str, str] = field(default_factory=dict)  # alias -> fully-qualified table
+
+
+@lru_cache(maxsize=256)
+def parse_sql(sql: str) -> tuple[exp.Expression, ...]:
+    """
+    Parse a BigQuery SQL script into one expression per statement.
+
+    The result is cached, so callers must not modify the returned trees (`.copy()` first).
+
+    Args:
+        sql: BigQuery SQL, one or more statements.
+
+    Returns:
+        The parsed statements.
+
+    Raises:
+        SqlParseError: If the SQL is not a query or DML statement sqlglot understands.
+    """
+    try:
+        statements = tuple(s for s in sqlglot.parse(sql, read=DIALECT) if s is not None)
+    except SqlglotError as e:
+        raise SqlParseError(f"Unable to parse SQL: {e}") from e
+    if not statements:
+        raise SqlParseError("No SQL statement found.")
+    for statement in statements:
+        # sqlglot happily parses garbage like "selec * frm" as an arithmetic expression
+        if not isinstance(statement, (exp.Query, exp.DML)):
+            raise SqlParseError(f"Unsupported statement: {statement.key}")
+    return statements
+
+
+def cte_names(statement: exp.Expression) -> set[str]:
+    """
+    Names of the CTEs a statement defines, lower-cased: BigQuery resolves CTE names
+    case-insensitively, e.g. `WITH Recent AS (...) SELECT a FROM recent`.
+    """
+    return {cte.alias.lower() for cte in statement.find_all(exp.CTE) if cte.alias}
+
+
+def is_cte_reference(table: exp.Table, ctes: set[str]) -> bool:
+    """Whether a table reference names one of the `cte_names` rather than a table."""
+    return not table.db and table.name.lower() in ctes
+
+
+def extract_tables(
+    sql: str, default_project: Optional[str] = None, default_dataset: Optional[str] = None
+) -> TableReferences:
+    """
+    Find all tables a query reads from or writes to.
+
+    Args:
+        sql: BigQuery SQL to analyze.
+        default_project: Project used for table references without one.
+        default_dataset: Dataset used for table references without one.
+
+    Returns:
+        Fully-qualified table references, CTE names and table aliases.
+
+    Raises:
+        SqlParseError: If the SQL can't be parsed or a table can't be fully qualified.
+    """
+    result = TableReferences()
+    statements = parse_sql(sql)
+    ctes = set()
+    for statement in statements:
+        for cte in statement.find_all(exp.CTE):
+            if cte.alias and cte.alias.lower() not in ctes:
+                ctes.add(cte.alias.lower())
+                result.ctes.append(cte.alias)
+
+    for statement in statements:
+        for table in statement.find_all(exp.Table, bfs=False):
+            if not isinstance(table.this, exp.Identifier):
+                continue  # table valued functions
+            if is_cte_reference(table, ctes):
+                continue
+            if "INFORMATION_SCHEMA" in table.name.upper() or "*" in table.name:
+                # neither metadata views nor wildcard tables can be described with get_table
+                logger.debug(f"Skipping table reference {table.sql(dialect=DIALECT)}")
+                continue
+
+            dataset = table.db or default_dataset
+            project = table.catalog or default_project
+            if not dataset or not project:
+                raise SqlParseError(f"Unable to fully qualify table '{table.name}'.")
+            table_id = f"{project}.{dataset}.{table.name}"
+            if table_id not in result.tables:
+                result.tables.append(table_id)
+            if table.alias:
+                result.aliases[table.alias] = table_id
+    return result
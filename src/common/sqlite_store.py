@@ -0,0 +1,93 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Optional
+
+
+class SqliteStore:
+    """
+    Persistent key-value store backed by a single SQLite file.
+
+    Values are stored as zlib-compressed JSON. The store keeps at most `max_entries` keys,
+    evicting the least recently read ones, and optionally expires entries after a TTL.
+    It is safe to share between threads and between processes using the same file.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000, ttl_seconds: Optional[float] = None):
+        """
+        Args:
+            path: Location of the SQLite file, parent directories are created.
+            max_entries: Number of entries kept before the least recently used are evicted.
+            ttl_seconds: Age after which an entry is ignored and deleted, None for no expiry.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Args:
+            key: Entry key.
+
+        Returns:
+            The stored value, or None if the key is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, value: Any):
+        """
+        Args:
+            key: Entry key.
+            value: JSON serializable value.
+        """
+        now = time.time()
+        blob = zlib.compress(json.dumps(value, default=str).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, blob, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                " SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
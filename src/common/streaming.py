@@ -0,0 +1,58 @@
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """
+    Args:
+        data: JSON serializable event payload.
+        event: Event type, the client's default "message" type if None.
+
+    Returns:
+        The event in the server-sent events wire format.
+    """
+    message = f"data: {json.dumps(data, default=str)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+
+async def stream_graph_updates(
+    chain,
+    inputs: dict,
+    config: Optional[dict] = None,
+    on_complete: Optional[Callable[[dict], Awaitable[None]]] = None,
+) -> AsyncIterator[str]:
+    """
+    Run a compiled LangGraph graph and stream its progress as server-sent events.
+
+    Every node's state update is sent as an "update" event (with the `node` name) as soon as
+    the node completes, followed by the final state as a "result" event, or an "error" event
+    if the run fails.
+
+    Args:
+        chain: Compiled graph.
+        inputs: Initial state.
+        config: Run config.
+        on_complete: Called with the final state of a successful run.
+
+    Returns:
+        The server-sent events.
+    """
+    state = inputs
+    try:
+        async for mode, chunk in chain.astream(
+            inputs, config=config, stream_mode=["updates", "values"]
+        ):
+            if mode == "values":
+                state = chunk
+                continue
+            for node, update in chunk.items():
+                yield format_sse({"node": node, "update": update}, event="update")
+        if on_complete is not None and "error" not in state:
+            await on_complete(state)
+        yield format_sse(state, event="result")
+    except Exception as e:
+        logger.exception(e)
+        yield format_sse({"error": f"{e}"}, event="error")
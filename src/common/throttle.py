@@ -0,0 +1,347 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Exception class names of quota and overload errors: google.api_core, LiteLLM and OpenAI
+OVERLOAD_ERRORS = {"TooManyRequests", "ResourceExhausted", "RateLimitError", "ServiceUnavailable"}
+# Messages of the same errors wrapped by other exceptions, and of BigQuery's 403 rate limit errors
+OVERLOAD_MESSAGES = (
+    "rate limit",
+    "ratelimitexceeded",
+    "quota",
+    "resource exhausted",
+    "resource_exhausted",
+    "too many concurrent",
+)
+
+# names of the throttles the current call already went through, so nested calls don't wait twice
+_active: contextvars.ContextVar[frozenset[str]] = contextvars.ContextVar(
+    "throttles", default=frozenset()
+)
+
+
+def _reset_active(token: contextvars.Token):
+    try:
+        _active.reset(token)
+    except ValueError:  # a stream consumed in another context than it was started in
+        pass
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Whether the error means a quota or the service's capacity was exceeded."""
+    if any(cls.__name__ in OVERLOAD_ERRORS for cls in type(error).__mro__):
+        return True
+    message = str(error).lower()
+    return any(text in message for text in OVERLOAD_MESSAGES)
+
+
+class TokenBucket:
+    """
+    Token bucket spacing requests out to a rate, with bursts of up to `capacity` requests.
+
+    Tokens are reserved ahead, so the callers waiting for tokens are served in order of arrival
+    rather than racing for every refilled token.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        """
+        Args:
+            rate_per_second: Tokens refilled per second.
+            capacity: Maximum tokens, the largest burst.
+        """
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Take a token.
+
+        Returns:
+            Seconds to wait until the token is available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate_per_second)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit adapting to overload with additive increase, multiplicative decrease.
+
+    Every successful request raises the limit by `increase / limit`, so by `increase` per
+    window of `limit` requests, while an overload error multiplies it by `decrease`. Only one
+    decrease happens per window: the errors of requests started before the last decrease
+    answer a load which was already reduced. The limit so settles just under the capacity
+    instead of swinging between overload and idle.
+    """
+
+    def __init__(
+        self, max_limit: int, min_limit: int = 1, increase: float = 1.0, decrease: float = 0.5
+    ):
+        """
+        Args:
+            max_limit: Initial and highest limit.
+            min_limit: Lowest limit.
+            increase: Limit increase per window of successful requests.
+            decrease: Factor applied to the limit on overload.
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < max(self.min_limit, int(self.limit)):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> float:
+        """
+        Wait for a free slot.
+
+        Returns:
+            The monotonic start time of the request, to pass to `release`.
+        """
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+        return time.monotonic()
+
+    async def aacquire(self) -> float:
+        """Wait for a free slot without blocking the event loop, see `acquire`."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return time.monotonic()
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, started: float, overloaded: Optional[bool]):
+        """
+        Free a slot and adapt the limit.
+
+        Args:
+            started: Start time returned by `acquire`.
+            overloaded: Whether the request failed with an overload error, None if it failed
+                otherwise, which doesn't change the limit.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded is False:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            elif overloaded and started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_decrease = time.monotonic()
+                logger.info(f"Overloaded, concurrency limit lowered to {self.limit:.1f}")
+            self._condition.notify_all()
+            waiters, self._waiters = self._waiters, []
+        # the woken waiters compete for the slot again, the others wait for the next release
+        for loop, waiter in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():  # cancelled meanwhile
+        waiter.set_result(None)
+
+
+class Throttle:
+    """
+    Throttles the calls to a rate limited service, from threads and asyncio code alike.
+
+    A call waits for a token of the request rate quota (if any) and for a slot of the adaptive
+    concurrency limit. A call failing with an overload error (429, quota exceeded, service
+    unavailable) lowers the limit and is retried after an exponential backoff with full jitter,
+    so the retries of concurrent calls don't hit the service at the same time again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limiter: AIMDLimiter,
+        bucket: Optional[TokenBucket] = None,
+        max_retries: int = 4,
+        retry_base_seconds: float = 1.0,
+        retry_max_seconds: float = 30.0,
+    ):
+        """
+        Args:
+            name: Name of the service, for logging.
+            limiter: Concurrency limit.
+            bucket: Request rate quota, None for no rate limit.
+            max_retries: Retries of a call failing with overload errors.
+            retry_base_seconds: Backoff cap of the first retry, doubled by every retry.
+            retry_max_seconds: Highest backoff cap.
+        """
+        self.name = name
+        self.limiter = limiter
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before the retry `attempt` (from 0)."""
+        cap = min(self.retry_max_seconds, self.retry_base_seconds * 2**attempt)
+        return random.uniform(0, cap)
+
+    def _retry(self, attempt: int, error: Exception) -> Optional[float]:
+        if attempt >= self.max_retries or not is_overload_error(error):
+            return None
+        delay = self.backoff(attempt)
+        logger.warning(f"{self.name} overloaded, retrying in {delay:.1f}s: {error}")
+        return delay
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Context of one request, waiting for a token and a concurrency slot."""
+        if self.name in _active.get():
+            yield
+            return
+        if self.bucket is not None:
+            time.sleep(self.bucket.reserve())
+        started = self.limiter.acquire()
+        token = _active.set(_active.get() | {self.name})
+        overloaded = None
+        try:
+            yield
+            overloaded = False
+        except Exception as e:
+            overloaded = True if is_overload_error(e) else None
+            raise
+        finally:
+            _reset_active(token)
+            self.limiter.release(started, overloaded)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self):
+        """Context of one request in asyncio code, see `slot`."""
+        if self.name in _active.get():
+            yield
+            return
+        if self.bucket is not None:
+            await asyncio.sleep(self.bucket.reserve())
+        started = await self.limiter.aacquire()
+        token = _active.set(_active.get() | {self.name})
+        overloaded = None
+        try:
+            yield
+            overloaded = False
+        except Exception as e:
+            overloaded = True if is_overload_error(e) else None
+            raise
+        finally:
+            _reset_active(token)
+            self.limiter.release(started, overloaded)
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call `fn` throttled, retrying it on overload errors."""
+        attempt = 0
+        while True:
+            try:
+                with self.slot():
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry(attempt, e)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Await `fn` throttled, retrying it on overload errors."""
+        attempt = 0
+        while True:
+            try:
+                async with self.aslot():
+                    return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry(attempt, e)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def create_throttle(
+    name: str, requests_per_minute: float, max_concurrency: int, **kwargs: Any
+) -> Throttle:
+    """
+    Args:
+        name: Name of the service.
+        requests_per_minute: Request rate quota, 0 for no rate limit. Bursts of up to one
+            second of the quota are allowed.
+        max_concurrency: Highest concurrency limit.
+        **kwargs: Retry arguments of `Throttle`.
+
+    Returns:
+        The throttle.
+    """
+    bucket = None
+    if requests_per_minute > 0:
+        rate = requests_per_minute / 60
+        bucket = TokenBucket(rate, capacity=max(1.0, rate))
+    return Throttle(name, AIMDLimiter(max_limit=max_concurrency), bucket, **kwargs)
+
+
+LLM_THROTTLE = "llm"
+BIGQUERY_THROTTLE = "bigquery"
+
+_throttles: dict[str, Throttle] = {}
+_throttles_lock = threading.Lock()
+
+
+def get_throttle(name: str) -> Throttle:
+    """
+    Process-wide throttle of a service, shared by all workflows:
+
+    - `LLM_THROTTLE`: every Gemini call, sized by LLM_REQUESTS_PER_MINUTE and LLM_MAX_CONCURRENCY.
+    - `BIGQUERY_THROTTLE`: every BigQuery query job, sized by BQ_JOBS_PER_MINUTE and
+      BQ_MAX_CONCURRENT_JOBS.
+
+    Both retry overload errors THROTTLE_MAX_RETRIES times, waiting up to
+    THROTTLE_RETRY_BASE_SECONDS (doubled per retry, at most THROTTLE_RETRY_MAX_SECONDS).
+    """
+    with _throttles_lock:
+        if name not in _throttles:
+            if name == LLM_THROTTLE:
+                rpm, concurrency = "LLM_REQUESTS_PER_MINUTE", "LLM_MAX_CONCURRENCY"
+            elif name == BIGQUERY_THROTTLE:
+                rpm, concurrency = "BQ_JOBS_PER_MINUTE", "BQ_MAX_CONCURRENT_JOBS"
+            else:
+                raise ValueError(f"Unknown throttle {name}")
+            _throttles[name] = create_throttle(
+                name,
+                requests_per_minute=float(os.getenv(rpm, "0")),
+                max_concurrency=int(os.getenv(concurrency, "8")),
+                max_retries=int(os.getenv("THROTTLE_MAX_RETRIES", "4")),
+                retry_base_seconds=float(os.getenv("THROTTLE_RETRY_BASE_SECONDS", "1")),
+                retry_max_seconds=float(os.getenv("THROTTLE_RETRY_MAX_SECONDS", "30")),
+            )
+        return _throttles[name]
@@ -0,0 +1,197 @@
+import math
+from itertools import combinations
+from statistics import mean, median, variance
+from typing import Optional
+
+SIGNIFICANCE_LEVEL = 0.05
+# Above this many rank permutations the Mann-Whitney p-value is approximated
+MAX_EXACT_PERMUTATIONS = 20000
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    Args:
+        samples: Measurements of repeated runs.
+
+    Returns:
+        Number of samples, mean, median, 95th percentile and sample variance.
+    """
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean": mean(ordered),
+        "median": median(ordered),
+        "p95": _percentile(ordered, 0.95),
+        "variance": variance(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    position = (len(ordered) - 1) * q
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _ranks(values: list[float]) -> list[float]:
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2 + 1  # ties share their average rank
+        i = j + 1
+    return ranks
+
+
+def mann_whitney_u(a: list[float], b: list[float]) -> tuple[float, float]:
+    """
+    Two-sided Mann-Whitney U test, which doesn't assume normally distributed timings.
+
+    Small samples get the exact permutation distribution of the ranks, larger ones the
+    tie-corrected normal approximation.
+
+    Args:
+        a: First sample.
+        b: Second sample.
+
+    Returns:
+        The U statistic of `a` and the p-value.
+    """
+    n_a, n_b = len(a), len(b)
+    ranks = _ranks(list(a) + list(b))
+    offset = n_a * (n_a + 1) / 2
+    u = sum(ranks[:n_a]) - offset
+    expected = n_a * n_b / 2
+
+    if math.comb(n_a + n_b, n_a) <= MAX_EXACT_PERMUTATIONS:
+        observed = abs(u - expected)
+        extreme = total = 0
+        for picked in combinations(ranks, n_a):
+            total += 1
+            if abs(sum(picked) - offset - expected) >= observed - 1e-9:
+                extreme += 1
+        return u, extreme / total
+
+    n = n_a + n_b
+    ties = sum(t**3 - t for t in _tie_sizes(ranks))
+    sigma = math.sqrt(n_a * n_b / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return u, 1.0
+    z = max(abs(u - expected) - 0.5, 0) / sigma
+    return u, math.erfc(z / math.sqrt(2))
+
+
+def _tie_sizes(ranks: list[float]) -> list[int]:
+    sizes: dict[float, int] = {}
+    for rank in ranks:
+        sizes[rank] = sizes.get(rank, 0) + 1
+    return list(sizes.values())
+
+
+def compare(
+    baseline: list[float], candidate: list[float], alpha: float = SIGNIFICANCE_LEVEL
+) -> dict:
+    """
+    Compare the measurements of two queries.
+
+    Args:
+        baseline: Measurements of the original query.
+        candidate: Measurements of the rewritten query.
+        alpha: Significance level.
+
+    Returns:
+        The p-value, whether the difference is significant and the ratio of the medians
+        (above 1 means the candidate is faster).
+    """
+    speedup = median(baseline) / median(candidate) if median(candidate) > 0 else None
+    if len(baseline) < 2 or len(candidate) < 2:
+        return {"significant": False, "p_value": None, "speedup": speedup}
+    _, p_value = mann_whitney_u(baseline, candidate)
+    return {"significant": p_value < alpha, "p_value": p_value, "speedup": speedup}
+
+
+def job_timings(job) -> dict:
+    """
+    Server-side timings of a finished BigQuery job, which exclude queueing on the client,
+    result download and network latency.
+    """
+    server_time = None
+    if job.started and job.ended:
+        server_time = (job.ended - job.started).total_seconds()
+    return {"server_time_seconds": server_time, "slot_millis": job.slot_millis}
+
+
+def aggregate_trials(runs: list[dict]) -> dict:
+    """
+    Combine the metadata dicts of repeated runs of the same query.
+
+    Args:
+        runs: Metadata of every measured run, as returned by `execute_sql_query`.
+
+    Returns:
+        The metadata of the last run with `execution_time_seconds`, `server_time_seconds` and
+        `slot_millis` replaced by their medians, plus a `trials` dict holding the summary and
+        samples of the timings (server-side where available) and slot times.
+    """
+    times = [
+        run["server_time_seconds"]
+        if run.get("server_time_seconds") is not None
+        else run["execution_time_seconds"]
+        for run in runs
+    ]
+    slots = [run["slot_millis"] for run in runs if run.get("slot_millis") is not None]
+    trials = {"execution_time_seconds": {**summarize(times), "samples": times}}
+    if slots:
+        trials["slot_millis"] = {**summarize(slots), "samples": slots}
+    return {
+        **runs[-1],
+        "execution_time_seconds": trials["execution_time_seconds"]["median"],
+        "server_time_seconds": trials["execution_time_seconds"]["median"],
+        "slot_millis": round(median(slots)) if slots else None,
+        "trials": trials,
+    }
+
+
+def compare_results(baseline: dict, candidate: dict) -> Optional[dict]:
+    """
+    Compare the execution times of two multi-trial results.
+
+    Args:
+        baseline: Metadata of the original query.
+        candidate: Metadata of the rewritten query.
+
+    Returns:
+        The `compare` result, or None unless both were measured with `aggregate_trials`.
+    """
+    baseline_trials = (baseline or {}).get("trials")
+    candidate_trials = (candidate or {}).get("trials")
+    if not baseline_trials or not candidate_trials:
+        return None
+    return compare(
+        baseline_trials["execution_time_seconds"]["samples"],
+        candidate_trials["execution_time_seconds"]["samples"],
+    )
+
+
+def significance_note(baseline: dict, candidate: dict) -> str:
+    """Prompt sentence telling whether a timing difference is more than noise."""
+    comparison = compare_results(baseline, candidate)
+    if comparison is None:
+        return ""
+    n = candidate["trials"]["execution_time_seconds"]["n"]
+    if not comparison["significant"]:
+        return (
+            f"Over {n} runs the execution time difference is NOT statistically significant,"
+            " treat it as noise rather than an improvement."
+        )
+    speedup = comparison["speedup"]
+    if speedup is None:  # the optimized query took no measurable time
+        return f"Over {n} runs the optimized SQL is significantly faster."
+    direction = "faster" if speedup > 1 else "slower"
+    return (
+        f"Over {n} runs the optimized SQL is significantly {direction}"
+        f" (median speedup {speedup:.2f}x, p={comparison['p_value']:.3f})."
+    )
@@ -0,0 +1,189 @@
+import contextvars
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Node usage is attributed to when no workflow node is known
+DEFAULT_NODE = "workflow"
+
+# SQL client calls which run BigQuery jobs
+QUERY_METHODS = frozenset(
+    {
+        "execute_sql_query",
+        "benchmark_sql_query",
+        "query_single_row",
+        "dry_run_sql_query",
+        "get_sql_query_stats",
+    }
+)
+
+_recorder: contextvars.ContextVar[Optional["UsageRecorder"]] = contextvars.ContextVar(
+    "usage_recorder", default=None
+)
+_node: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("usage_node", default=None)
+# Fallbacks resolving the node of the running code, e.g. from the LangGraph run config
+_node_resolvers: list[Callable[[], Optional[str]]] = []
+
+
+def _empty_stats() -> dict:
+    return {
+        "runs": 0,
+        "wall_seconds": 0.0,
+        "llm_calls": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "bq_jobs": 0,
+        "bytes_billed": 0,
+    }
+
+
+class UsageRecorder:
+    """
+    Collects the wall time, LLM calls and tokens and BigQuery jobs and bytes billed of one
+    workflow run, per workflow node.
+
+    The recorder is thread-safe. Code records into the recorder active in its context (see
+    `recording`), so concurrent runs in separate contexts don't mix.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.nodes: dict[str, dict] = {}
+
+    def _add(self, node: Optional[str], **values):
+        node = node or current_node()
+        with self._lock:
+            stats = self.nodes.setdefault(node, _empty_stats())
+            for key, value in values.items():
+                stats[key] += value
+
+    def add_node_run(self, node: str, seconds: float):
+        self._add(node, runs=1, wall_seconds=seconds)
+
+    def add_llm_call(self, input_tokens: int, output_tokens: int, node: Optional[str] = None):
+        self._add(node, llm_calls=1, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def add_query(self, bytes_billed: int, jobs: int = 1, node: Optional[str] = None):
+        self._add(node, bq_jobs=jobs, bytes_billed=bytes_billed)
+
+    def totals(self) -> dict:
+        """Usage summed over all nodes."""
+        totals = _empty_stats()
+        with self._lock:
+            for stats in self.nodes.values():
+                for key, value in stats.items():
+                    totals[key] += value
+        return totals
+
+    def report(self) -> dict:
+        """The usage of every node and the `totals`."""
+        with self._lock:
+            nodes = {node: dict(stats) for node, stats in self.nodes.items()}
+        return {"nodes": nodes, "totals": self.totals()}
+
+
+@contextmanager
+def recording(recorder: Optional[UsageRecorder] = None) -> Iterator[UsageRecorder]:
+    """Make a recorder the active one of the current context, a new one by default."""
+    recorder = recorder or UsageRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def current_recorder() -> Optional[UsageRecorder]:
+    return _recorder.get()
+
+
+def set_node(name: Optional[str]):
+    """Attribute the usage of the current context to the node, until set to another one."""
+    _node.set(name)
+
+
+def register_node_resolver(resolver: Callable[[], Optional[str]]):
+    """Add a fallback telling the node of the running code, used when none is set."""
+    _node_resolvers.append(resolver)
+
+
+def langgraph_node() -> Optional[str]:
+    """The LangGraph node running the current code, from LangChain's run config context."""
+    try:
+        from langchain_core.runnables.config import var_child_runnable_config
+    except ImportError:
+        return None
+    config = var_child_runnable_config.get() or {}
+    return config.get("metadata", {}).get("langgraph_node")
+
+
+def current_node() -> str:
+    """Node the running code belongs to: the one set, a resolved one or `DEFAULT_NODE`."""
+    name = _node.get()
+    if name is None:
+        name = next(filter(None, (resolver() for resolver in _node_resolvers)), None)
+    return name or DEFAULT_NODE
+
+
+def _bytes_billed(results) -> int:
+    if isinstance(results, dict):
+        dry_run, billed = results.get("dry_run"), results.get("total_bytes_billed")
+    else:
+        dry_run = getattr(results, "dry_run", False)
+        billed = getattr(results, "total_bytes_billed", 0)
+    # dry runs report their estimate as bytes billed, but bill nothing
+    return 0 if dry_run else billed or 0
+
+
+class UsageClient:
+    """
+    Wraps a SQL client so the BigQuery jobs of the calls in `QUERY_METHODS` and their bytes
+    billed are recorded into the active `UsageRecorder`.
+    """
+
+    def __init__(self, client):
+        """
+        Args:
+            client: Wrapped client, its other attributes are passed through.
+        """
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name not in QUERY_METHODS:
+            return attr
+        signature = inspect.signature(attr)
+
+        def record(results, args, kwargs):
+            recorder = current_recorder()
+            if recorder is None:
+                return
+            arguments = signature.bind(*args, **kwargs).arguments
+            # repeated runs bill every run (the query cache is off) but return the last one
+            runs = 1
+            if not arguments.get("dry_run"):
+                runs = arguments.get("trials", 1) + arguments.get("warmup", 0)
+            recorder.add_query(_bytes_billed(results) * runs, jobs=runs)
+
+        if inspect.iscoroutinefunction(attr):
+
+            @functools.wraps(attr)
+            async def recorded_async(*args, **kwargs):
+                results = await attr(*args, **kwargs)
+                record(results, args, kwargs)
+                return results
+
+            return recorded_async
+
+        @functools.wraps(attr)
+        def recorded(*args, **kwargs):
+            results = attr(*args, **kwargs)
+            record(results, args, kwargs)
+            return results
+
+        return recorded
+
+
+register_node_resolver(langgraph_node)
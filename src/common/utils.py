@@ -1,6 +1,10 @@
 from src.common.constants import SQL_ANTIPATTERNS
+from src.common.context_cache import Prompt
+from src.common.schema_context import build_schema_context
+from src.common.scoring import evaluate_query
 from typing import Optional
 from src.lgraph.models import SqlImprovementState, SchemaInfo
+from src.common.models import FusedAnalysis
 
 
 def get_table_schema_prompt(query: str) -> str:
@@ -16,14 +20,16 @@ Table Names:
     return prompt
 
 
-def get_antipatterns_prompt(query: str) -> str:
-    """Get antipatterns using a focused prompt."""
-    antipattern_codes = ""
+def _antipattern_catalog() -> str:
+    catalog = ""
     for category, antipatterns in SQL_ANTIPATTERNS.items():
         for a_code, a_object in antipatterns.items():
-            a_name = a_object["name"]
-            antipattern_codes += f"{category}:{a_code} ({a_name})\n"
-    antipattern_prompt = f"""Analyze this SQL query for antipatterns.
+            catalog += f"{category}:{a_code} ({a_object['name']})\n"
+    return catalog
+
+
+# Static prefix of the antipatterns prompt, the same for every query, so it's built once
+ANTIPATTERNS_PROMPT_PREFIX = f"""Analyze SQL queries for antipatterns.
 For each antipattern found, provide the following information in plain text format:
 ```
 CODE: (use only one from the list below, don't use any other)
@@ -34,60 +40,92 @@ LOCATION: (where in query)
 SUGGESTION: (how to fix)
 ```
 Available codes:
-{antipattern_codes}
+{_antipattern_catalog()}
+"""
+
+
+def get_antipatterns_prompt(query: str, exclude_codes: Optional[set[str]] = None) -> Prompt:
+    """Get antipatterns using a focused prompt, skipping the codes which were already checked."""
+    excluded = ""
+    if exclude_codes:
+        excluded = (
+            "These codes were already checked, don't report them: "
+            f"{', '.join(sorted(exclude_codes))}\n\n"
+        )
+    return Prompt(ANTIPATTERNS_PROMPT_PREFIX, f"{excluded}Query to analyze:\n{query}\n")
+
+
+def parse_antipatterns(response: str) -> list[dict]:
+    """Parse the plain text antipatterns list requested by `get_antipatterns_prompt`."""
+    antipatterns = []
+    current_pattern = {}
+    for line in response.split("\n"):
+        if not line:
+            if current_pattern:
+                antipatterns.append(current_pattern)
+                current_pattern = {}
+            continue
+        line = line.strip()
+        line = line.replace("*", "")
+        if ":" in line:
+            key, value = line.split(":", 1)
+            key = key.strip().upper()
+            value = value.strip()
+            if key in ["CODE", "NAME", "DESCRIPTION", "IMPACT", "LOCATION", "SUGGESTION"]:
+                current_pattern[key.lower()] = value
+    if current_pattern:
+        antipatterns.append(current_pattern)
+    return antipatterns
+
+
+def get_plan_summary_prompt(plan_summary: Optional[str]) -> str:
+    if not plan_summary:
+        return ""
+    return (
+        "The execution plan of the query shows these bottleneck stages, target them first:\n"
+        + plan_summary
+    )
+
+
+def get_analysis_context(query: str, schema_info: Optional[list[SchemaInfo]] = None) -> str:
+    """
+    Static prefix of the prompts about one query: its tables and the query itself. It is the
+    same in every prompt and loop iteration of an analysis, so it can be cached.
+    """
+    schema_context = build_schema_context(query, schema_info)
+    return f"""
+{schema_context}
 
 Query to analyze:
-{query}
-        """
-    # print()
-    # print(antipattern_prompt)
-    # print()
-    return antipattern_prompt
+    {query}
+
+""".lstrip()
+
+
+def get_antipatterns_list_prompt(antipatterns: Optional[list[dict]]) -> str:
+    if antipatterns is None:
+        return ""
+    antipatterns_str = [f"{ap.get('code', 'UNKNOWN')}: {ap.get('name', '')}" for ap in antipatterns]
+    return "The query contains the following antipatterns:\n" + "\n".join(antipatterns_str)
 
 
 def get_suggestions_prompt(
-    query: str, antipatterns: list[dict] = None, schema_info: Optional[list[SchemaInfo]] = None
-) -> str:
-    schema_context = ""
-    if schema_info:
-        for info in schema_info:
-            # print(print(json.dumps(info, indent=4)))
-            schema_context += (
-                f"The Query uses the following Table\n"
-                f"Table: {info['table_name']}\n"
-                f"Row Count: {info['row_count']}\n"
-                f"Table Size in Bytes: {info['size_bytes']}\n"
-                "| COLUMN_NAME | COLUMN_TYPE |\n"
-                "| ----------- | ----------- |\n"
-            )
-            for column in info["columns"]:
-                schema_context += f"| {column['column_name']} | {column['column_type']} |\n"
-    else:
-        schema_context = ""
-    if antipatterns is not None:
-        antipatterns_str = [
-            f"{ap.get('code', 'UNKNOWN')}: {ap.get('name', '')}" for ap in antipatterns
-        ]
-        antipatterns_prompt = "The query contains the following antipatterns:\n" + "\n".join(
-            antipatterns_str
-        )
-    else:
-        antipatterns_prompt = ""
+    query: str,
+    antipatterns: list[dict] = None,
+    schema_info: Optional[list[SchemaInfo]] = None,
+    plan_summary: Optional[str] = None,
+) -> Prompt:
     suggestion_prompt = f"""
 Analyze this SQL query and suggest optimizations.
 Provide each suggestion on a new line starting with '- '.
 Focus on query structure and BigQuery features.
 Keep each suggestion brief and focused, without excessive language.
 
-Query to analyze:
-    {query}
-
-{schema_context.lstrip()}
-
-{antipatterns_prompt}
+{get_antipatterns_list_prompt(antipatterns)}
 
+{get_plan_summary_prompt(plan_summary)}
 """.lstrip()
-    return suggestion_prompt
+    return Prompt(get_analysis_context(query, schema_info), suggestion_prompt)
 
 
 def get_optimized_sql_prompt(
@@ -95,71 +133,18 @@ def get_optimized_sql_prompt(
     improvements: list[str] = None,
     antipatterns: list[dict] = None,
     schema_info: Optional[list[SchemaInfo]] = None,
-) -> str:
-    schema_context = ""
-    if schema_info:
-        for info in schema_info:
-            schema_context += (
-                f"The Query uses the following Table\n"
-                f"Table: {info['table_name']}\n"
-                f"Row Count: {info['row_count']}\n"
-                f"Table Size in Bytes: {info['size_bytes']}\n"
-                "| COLUMN_NAME | COLUMN_TYPE |\n"
-                "| ----------- | ----------- |\n"
-            )
-            for column in info["columns"]:
-                schema_context += f"| {column['column_name']} | {column['column_type']} |\n"
-    else:
-        schema_context = ""
-    if antipatterns is not None:
-        antipatterns_str = [
-            f"{ap.get('code', 'UNKNOWN')}: {ap.get('name', '')}" for ap in antipatterns
-        ]
-        antipatterns_prompt = "The query contains the following antipatterns:\n" + "\n".join(
-            antipatterns_str
-        )
-    else:
-        antipatterns_prompt = ""
-
-    if improvements is not None:
-        improvements_prompt = "The query contains the following suggestions:\n" + "\n".join(
-            improvements
-        )
-    else:
-        improvements_prompt = ""
-    # {improvements_prompt}
+    plan_summary: Optional[str] = None,
+) -> Prompt:
     suggestion_prompt = f"""
 Analyze this SQL query and provide optimized SQL based on antipatterns and provided table information.
-Query to analyze:
-    {query}
-
-{antipatterns_prompt}
-
 
+{get_antipatterns_list_prompt(antipatterns)}
 
-{schema_context.lstrip()}
+{get_plan_summary_prompt(plan_summary)}
 
 Provide optimized SQL in the form of new SQL query, no comments and old version of the query is needed:
 """.lstrip()
-
-    return suggestion_prompt
-
-
-def evaluate_query(results: dict) -> dict:
-    score = 0
-    weights = {
-        "execution_time_seconds": 0.40,
-        "total_bytes_processed": 0.30,
-        "total_bytes_billed": 0.15,
-        "cache_hit": 0.10,
-        "num_dml_affected_rows": 0.05,
-    }
-    score += (1 / (1 + results["execution_time_seconds"])) * weights["execution_time_seconds"]
-    score += (1 / (1 + results["total_bytes_processed"])) * weights["total_bytes_processed"]
-    score += (1 / (1 + results["total_bytes_billed"])) * weights["total_bytes_billed"]
-    score += (1 if results["cache_hit"] else 0) * weights["cache_hit"]
-    score += (results["num_dml_affected_rows"] / 1000) * weights["num_dml_affected_rows"]
-    return {"score": score, "metadata": results}
+    return Prompt(get_analysis_context(query, schema_info), suggestion_prompt)
 
 
 def get_optimized_sql_prompt2(
@@ -167,51 +152,74 @@ def get_optimized_sql_prompt2(
     improvements: list[str] = None,
     antipatterns: list[dict] = None,
     schema_info: Optional[list[SchemaInfo]] = None,
-) -> str:
-    schema_context = ""
-    if schema_info:
-        for info in schema_info:
-            schema_context += (
-                f"The Query uses the following Table\n"
-                f"Table: {info['table_name']}\n"
-                f"Row Count: {info['row_count']}\n"
-                f"Table Size in Bytes: {info['size_bytes']}\n"
-                "| COLUMN_NAME | COLUMN_TYPE |\n"
-                "| ----------- | ----------- |\n"
-            )
-            for column in info["columns"]:
-                schema_context += f"| {column['column_name']} | {column['column_type']} |\n"
-    else:
-        schema_context = ""
-    if antipatterns is not None:
-        antipatterns_str = [
-            f"{ap.get('code', 'UNKNOWN')}: {ap.get('name', '')}" for ap in antipatterns
-        ]
-        antipatterns_prompt = "The query contains the following antipatterns:\n" + "\n".join(
-            antipatterns_str
-        )
-    else:
-        antipatterns_prompt = ""
-
-    if improvements is not None:
-        improvements_prompt = "The query contains the following suggestions:\n" + "\n".join(
-            improvements
-        )
-    else:
-        improvements_prompt = ""
-    # {improvements_prompt}
+    plan_summary: Optional[str] = None,
+) -> Prompt:
     suggestion_prompt = f"""
 Analyze this SQL query and provide optimized SQL based on antipatterns and provided table information. If table information is not available or empty - don't try to invent the columns, use available data or *
-Query to analyze:
-    {query}
 
-{antipatterns_prompt}
+{get_antipatterns_list_prompt(antipatterns)}
 
-
-
-{schema_context.lstrip()}
+{get_plan_summary_prompt(plan_summary)}
 
 Provide optimized SQL in the form of new SQL query, no comments and old version of the query is needed:
 """.lstrip()
+    return Prompt(get_analysis_context(query, schema_info), suggestion_prompt)
+
+
+# Static prefix of the fused analysis prompt, followed by the analysis context of the query
+FUSED_ANALYSIS_PROMPT_PREFIX = f"""Analyze the SQL query below and optimize it for BigQuery, in one answer:
+1. Find its antipatterns, using only these codes:
+{_antipattern_catalog()}
+2. Suggest optimizations, each a candidate rewrite of the query with a brief rationale, focused on
+query structure and BigQuery features.
+3. Provide the best optimized query, returning the same rows as the original query. Don't invent
+columns which aren't in the table information.
+
+"""
 
-    return suggestion_prompt
+
+def get_fused_analysis_prompt(
+    query: str,
+    schema_info: Optional[list[SchemaInfo]] = None,
+    plan_summary: Optional[str] = None,
+    exclude_codes: Optional[set[str]] = None,
+) -> Prompt:
+    """Prompt of the structured call returning antipatterns, suggestions and optimized SQL."""
+    excluded = ""
+    if exclude_codes:
+        excluded = (
+            "These antipattern codes were already checked, don't report them: "
+            f"{', '.join(sorted(exclude_codes))}"
+        )
+    suffix = f"""
+{excluded}
+
+{get_plan_summary_prompt(plan_summary)}
+""".strip()
+    return Prompt(FUSED_ANALYSIS_PROMPT_PREFIX + get_analysis_context(query, schema_info), suffix)
+
+
+def fused_analysis_update(
+    analysis: Optional[FusedAnalysis], static_antipatterns: list[dict], checked_codes: set[str]
+) -> dict:
+    """
+    Args:
+        analysis: Structured LLM answer, None if the model didn't answer with one.
+        static_antipatterns: Antipatterns found by the static detector.
+        checked_codes: Codes the static detector checked, the model's findings are ignored.
+
+    Returns:
+        The `antipatterns`, `improvements` and `optimized_sql` state update.
+    """
+    if analysis is None:
+        return {"antipatterns": static_antipatterns, "improvements": [], "optimized_sql": ""}
+    antipatterns = [
+        antipattern.model_dump()
+        for antipattern in analysis.antipatterns
+        if antipattern.code not in checked_codes
+    ]
+    return {
+        "antipatterns": static_antipatterns + antipatterns,
+        "improvements": [i.rationale for i in analysis.suggestions.improvements],
+        "optimized_sql": analysis.optimized_sql.replace("```sql", "").replace("```", "").strip(),
+    }
@@ -1,29 +1,39 @@
 from crewai.flow.flow import Flow, listen, start
-from src.common.env_setup import setup_aiplatform, GCP_PROJECT
-from src.crewai.bq_client import BigQueryClient
+from src.common import services
+from src.common.env_setup import FUSED_ANALYSIS, GCP_PROJECT, BQ_DEFAULT_DATASET
+from src.common.sql_parser import SqlParseError, extract_tables
+from src.common.antipattern_detector import detect_static_antipatterns
 from src.common.utils import (
     get_table_schema_prompt,
     get_antipatterns_prompt,
+    parse_antipatterns,
     get_suggestions_prompt,
     get_optimized_sql_prompt,
+    get_fused_analysis_prompt,
+    fused_analysis_update,
     evaluate_query,
 )
-from crewai import LLM
+from src.common.models import FusedAnalysis
 from src.crewai.sql_analyzer import SqlImprovementState
 import logging
-import os
-import json
 
 logger = logging.getLogger(__name__)
 
 
 class SqlAnalysisFlow(Flow[SqlImprovementState]):
-    llm = LLM(
-        model="gemini/gemini-2.0-flash",
-        temperature=1.0,
-        vertex_credentials=json.loads(os.getenv("GOOGLE_APPLICATION_CREDENTIALS")),
-    )
-    bq_client = BigQueryClient(project_id=GCP_PROJECT, credentials=setup_aiplatform())
+    # the clients are shared by the flows and crews, created on first use rather than on import
+    @property
+    def llm(self):
+        return services.get_crewai_llm(temperature=1.0)
+
+    @property
+    def fused_llm(self):
+        # answers with JSON of the schema, no free text to parse
+        return services.get_crewai_llm(temperature=1.0, response_format=FusedAnalysis)
+
+    @property
+    def bq_client(self):
+        return services.get_crewai_bq_client()
 
     @start()
     def verify_sql(self):
@@ -38,12 +48,17 @@ class SqlAnalysisFlow(Flow[SqlImprovementState]):
     def identify_tables(self):
         """First step"""
         logger.info(f"Identify tables state {self.state}")
-        msg = self.llm.call(get_table_schema_prompt(self.state["sql"]))
-        logger.info(f"LLM response {msg}")
-        if "no_tables_found" not in msg.strip():
-            tables = [
-                self.bq_client.get_table_metadata_by_ref(table.strip()) for table in msg.split(",")
-            ]
+        try:
+            table_ids = extract_tables(self.state["sql"], GCP_PROJECT, BQ_DEFAULT_DATASET).tables
+        except SqlParseError as e:
+            logger.info(f"Falling back to LLM table extraction: {e}")
+            msg = self.llm.call(get_table_schema_prompt(self.state["sql"]))
+            logger.info(f"LLM response {msg}")
+            table_ids = (
+                [] if "no_tables_found" in msg.strip() else [t.strip() for t in msg.split(",")]
+            )
+        if table_ids:
+            tables = [self.bq_client.get_table_metadata_by_ref(table) for table in table_ids]
             logger.info(f"Identified tables referenced in the query: {tables}")
             self.state["tables"] = tables
         else:
@@ -51,25 +66,13 @@ class SqlAnalysisFlow(Flow[SqlImprovementState]):
 
     @listen(identify_tables)
     def antipatterns(self):
-        msg = self.llm.call(get_antipatterns_prompt(self.state["sql"]))
-        antipatterns = []
-        current_pattern = {}
-        for line in msg.split("\n"):
-            if not line:
-                if current_pattern:
-                    antipatterns.append(current_pattern)
-                    current_pattern = {}
-                continue
-            line = line.strip()
-            line = line.replace("*", "")
-            if ":" in line:
-                key, value = line.split(":", 1)
-                key = key.strip().upper()
-                value = value.strip()
-                if key in ["CODE", "NAME", "DESCRIPTION", "IMPACT", "LOCATION", "SUGGESTION"]:
-                    current_pattern[key.lower()] = value
-        if current_pattern:
-            antipatterns.append(current_pattern)
+        if FUSED_ANALYSIS:
+            return  # found by the fused analysis in `optimize`
+        static_antipatterns, checked_codes = detect_static_antipatterns(self.state["sql"])
+        msg = self.llm.call(get_antipatterns_prompt(self.state["sql"], exclude_codes=checked_codes))
+        antipatterns = static_antipatterns + [
+            ap for ap in parse_antipatterns(msg) if ap.get("code") not in checked_codes
+        ]
         self.state["antipatterns"] = antipatterns
         logger.info(f"Identified antipatterns: {antipatterns}")
 
@@ -80,10 +83,15 @@ class SqlAnalysisFlow(Flow[SqlImprovementState]):
     @listen(antipatterns)
     def suggestions(self):
         """Get optimization suggestions using a focused prompt."""
+        if FUSED_ANALYSIS:
+            return  # made by the fused analysis in `optimize`
         try:
             msg = self.llm.call(
                 get_suggestions_prompt(
-                    self.state["sql"], self.state["antipatterns"], self.state["tables"]
+                    self.state["sql"],
+                    self.state["antipatterns"],
+                    self.state["tables"],
+                    plan_summary=self.state["sql_res"].get("plan_summary"),
                 )
             )
             suggestions = []
@@ -101,23 +109,49 @@ class SqlAnalysisFlow(Flow[SqlImprovementState]):
     @listen(suggestions)
     def optimize(self):
         """Get optimization suggestions using a focused prompt."""
+        if FUSED_ANALYSIS:
+            return self.fused_analysis()
         try:
             msg = self.llm.call(
                 get_optimized_sql_prompt(
-                    self.state["sql"], self.state["antipatterns"], self.state["tables"]
+                    self.state["sql"],
+                    antipatterns=self.state["antipatterns"],
+                    schema_info=self.state["tables"],
+                    plan_summary=self.state["sql_res"].get("plan_summary"),
                 )
             )
 
             def clean_sql_string(sql_string):
                 return sql_string.replace("```sql", "").replace("```", "").strip()
 
-            return {"optimized_sql": clean_sql_string(msg)}
+            self.state["optimized_sql"] = clean_sql_string(msg)
 
         except Exception as e:
             print(f"Error getting suggestions: {str(e)}")
-            return {"optimized_sql": ""}
+            self.state["optimized_sql"] = ""
+        return {"optimized_sql": self.state["optimized_sql"]}
+
+    def fused_analysis(self):
+        """Antipatterns, suggestions and the optimized query from one structured LLM call."""
+        static_antipatterns, checked_codes = detect_static_antipatterns(self.state["sql"])
+        prompt = get_fused_analysis_prompt(
+            self.state["sql"],
+            self.state["tables"],
+            plan_summary=self.state["sql_res"].get("plan_summary"),
+            exclude_codes=checked_codes,
+        )
+        try:
+            analysis = FusedAnalysis.model_validate_json(self.fused_llm.call(prompt))
+        except Exception as e:
+            logger.warning(f"Fused analysis failed: {e}")
+            analysis = None
+        update = fused_analysis_update(analysis, static_antipatterns, checked_codes)
+        self.state.update(update)
+        logger.info(f"Fused analysis: {update}")
+        return {"optimized_sql": update["optimized_sql"]}
 
     @listen(optimize)
     def verify_optimized_sql(self):
         results = self.bq_client.execute_sql_query(self.state["optimized_sql"])
-        return {"optimized_sql_res": evaluate_query(results[0])}
+        self.state["optimized_sql_res"] = evaluate_query(results, baseline=self.state["sql_res"])
+        return {"optimized_sql_res": self.state["optimized_sql_res"]}
@@ -0,0 +1,56 @@
+import logging
+
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.tasks.output_format import OutputFormat
+from crewai.tasks.task_output import TaskOutput
+from pydantic import PrivateAttr
+
+from src.crewai.bq_client import BigQueryClient
+from src.crewai.candidate_benchmark import CandidateBenchmark
+from src.crewai.models import ImprovementsAnalysis, QuerySuggestions
+
+logger = logging.getLogger(__name__)
+
+
+class BenchmarkCandidatesTask(ConditionalTask):
+    """
+    Benchmarks the QuerySuggestions of the previous task without an LLM turn.
+
+    The crew asks a conditional task whether to run with the previous task's output. This one
+    answers by running the `CandidateBenchmark` on it in Python and skipping the agent, so the
+    candidates aren't re-emitted by the LLM as tool arguments. The ImprovementsAnalysis is the
+    task's output, the context of the tasks after it.
+    """
+
+    _benchmark: CandidateBenchmark = PrivateAttr()
+    _analysis: ImprovementsAnalysis = PrivateAttr()
+
+    def __init__(self, bq_client: BigQueryClient, **kwargs):
+        """
+        Args:
+            bq_client: Client used to run the candidates.
+            **kwargs: Task fields, e.g. its `config`.
+        """
+        super().__init__(condition=lambda output: False, **kwargs)
+        self._benchmark = CandidateBenchmark(bq_client)
+
+    def should_execute(self, context: TaskOutput) -> bool:
+        suggestions = context.pydantic
+        if not isinstance(suggestions, QuerySuggestions):
+            suggestions = QuerySuggestions.model_validate_json(context.raw)
+        logger.info(f"Benchmarking {len(suggestions.improvements)} candidates")
+        self._analysis = self._benchmark.run(suggestions)
+        return False
+
+    def get_skipped_task_output(self) -> TaskOutput:
+        # later tasks read their context from the output of the tasks it lists
+        self.output = TaskOutput(
+            name=self.name,
+            description=self.description,
+            expected_output=self.expected_output,
+            raw=self._analysis.model_dump_json(),
+            pydantic=self._analysis,
+            agent=self.agent.role if self.agent else "",
+            output_format=OutputFormat.PYDANTIC,
+        )
+        return self.output
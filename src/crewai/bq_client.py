@@ -1,5 +1,18 @@
+from google.api_core.exceptions import GoogleAPICallError
 from google.cloud import bigquery
+import os
 import time
+from google.cloud.bigquery import TableReference
+from typing import Optional
+from src.common.bq_pool import get_bq_client_pool
+from src.common.budget import current_budget
+from src.common.metadata_cache import get_table_metadata_cache
+from src.common.query_plan import plan_statistics
+from src.common.replay import replay_client
+from src.common.schema_context import partition_column
+from src.common.throttle import BIGQUERY_THROTTLE, get_throttle
+from src.common.usage import UsageClient
+from src.common.trials import aggregate_trials, job_timings
 from src.crewai.models import ColumnInfo, SchemaInfo, QueryStats
 import logging
 
@@ -13,15 +26,55 @@ class BigQueryClient:
         Args:
             project_id: Google Cloud project ID.
         """
-        self.client = bigquery.Client(project=project_id, credentials=credentials)
+        self.project_id = project_id
+        self.credentials = credentials
+        self.metadata_cache = get_table_metadata_cache("crewai")
+
+    @property
+    def client(self) -> bigquery.Client:
+        # created on first use, a replayed client never connects to BigQuery
+        return get_bq_client_pool().get(self.project_id, self.credentials)
+
+    def _run_query(
+        self, sql: str, job_config: Optional[bigquery.QueryJobConfig] = None
+    ) -> bigquery.QueryJob:
+        """
+        Run a query job until it's done, through the process-wide BigQuery throttle and within
+        the budget of the active `budget_scope`.
+
+        Raises:
+            google.api_core.exceptions.GoogleAPICallError: If the job finished with an error.
+            src.common.budget.BudgetExceededError: If the job would exceed or exceeded its budget.
+        """
+
+        def run() -> bigquery.QueryJob:
+            config, budget, limits = job_config, None, None
+            if not (config and config.dry_run):
+                budget = current_budget()
+            if budget is not None:
+                config, limits = budget.prepare_job(self.client, sql, config)
+            job = self.client.query(sql, job_config=config)
+            if job.dry_run:
+                return job
+            if budget is not None:
+                try:
+                    budget.wait(job, limits)
+                finally:
+                    budget.record(job)
+                error = budget.job_error(job, limits) if job.error_result else None
+                if error is not None:
+                    raise error
+            job.result()
+            return job
+
+        return get_throttle(BIGQUERY_THROTTLE).call(run)
 
     def execute_sql_query(self, sql: str) -> dict:
         job_config = bigquery.QueryJobConfig()
         job_config.use_query_cache = False
         start_time = time.time()
 
-        query_job = self.client.query(sql, job_config=job_config)
-        query_job.result()  # Ensures the query completes before proceeding
+        query_job = self._run_query(sql, job_config=job_config)
 
         end_time = time.time()
         job = self.client.get_job(query_job.job_id)
@@ -40,17 +93,97 @@ class BigQueryClient:
             "num_dml_affected_rows": job.num_dml_affected_rows
             if job.num_dml_affected_rows is not None
             else 0,
+            "dry_run": False,
             "sql": sql,
+            **job_timings(job),
+            **plan_statistics(job),
         }
         return metadata
 
-    def get_sql_query_stats(self, sql: str) -> QueryStats:
+    def benchmark_sql_query(self, sql: str, trials: int, warmup: int = 0) -> dict:
+        """
+        Run a query repeatedly and summarize its server-side timings.
+
+        The runs are sequential, concurrent runs of the same query would compete for slots.
+
+        Args:
+            sql: BigQuery SQL to run.
+            trials: Number of measured runs.
+            warmup: Number of runs before the measured ones, their stats are discarded.
+
+        Returns:
+            The metadata of `execute_sql_query` with median timings and a `trials` summary.
+        """
+        for _ in range(warmup):
+            self.execute_sql_query(sql)
+        runs = [self.execute_sql_query(sql) for _ in range(trials)]
+        return aggregate_trials(runs)
+
+    def query_single_row(self, sql: str) -> dict:
+        """
+        Run a query returning a single row, like an aggregate, using the query cache.
+
+        Args:
+            sql: BigQuery SQL to run.
+
+        Returns:
+            The row as a dict, empty if the query returned no rows.
+        """
+        rows = [dict(row.items()) for row in self._run_query(sql).result()]
+        return rows[0] if rows else {}
+
+    def dry_run_sql_query(self, sql: str) -> dict:
+        """
+        Validate a query and estimate its cost without executing it.
+
+        Args:
+            sql: BigQuery SQL to validate.
+
+        Returns:
+            A metadata dict with the same keys as `execute_sql_query`, plus the
+            referenced tables and the validation error (if the query is invalid).
+        """
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        metadata = {
+            "total_bytes_processed": 0,
+            "total_bytes_billed": 0,
+            "billing_tier": 0,
+            "execution_time_seconds": 0.0,
+            "cache_hit": False,
+            "num_dml_affected_rows": 0,
+            "dry_run": True,
+            "referenced_tables": [],
+            "error": None,
+            "sql": sql,
+        }
+        try:
+            job = self._run_query(sql, job_config=job_config)
+        except GoogleAPICallError as e:
+            logger.info(f"Dry run failed: {e.message}")
+            metadata["error"] = e.message
+            return metadata
+
+        # a dry run bills nothing, the estimate is the best proxy for what a real run would bill
+        metadata["total_bytes_processed"] = job.total_bytes_processed or 0
+        metadata["total_bytes_billed"] = job.total_bytes_processed or 0
+        metadata["referenced_tables"] = [
+            f"{ref.project}.{ref.dataset_id}.{ref.table_id}" for ref in job.referenced_tables
+        ]
+        return metadata
+
+    def get_sql_query_stats(
+        self, sql: str, dry_run: bool = False, trials: int = 1, warmup: int = 0
+    ) -> QueryStats:
+        if dry_run:
+            return QueryStats(**self.dry_run_sql_query(sql))
+        if trials > 1:
+            return QueryStats(**self.benchmark_sql_query(sql, trials, warmup))
+
         job_config = bigquery.QueryJobConfig()
         job_config.use_query_cache = False
 
         start_time = time.time()
-        query_job = self.client.query(sql, job_config=job_config)
-        query_job.result()  # Ensures the query completes before proceeding
+        query_job = self._run_query(sql, job_config=job_config)
         end_time = time.time()
 
         job = self.client.get_job(query_job.job_id)
@@ -63,6 +196,8 @@ class BigQueryClient:
             cache_hit=getattr(job, "cache_hit", False),
             num_dml_affected_rows=job.num_dml_affected_rows or 0,
             sql=sql,
+            **job_timings(job),
+            **plan_statistics(job),
         )
 
     def get_table_metadata(self, project: str, dataset: str, table: str) -> SchemaInfo:
@@ -73,15 +208,31 @@ class BigQueryClient:
         """
         Get metadata about a BigQuery table, formatted as a SchemaInfo object.
 
+        Results are served from the process-wide metadata cache.
+
         Args:
             table_ref: The ID of the table in the format "dataset.table_name".
 
         Returns:
             A SchemaInfo object containing the table schema and storage information.
         """
-        from google.cloud.bigquery import TableReference
+        ref = TableReference.from_string(table_id, default_project=self.client.project)
+        return self.metadata_cache.get(
+            f"{ref.project}.{ref.dataset_id}.{ref.table_id}",
+            lambda: self._fetch_table_metadata(ref),
+        )
+
+    def get_table_versions(self, table_ids: list[str]) -> dict[str, Optional[str]]:
+        """
+        Args:
+            table_ids: IDs of the tables in the format "project.dataset.table_name".
+
+        Returns:
+            The `last_modified` timestamp of every table, served from the metadata cache.
+        """
+        return {t: self.get_table_metadata_by_ref(t).last_modified for t in table_ids}
 
-        ref = TableReference.from_string(table_id)
+    def _fetch_table_metadata(self, ref: TableReference) -> SchemaInfo:
         table_data = self.client.get_table(ref)  # Make an API request.
 
         columns = []
@@ -99,6 +250,33 @@ class BigQueryClient:
             columns=columns,
             row_count=table_data.num_rows,
             size_bytes=table_data.num_bytes,
+            last_modified=table_data.modified.isoformat() if table_data.modified else None,
+            partition_column=partition_column(table_data),
+            clustering_columns=table_data.clustering_fields or [],
         )
 
         return schema_info
+
+
+def create_bq_client(project_id: str, credentials=None):
+    """
+    Client of the SQL backend selected by the SQL_BACKEND environment variable.
+
+    Args:
+        project_id: Google Cloud project ID.
+
+    Returns:
+        A `BigQueryClient`, or with `SQL_BACKEND=duckdb` a `DuckDBClient` running the queries
+        against the local fixtures in DUCKDB_FIXTURES_DIR. With REPLAY_MODE set the client's
+        calls are recorded or replayed. The BigQuery usage is reported to the active
+        `UsageRecorder`.
+    """
+    from src.common.env_setup import SQL_BACKEND
+
+    if SQL_BACKEND == "duckdb":
+        from src.crewai.duckdb_client import DuckDBClient
+
+        client = DuckDBClient(project_id=project_id)
+    else:
+        client = BigQueryClient(project_id=project_id, credentials=credentials)
+    return UsageClient(replay_client(client))
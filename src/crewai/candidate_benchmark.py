@@ -0,0 +1,128 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import copy_context
+from typing import Optional
+
+from src.common.env_setup import (
+    BQ_BENCHMARK_TRIALS,
+    BQ_BENCHMARK_WARMUP,
+    BQ_DRY_RUN_SCORING,
+    VERIFY_EQUIVALENCE,
+)
+from src.common.equivalence import check_equivalence
+from src.common.scoring import score_candidates
+from src.common.trials import compare_results
+from src.crewai.bq_client import BigQueryClient
+from src.crewai.models import ImprovementsAnalysis, QueryStats, QuerySuggestions
+
+logger = logging.getLogger(__name__)
+
+
+class CandidateBenchmark:
+    """
+    Runs every improved query candidate and collects its stats.
+
+    This replaces one tool call (and one LLM turn) per candidate with a single call. Single
+    runs are concurrent, so the call takes roughly as long as the slowest candidate. Repeated
+    trials measure timings, so the candidates then run one after the other, after the
+    equivalence checks, rather than competing for slots.
+    """
+
+    def __init__(
+        self,
+        bq_client: BigQueryClient,
+        max_parallel: Optional[int] = None,
+        dry_run: bool = BQ_DRY_RUN_SCORING,
+        trials: int = BQ_BENCHMARK_TRIALS,
+        warmup: int = BQ_BENCHMARK_WARMUP,
+        verify_equivalence: bool = VERIFY_EQUIVALENCE,
+    ):
+        """
+        Args:
+            bq_client: Client used to run the candidates.
+            max_parallel: Maximum number of candidates running at once with a single trial,
+                defaults to the BENCHMARK_MAX_PARALLEL environment variable.
+            dry_run: Only estimate the candidates' cost instead of running them.
+            trials: Number of measured runs per candidate, with more than one every
+                candidate's timings are tested against the original's for significance.
+            warmup: Number of discarded runs before the measured ones.
+            verify_equivalence: Check that every candidate returns the same rows as the
+                original query, next to the benchmark. Skipped for dry runs.
+        """
+        self.bq_client = bq_client
+        self.max_parallel = max_parallel or int(os.getenv("BENCHMARK_MAX_PARALLEL", "4"))
+        self.dry_run = dry_run
+        self.trials = trials
+        self.warmup = warmup
+        self.verify_equivalence = verify_equivalence and not dry_run
+
+    def run(self, suggestions: QuerySuggestions) -> ImprovementsAnalysis:
+        """
+        Args:
+            suggestions: Candidates to benchmark.
+
+        Returns:
+            The candidates with their execution stats, in the same order, and their scores
+            relative to the original query, which is run alongside them.
+        """
+        candidates = [improvement.improved_sql for improvement in suggestions.improvements]
+        sequential = self.trials > 1 and not self.dry_run
+        # equivalence checks get their own pool so they don't queue behind the benchmark
+        with (
+            ThreadPoolExecutor(max_workers=1 if sequential else self.max_parallel) as pool,
+            ThreadPoolExecutor(max_workers=self.max_parallel) as check_pool,
+        ):
+            # every task runs in a copy of the caller's context, e.g. to keep its usage recorder
+            checks = [
+                check_pool.submit(
+                    copy_context().run,
+                    check_equivalence,
+                    self.bq_client,
+                    suggestions.original_sql,
+                    sql,
+                )
+                for sql in (candidates if self.verify_equivalence else [])
+            ]
+            if sequential:
+                wait(checks)  # the checks' jobs would skew the timings
+            runs = [
+                pool.submit(copy_context().run, self._run_candidate, sql)
+                for sql in [suggestions.original_sql, *candidates]
+            ]
+            baseline, *stats = [run.result() for run in runs]
+            for index, check in enumerate(checks):
+                stats[index].equivalence = check.result()
+
+        baseline_results = baseline.model_dump()
+        candidate_results = [candidate_stats.model_dump() for candidate_stats in stats]
+        for candidate_stats, results in zip(stats, candidate_results, strict=True):
+            candidate_stats.comparison = compare_results(baseline_results, results)
+        scored = score_candidates(baseline_results, candidate_results)
+        return ImprovementsAnalysis(
+            improvements=suggestions.improvements,
+            execution_stats=stats,
+            scores=scored["scores"],
+            ranking=scored["ranking"],
+            pareto_front=scored["pareto_front"],
+        )
+
+    def _run_candidate(self, sql: str) -> QueryStats:
+        try:
+            return self.bq_client.get_sql_query_stats(
+                sql, dry_run=self.dry_run, trials=self.trials, warmup=self.warmup
+            )
+        except Exception as e:
+            # a broken candidate must not fail the whole round
+            logger.info(f"Candidate failed: {e}")
+            return QueryStats(
+                total_bytes_processed=0,
+                total_bytes_billed=0,
+                billing_tier=0,
+                execution_time_seconds=0.0,
+                cache_hit=False,
+                num_dml_affected_rows=0,
+                sql=sql,
+                dry_run=self.dry_run,
+                error=str(e),
+            )
@@ -0,0 +1,64 @@
+import logging
+from typing import Optional
+
+from src.common.duckdb_backend import DuckDBBackend, get_duckdb_backend
+from src.common.trials import aggregate_trials
+from src.crewai.models import ColumnInfo, QueryStats, SchemaInfo
+
+logger = logging.getLogger(__name__)
+
+
+class DuckDBClient:
+    """
+    Local stand-in for `BigQueryClient`, running queries against DuckDB/Parquet fixtures.
+
+    Selected with `SQL_BACKEND=duckdb`, see `create_bq_client`.
+    """
+
+    def __init__(self, project_id: str, backend: Optional[DuckDBBackend] = None):
+        """
+        Args:
+            project_id: Project reported for the fixture tables.
+            backend: DuckDB backend, defaults to the process-wide one.
+        """
+        self.project_id = project_id
+        self.backend = backend or get_duckdb_backend()
+
+    def execute_sql_query(self, sql: str) -> dict:
+        return self.backend.execute(sql)
+
+    def benchmark_sql_query(self, sql: str, trials: int, warmup: int = 0) -> dict:
+        """Run a query repeatedly, like `BigQueryClient.benchmark_sql_query`."""
+        for _ in range(warmup):
+            self.execute_sql_query(sql)
+        runs = [self.execute_sql_query(sql) for _ in range(trials)]
+        return aggregate_trials(runs)
+
+    def query_single_row(self, sql: str) -> dict:
+        rows = self.backend.query_rows(sql)
+        return rows[0] if rows else {}
+
+    def dry_run_sql_query(self, sql: str) -> dict:
+        return self.backend.dry_run(sql)
+
+    def get_sql_query_stats(
+        self, sql: str, dry_run: bool = False, trials: int = 1, warmup: int = 0
+    ) -> QueryStats:
+        if dry_run:
+            return QueryStats(**self.dry_run_sql_query(sql))
+        if trials > 1:
+            return QueryStats(**self.benchmark_sql_query(sql, trials, warmup))
+        return QueryStats(**self.execute_sql_query(sql))
+
+    def get_table_metadata(self, project: str, dataset: str, table: str) -> SchemaInfo:
+        return self.get_table_metadata_by_ref(f"{project}.{dataset}.{table}")
+
+    def get_table_metadata_by_ref(self, table_id: str) -> SchemaInfo:
+        metadata = self.backend.table_metadata(table_id)
+        return SchemaInfo(
+            gcp_project_name=self.project_id,
+            **{**metadata, "columns": [ColumnInfo(**c) for c in metadata["columns"]]},
+        )
+
+    def get_table_versions(self, table_ids: list[str]) -> dict[str, Optional[str]]:
+        return {t: self.get_table_metadata_by_ref(t).last_modified for t in table_ids}
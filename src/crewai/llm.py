@@ -0,0 +1,122 @@
+import functools
+import json
+from typing import Any, Optional, Union
+
+import litellm
+from crewai import LLM
+
+from src.common import usage
+from src.common.llm_response_cache import LLMResponseCache, get_llm_response_cache
+from src.common.replay import ReplayStore, get_replay_store
+from src.common.throttle import LLM_THROTTLE, get_throttle
+from src.common.usage import current_recorder
+
+
+class InstrumentedLLM(LLM):
+    """
+    CrewAI LLM reporting its calls to the active `UsageRecorder`, with a replay store recording
+    or replaying its completions and with a response cache caching the completions of the flow
+    methods and crew tasks opted in to it. The requests reaching the model share the LLM quota
+    throttle of the process, see `get_throttle`.
+
+    CrewAI doesn't return the token usage of a completion, so tokens are counted with
+    LiteLLM's tokenizer for the model, which also works for replayed completions.
+    """
+
+    def __init__(
+        self,
+        replay_store: Optional[ReplayStore] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            replay_store: Recordings, None to always call the model.
+            response_cache: Cached completions, None to not cache any.
+            **kwargs: Arguments of `crewai.LLM`.
+        """
+        super().__init__(**kwargs)
+        self.replay_store = replay_store
+        self.response_cache = response_cache
+
+    def call(
+        self,
+        messages: Union[str, list[dict[str, str]]],
+        tools: Optional[list[dict]] = None,
+        callbacks: Optional[list[Any]] = None,
+        available_functions: Optional[dict[str, Any]] = None,
+    ) -> Union[str, Any]:
+        call = functools.partial(get_throttle(LLM_THROTTLE).call, super().call)
+
+        cache_key = None
+        # completions running tools have side effects, they are never served from the cache
+        if self.response_cache is not None and not tools and self.response_cache.enabled():
+            prompt = messages if isinstance(messages, str) else json.dumps(messages, default=str)
+            cache_key = self.response_cache.key(self.model, prompt, self.temperature)
+            response = self.response_cache.get(cache_key)
+            if response is not None:
+                return response
+
+        if self.replay_store is None:
+            response = call(messages, tools, callbacks, available_functions)
+        else:
+            payload = {
+                "model": self.model,
+                "temperature": self.temperature,
+                "messages": messages,
+                "tools": tools,
+            }
+            response = self.replay_store.call(
+                "crewai_llm", payload, lambda: call(messages, tools, callbacks, available_functions)
+            )
+
+        if cache_key is not None and isinstance(response, str):
+            self.response_cache.put(cache_key, response)
+
+        recorder = current_recorder()
+        if recorder is not None:
+            if isinstance(messages, str):
+                messages = [{"role": "user", "content": messages}]
+            recorder.add_llm_call(
+                litellm.token_counter(model=self.model, messages=messages),
+                litellm.token_counter(model=self.model, text=str(response)),
+            )
+        return response
+
+
+_node_events_registered = False
+
+
+def register_node_events():
+    """
+    Attribute the LLM calls (and BigQuery jobs) of flow methods and crew tasks to them as
+    nodes, see `usage.current_node`, once per process.
+    """
+    global _node_events_registered
+    if _node_events_registered:
+        return
+    from crewai.utilities.events import (
+        MethodExecutionStartedEvent,
+        TaskStartedEvent,
+        crewai_event_bus,
+    )
+
+    # the events are emitted synchronously in the context of the method or task they're about
+    crewai_event_bus.on(MethodExecutionStartedEvent)(
+        lambda source, event: usage.set_node(event.method_name)
+    )
+    crewai_event_bus.on(TaskStartedEvent)(lambda source, event: usage.set_node(source.name))
+    _node_events_registered = True
+
+
+def create_llm(**kwargs) -> LLM:
+    """
+    Args:
+        **kwargs: Arguments of `crewai.LLM`.
+
+    Returns:
+        The LLM, recording or replaying its completions when REPLAY_MODE is set, else caching
+        the completions of the nodes opted in with LLM_CACHE_NODES.
+    """
+    register_node_events()
+    return InstrumentedLLM(get_replay_store(), get_llm_response_cache(), **kwargs)
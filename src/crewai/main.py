@@ -1,20 +1,23 @@
 import signal
 import asyncio
+import importlib
+import json
 import logging
+from typing import Optional
 
 # import openlit
-import weave
-
-from quart import Quart, request, jsonify
-from src.crewai.analyze_sql_flow import SqlAnalysisFlow
-from src.crewai.sql_optimizer_crew import SqlAnalysisCrew
-from src.crewai.reflective_crew import ReflectiveLoopCrew
-from src.crewai.sql_optimizer_planning_crew import SqlAnalysisPlanningCrew
-from src.common.env_setup import setup_aiplatform
+
+from quart import Quart, Response, request, jsonify, stream_with_context
+from src.common import services
+from src.common.env_setup import GCP_PROJECT, BQ_DEFAULT_DATASET
+from src.common.batch import run_batch
+from src.common.budget import budget_scope, get_query_budget
+from src.common.result_cache import get_result_cache, sql_fingerprint
+from src.common.sql_parser import extract_tables
 # from phoenix.otel import register
 
 
-credentials = setup_aiplatform()
+result_cache = get_result_cache()
 app = Quart(__name__)
 logger = logging.getLogger(__name__)
 # openlit.init() - uncomment to use LangFuse instrumentation
@@ -24,7 +27,91 @@ logger = logging.getLogger(__name__)
 #   auto_instrument=True,
 # )
 
-weave.init(project_name="sql-optimizer-crew")
+
+@app.before_serving
+async def startup():
+    # tracing starts with serving, importing the app (e.g. by the benchmark) doesn't start it
+    services.init_weave()
+
+
+async def get_cache_key(sql: str, workflow: str) -> Optional[str]:
+    """Result cache key of the query, None if caching is disabled or not possible."""
+    if result_cache is None:
+        return None
+    try:
+        table_ids = extract_tables(sql, GCP_PROJECT, BQ_DEFAULT_DATASET).tables
+        table_versions = await asyncio.to_thread(
+            services.get_crewai_bq_client().get_table_versions, table_ids
+        )
+    except Exception as e:
+        logger.info(f"Skipping result cache: {e}")
+        return None
+    return sql_fingerprint(sql, table_versions, workflow=workflow)
+
+
+async def run_analysis(sql: str, workflow: str, endpoint: str) -> tuple[dict, bool]:
+    """
+    Args:
+        sql: Query to analyze.
+        workflow: Name of the workflow in `WORKFLOWS`.
+        endpoint: Endpoint serving the request, selects its query budget.
+
+    Returns:
+        The workflow result, served from the result cache if possible, and whether it was.
+        The result's `budget` reports the BigQuery usage of the request against its budget.
+    """
+    with budget_scope(get_query_budget(endpoint)) as budget:
+        result, cached = await _run_analysis(sql, workflow)
+    return {**result, "budget": budget.report()}, cached
+
+
+async def _run_analysis(sql: str, workflow: str) -> tuple[dict, bool]:
+    cache_key = await get_cache_key(sql, workflow)
+    if cache_key:
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached is not None:
+            return cached, True
+
+    result = await WORKFLOWS[workflow](sql)
+    if cache_key:
+        await asyncio.to_thread(result_cache.put, cache_key, result)
+    return result, False
+
+
+async def run_cached(sql: str, workflow: str):
+    """Serve the workflow result from the result cache, or run the workflow and cache it."""
+    result, cached = await run_analysis(sql, workflow, request.endpoint)
+    response = jsonify(result)
+    if cached:
+        response.headers["X-Cache"] = "HIT"
+    return response
+
+
+async def run_flow(sql: str):
+    from src.crewai.analyze_sql_flow import SqlAnalysisFlow
+
+    flow = SqlAnalysisFlow()
+    flow.state["sql"] = sql
+    return await flow.kickoff_async()
+
+
+async def run_crew(module: str, class_name: str, sql: str):
+    # the crews and crewai are imported by the first request using them
+    crew_class = getattr(importlib.import_module(module), class_name)
+    crew_output = await crew_class().crew().kickoff_async(inputs={"sql_query": sql})
+    return json.loads(crew_output.pydantic.json())
+
+
+WORKFLOWS = {
+    "flow": run_flow,
+    "crew": lambda sql: run_crew("src.crewai.sql_optimizer_crew", "SqlAnalysisCrew", sql),
+    "reflective_loop": lambda sql: run_crew(
+        "src.crewai.reflective_crew", "ReflectiveLoopCrew", sql
+    ),
+    "planning": lambda sql: run_crew(
+        "src.crewai.sql_optimizer_planning_crew", "SqlAnalysisPlanningCrew", sql
+    ),
+}
 
 
 @app.route("/analyze", methods=["GET"])
@@ -34,10 +121,7 @@ async def analyze():
         return jsonify({"error": "SQL query cannot be empty!"}), 400
 
     try:
-        flow = SqlAnalysisFlow()
-        flow.state["sql"] = sql.strip()
-        final_output = await flow.kickoff_async()
-        return jsonify(final_output)
+        return await run_cached(sql.strip(), "flow")
     except Exception as e:
         logger.exception(e)
         return jsonify({"error": str(e)}), 400
@@ -49,8 +133,7 @@ async def analyze_crew():
     if not sql or not sql.strip():
         return jsonify({"error": "SQL query cannot be empty!"}), 400
     try:
-        crew_output = await SqlAnalysisCrew().crew().kickoff_async(inputs={"sql_query": sql})
-        return crew_output.pydantic.json()
+        return await run_cached(sql, "crew")
     except Exception as e:
         logger.exception(e)
         return jsonify({"error": str(e)}), 400
@@ -62,8 +145,7 @@ async def analyze_reflective_loop():
     if not sql or not sql.strip():
         return jsonify({"error": "SQL query cannot be empty!"}), 400
     try:
-        crew_output = await ReflectiveLoopCrew().crew().kickoff_async(inputs={"sql_query": sql})
-        return crew_output.pydantic.json()
+        return await run_cached(sql, "reflective_loop")
     except Exception as e:
         logger.exception(e)
         return jsonify({"error": str(e)}), 400
@@ -75,15 +157,40 @@ async def analyze_with_planning():
     if not sql or not sql.strip():
         return jsonify({"error": "SQL query cannot be empty!"}), 400
     try:
-        crew_output = (
-            await SqlAnalysisPlanningCrew().crew().kickoff_async(inputs={"sql_query": sql})
-        )
-        return crew_output.pydantic.json()
+        return await run_cached(sql, "planning")
     except Exception as e:
         logger.exception(e)
         return jsonify({"error": str(e)}), 400
 
 
+@app.route("/analyze/batch", methods=["POST"])
+async def analyze_batch():
+    """
+    Analyze the JSONL queries of the request body and stream NDJSON results.
+
+    The `workflow` query parameter (default "flow") selects the workflow, a batch line can
+    override it with its own `workflow` key.
+    """
+    default_workflow = request.args.get("workflow", "flow")
+    endpoint = request.endpoint
+    if default_workflow not in WORKFLOWS:
+        return jsonify({"error": f"Unknown workflow, use one of {list(WORKFLOWS)}"}), 400
+
+    async def analyze_item(item: dict) -> dict:
+        workflow = item.get("workflow", default_workflow)
+        if workflow not in WORKFLOWS:
+            return {"error": f"Unknown workflow {workflow}"}
+        result, cached = await run_analysis(item["sql"].strip(), workflow, endpoint)
+        return {"workflow": workflow, "result": result, "cached": cached}
+
+    @stream_with_context
+    async def stream():
+        async for line in run_batch(request.body, analyze_item):
+            yield line
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+
 async def shutdown(loop, signal=None):
     """Cleanup tasks tied to the application's shutdown."""
     if signal:
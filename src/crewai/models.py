@@ -1,8 +1,10 @@
 from typing_extensions import TypedDict
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from dataclasses import dataclass
 
+from src.common.models import Antipattern, ProposedImprovement, QuerySuggestions
+
 
 class ColumnInfo(BaseModel):
     column_name: str
@@ -18,6 +20,9 @@ class SchemaInfo(BaseModel):
     columns: list[ColumnInfo]
     row_count: Optional[int] = None
     size_bytes: Optional[int] = None
+    last_modified: Optional[str] = None
+    partition_column: Optional[str] = None
+    clustering_columns: list[str] = []
 
 
 class QueryInfo(BaseModel):
@@ -40,17 +45,22 @@ class QueryStats(BaseModel):
     cache_hit: bool
     num_dml_affected_rows: int
     sql: str
-
-
-class Antipattern(BaseModel):
-    """Represents a single identified SQL antipattern."""
-
-    code: str
-    name: str
-    description: str
-    impact: str
-    location: str
-    suggestion: str
+    dry_run: bool = False
+    referenced_tables: list[str] = []
+    error: Optional[str] = None
+    server_time_seconds: Optional[float] = None
+    slot_millis: Optional[int] = None
+    shuffle_output_bytes: Optional[int] = None
+    shuffle_output_bytes_spilled: Optional[int] = None
+    # per-stage plan, kept out of serialized stats (and so out of LLM context) for its size
+    query_plan: list[dict] = Field(default=[], exclude=True)
+    plan_summary: Optional[str] = None
+    # summary and samples per metric when the query was run several times
+    trials: Optional[dict[str, dict]] = None
+    # significance of the timing difference to the original query
+    comparison: Optional[dict] = None
+    # whether the query returns the same rows as the original query
+    equivalence: Optional[dict] = None
 
 
 class QueryAnalysis(BaseModel):
@@ -63,23 +73,6 @@ class QueryAnalysis(BaseModel):
     antipatterns: list[Antipattern]
 
 
-class ProposedImprovement(BaseModel):
-    """A single proposed improvement to the original query."""
-
-    improved_sql: str
-    rationale: str
-
-
-class QuerySuggestions(BaseModel):
-    """
-    Contains the original SQL plus multiple ProposedImprovements.
-    Each improvement is a candidate new query plus rationale.
-    """
-
-    original_sql: str
-    improvements: list[ProposedImprovement]
-
-
 class EvaluationSnapshot(BaseModel):
     """All artefacts from one round."""
 
@@ -103,6 +96,11 @@ class ImprovementsAnalysis(BaseModel):
 
     improvements: list[ProposedImprovement]
     execution_stats: list[QueryStats]
+    # scores relative to the original query (1.0), the candidate indexes from best to worst
+    # and the indexes which aren't beaten on both bytes billed and latency
+    scores: list[float] = []
+    ranking: list[int] = []
+    pareto_front: list[int] = []
 
 
 class BestQueryChoice(BaseModel):
@@ -1,18 +1,15 @@
-import os
-import json
-
 from src.crewai.models import (
     QueryStats,
     EvaluationSnapshot,
     ReflectionDecision,
     QuerySuggestions,
     BestQueryChoice,
-    ImprovementsAnalysis,
 )
+from src.common import services
 from src.crewai.bq_client import BigQueryClient
-from src.common.env_setup import GCP_PROJECT, setup_aiplatform
+from src.crewai.benchmark_task import BenchmarkCandidatesTask
 from src.crewai.tools import sql_tools
-from crewai import Agent, Crew, Task, Process, LLM
+from crewai import Agent, Crew, Task, Process
 from crewai.project import CrewBase, agent, task, crew
 
 
@@ -20,18 +17,20 @@ from crewai.project import CrewBase, agent, task, crew
 class ReflectiveLoopCrew:
     agents_config = "config/agents.yaml"
     tasks_config = "config/reflective_loop.yaml"
+
     # llm = LLM(
     #     model="openai/gpt-4o",
     #     temperature=0.1,
     # )
-    llm = LLM(
-        model="gemini/gemini-2.0-flash",
-        temperature=0.1,
-        vertex_credentials=json.loads(os.getenv("GOOGLE_APPLICATION_CREDENTIALS")),
-    )
-    bq_client: BigQueryClient = BigQueryClient(
-        project_id=GCP_PROJECT, credentials=setup_aiplatform()
-    )
+
+    # the clients are shared by the crews, created on first use rather than on import
+    @property
+    def llm(self):
+        return services.get_crewai_llm(temperature=0.1)
+
+    @property
+    def bq_client(self) -> BigQueryClient:
+        return services.get_crewai_bq_client()
 
     @agent
     def sql_developer(self) -> Agent:
@@ -57,9 +56,10 @@ class ReflectiveLoopCrew:
 
     @task
     def benchmark_improvements_round(self) -> Task:
-        return Task(
+        # benchmarks the previous task's QuerySuggestions in Python, without an LLM turn
+        return BenchmarkCandidatesTask(
+            self.bq_client,
             config=self.tasks_config["benchmark_improvements_round"],
-            output_pydantic=ImprovementsAnalysis,
         )
 
     @task
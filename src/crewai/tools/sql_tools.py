@@ -1,11 +1,14 @@
-import weave
-
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
 
 from src.crewai.bq_client import BigQueryClient
 from src.crewai.models import QueryStats, SchemaInfo
-from src.common.env_setup import GCP_PROJECT
+from src.common.env_setup import (
+    GCP_PROJECT,
+    BQ_BENCHMARK_TRIALS,
+    BQ_BENCHMARK_WARMUP,
+    BQ_DRY_RUN_SCORING,
+)
 from typing import Type
 from pydantic import PrivateAttr
 
@@ -14,6 +17,11 @@ class QueryInput(BaseModel):
     """Input schema for a SQL query execution via BigQuery client."""
 
     sql: str = Field(description="String containing valid BigQuery SQL query.")
+    dry_run: bool = Field(
+        default=BQ_DRY_RUN_SCORING,
+        description="Only validate the query and estimate the bytes it would process, without"
+        " running it. Set to false only when actual execution stats are requested.",
+    )
 
 
 class TableMetadataInput(BaseModel):
@@ -28,6 +36,7 @@ class QueryTool(BaseTool):
     description: str = (
         "This tool executes a given sql query using a pre-initialized and authenticated"
         " BigQuery client, waits for the query job to finish and returns the query job stats."
+        " In dry run mode the query is only validated and its processed bytes are estimated."
     )
     args_schema: Type[BaseModel] = QueryInput
     _bq_client: BigQueryClient = PrivateAttr()
@@ -39,8 +48,10 @@ class QueryTool(BaseTool):
     # @weave.op(name="metadata-tool") annotating internal part of the
     # tool execution enables to trace all tool calling attempts correctly
     # typically it is not done out of the box by observability frameworks.
-    def _run(self, sql: str) -> QueryStats:
-        return self._bq_client.get_sql_query_stats(sql)
+    def _run(self, sql: str, dry_run: bool = BQ_DRY_RUN_SCORING) -> QueryStats:
+        return self._bq_client.get_sql_query_stats(
+            sql, dry_run=dry_run, trials=BQ_BENCHMARK_TRIALS, warmup=BQ_BENCHMARK_WARMUP
+        )
 
 
 class MetadataTool(BaseTool):
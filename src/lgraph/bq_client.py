@@ -1,31 +1,52 @@
+from google.api_core.exceptions import GoogleAPICallError
 from google.cloud import bigquery
+import asyncio
+import os
 import time
+from typing import Optional
+from src.common.bq_executor import AsyncJobExecutor, get_job_executor
+from src.common.bq_pool import get_bq_client_pool
+from src.common.metadata_cache import get_table_metadata_cache
+from src.common.query_plan import plan_statistics
+from src.common.replay import replay_client
+from src.common.schema_context import partition_column
+from src.common.scoring import evaluate_query
+from src.common.usage import UsageClient
+from src.common.trials import aggregate_trials, job_timings
 from src.lgraph.models import ColumnInfo, SchemaInfo
 import logging
-from langchain.tools import Tool
 
 logger = logging.getLogger(__name__)
 
 
 class BigQueryClient:
-    def __init__(self, project_id: str, credentials=None):
+    def __init__(
+        self, project_id: str, credentials=None, executor: Optional[AsyncJobExecutor] = None
+    ):
         """
         Initialize the BigQuery client.
         Args:
             project_id: Google Cloud project ID.
+            executor: Job executor, defaults to the process-wide one.
         """
-        self.client = bigquery.Client(project=project_id, credentials=credentials)
+        self.project_id = project_id
+        self.credentials = credentials
+        self.executor = executor or get_job_executor()
+        self.metadata_cache = get_table_metadata_cache("lgraph")
+
+    @property
+    def client(self) -> bigquery.Client:
+        # created on first use, a replayed client never connects to BigQuery
+        return get_bq_client_pool().get(self.project_id, self.credentials)
 
     async def execute_sql_query(self, sql: str) -> dict:
         job_config = bigquery.QueryJobConfig()
         job_config.use_query_cache = False
         start_time = time.time()
 
-        query_job = self.client.query(sql, job_config=job_config)
-        query_job.result()  # Ensures the query completes before proceeding
+        job = await self.executor.run(self.client, sql, job_config=job_config)
 
         end_time = time.time()
-        job = self.client.get_job(query_job.job_id)
 
         # Extract job metadata safely
         metadata = {
@@ -41,21 +62,116 @@ class BigQueryClient:
             "num_dml_affected_rows": job.num_dml_affected_rows
             if job.num_dml_affected_rows is not None
             else 0,
+            "dry_run": False,
             "sql": sql,
+            **job_timings(job),
+            **plan_statistics(job),
         }
         return metadata
 
+    async def benchmark_sql_query(self, sql: str, trials: int, warmup: int = 0) -> dict:
+        """
+        Run a query repeatedly and summarize its server-side timings.
+
+        The runs are sequential, concurrent runs of the same query would compete for slots.
+
+        Args:
+            sql: BigQuery SQL to run.
+            trials: Number of measured runs.
+            warmup: Number of runs before the measured ones, their stats are discarded.
+
+        Returns:
+            The metadata of `execute_sql_query` with median timings and a `trials` summary.
+        """
+        for _ in range(warmup):
+            await self.execute_sql_query(sql)
+        runs = [await self.execute_sql_query(sql) for _ in range(trials)]
+        return aggregate_trials(runs)
+
+    async def query_single_row(self, sql: str) -> dict:
+        """
+        Run a query returning a single row, like an aggregate, using the query cache.
+
+        Args:
+            sql: BigQuery SQL to run.
+
+        Returns:
+            The row as a dict, empty if the query returned no rows.
+        """
+        job = await self.executor.run(self.client, sql, job_config=bigquery.QueryJobConfig())
+        rows = await asyncio.to_thread(lambda: [dict(row.items()) for row in job.result()])
+        return rows[0] if rows else {}
+
+    async def dry_run_sql_query(self, sql: str) -> dict:
+        """
+        Validate a query and estimate its cost without executing it.
+
+        Args:
+            sql: BigQuery SQL to validate.
+
+        Returns:
+            A metadata dict with the same keys as `execute_sql_query`, plus the
+            referenced tables and the validation error (if the query is invalid).
+        """
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        metadata = {
+            "total_bytes_processed": 0,
+            "total_bytes_billed": 0,
+            "billing_tier": 0,
+            "execution_time_seconds": 0.0,
+            "cache_hit": False,
+            "num_dml_affected_rows": 0,
+            "dry_run": True,
+            "referenced_tables": [],
+            "error": None,
+            "sql": sql,
+        }
+        try:
+            job = await self.executor.run(self.client, sql, job_config=job_config)
+        except GoogleAPICallError as e:
+            logger.info(f"Dry run failed: {e.message}")
+            metadata["error"] = e.message
+            return metadata
+
+        # a dry run bills nothing, the estimate is the best proxy for what a real run would bill
+        metadata["total_bytes_processed"] = job.total_bytes_processed or 0
+        metadata["total_bytes_billed"] = job.total_bytes_processed or 0
+        metadata["referenced_tables"] = [
+            f"{ref.project}.{ref.dataset_id}.{ref.table_id}" for ref in job.referenced_tables
+        ]
+        return metadata
+
     async def get_table_metadata(self, table_id: str) -> SchemaInfo:
         """
         Get metadata about a BigQuery table, formatted as a SchemaInfo object.
 
+        Results are served from the process-wide metadata cache.
+
         Args:
             table_id: The ID of the table in the format "dataset.table_name".
 
         Returns:
             A SchemaInfo object containing the table schema and storage information.
         """
-        table = self.client.get_table(table_id)  # Make an API request.
+        ref = bigquery.TableReference.from_string(table_id, default_project=self.client.project)
+        return await self.metadata_cache.aget(
+            f"{ref.project}.{ref.dataset_id}.{ref.table_id}",
+            lambda: self._fetch_table_metadata(ref),
+        )
+
+    async def get_table_versions(self, table_ids: list[str]) -> dict[str, Optional[str]]:
+        """
+        Args:
+            table_ids: IDs of the tables in the format "project.dataset.table_name".
+
+        Returns:
+            The `last_modified` timestamp of every table, served from the metadata cache.
+        """
+        tables = await asyncio.gather(*(self.get_table_metadata(t) for t in table_ids))
+        return {t: info["last_modified"] for t, info in zip(table_ids, tables, strict=True)}
+
+    def _fetch_table_metadata(self, ref: bigquery.TableReference) -> SchemaInfo:
+        table = self.client.get_table(ref)  # Make an API request.
 
         columns = []
         for field in table.schema:
@@ -66,26 +182,46 @@ class BigQueryClient:
             columns.append(column_info)
 
         schema_info = SchemaInfo(
-            table_name=table_id,
+            # the cache is shared by every spelling of the table ID, store the qualified one
+            table_name=f"{ref.project}.{ref.dataset_id}.{ref.table_id}",
             columns=columns,
             row_count=table.num_rows,
             size_bytes=table.num_bytes,
+            last_modified=table.modified.isoformat() if table.modified else None,
+            partition_column=partition_column(table),
+            clustering_columns=table.clustering_fields,
         )
 
         return schema_info
 
-    def evaluate_query(self, results: dict) -> dict:
-        score = 0
-        weights = {
-            "execution_time_seconds": 0.40,
-            "total_bytes_processed": 0.30,
-            "total_bytes_billed": 0.15,
-            "cache_hit": 0.10,
-            "num_dml_affected_rows": 0.05,
-        }
-        score += (1 / (1 + results["execution_time_seconds"])) * weights["execution_time_seconds"]
-        score += (1 / (1 + results["total_bytes_processed"])) * weights["total_bytes_processed"]
-        score += (1 / (1 + results["total_bytes_billed"])) * weights["total_bytes_billed"]
-        score += (1 if results["cache_hit"] else 0) * weights["cache_hit"]
-        score += (results["num_dml_affected_rows"] / 1000) * weights["num_dml_affected_rows"]
-        return {"score": score, "metadata": results}
+    def evaluate_query(self, results: dict, baseline: Optional[dict] = None) -> dict:
+        """Score of the query results relative to the original query's `baseline` results."""
+        return evaluate_query(results, baseline)
+
+    async def cancel_all(self):
+        """Request cancellation of every running job, e.g. on application shutdown."""
+        await self.executor.cancel_all()
+
+
+def create_bq_client(project_id: str, credentials=None):
+    """
+    Client of the SQL backend selected by the SQL_BACKEND environment variable.
+
+    Args:
+        project_id: Google Cloud project ID.
+
+    Returns:
+        A `BigQueryClient`, or with `SQL_BACKEND=duckdb` a `DuckDBClient` running the queries
+        against the local fixtures in DUCKDB_FIXTURES_DIR. With REPLAY_MODE set the client's
+        calls are recorded or replayed. The BigQuery usage is reported to the active
+        `UsageRecorder`.
+    """
+    from src.common.env_setup import SQL_BACKEND
+
+    if SQL_BACKEND == "duckdb":
+        from src.lgraph.duckdb_client import DuckDBClient
+
+        client = DuckDBClient()
+    else:
+        client = BigQueryClient(project_id=project_id, credentials=credentials)
+    return UsageClient(replay_client(client))
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Optional
+
+from src.common.duckdb_backend import DuckDBBackend, get_duckdb_backend
+from src.common.scoring import evaluate_query
+from src.common.trials import aggregate_trials
+from src.lgraph.models import ColumnInfo, SchemaInfo
+
+logger = logging.getLogger(__name__)
+
+
+class DuckDBClient:
+    """
+    Local stand-in for `BigQueryClient`, running queries against DuckDB/Parquet fixtures.
+
+    Selected with `SQL_BACKEND=duckdb`, see `create_bq_client`.
+    """
+
+    def __init__(self, backend: Optional[DuckDBBackend] = None):
+        """
+        Args:
+            backend: DuckDB backend, defaults to the process-wide one.
+        """
+        self.backend = backend or get_duckdb_backend()
+
+    async def execute_sql_query(self, sql: str) -> dict:
+        return await asyncio.to_thread(self.backend.execute, sql)
+
+    async def benchmark_sql_query(self, sql: str, trials: int, warmup: int = 0) -> dict:
+        """Run a query repeatedly, like `BigQueryClient.benchmark_sql_query`."""
+        for _ in range(warmup):
+            await self.execute_sql_query(sql)
+        runs = [await self.execute_sql_query(sql) for _ in range(trials)]
+        return aggregate_trials(runs)
+
+    async def query_single_row(self, sql: str) -> dict:
+        rows = await asyncio.to_thread(self.backend.query_rows, sql)
+        return rows[0] if rows else {}
+
+    async def dry_run_sql_query(self, sql: str) -> dict:
+        return await asyncio.to_thread(self.backend.dry_run, sql)
+
+    async def get_table_metadata(self, table_id: str) -> SchemaInfo:
+        metadata = await asyncio.to_thread(self.backend.table_metadata, table_id)
+        return SchemaInfo(
+            table_name=table_id,
+            columns=[ColumnInfo(**column) for column in metadata["columns"]],
+            row_count=metadata["row_count"],
+            size_bytes=metadata["size_bytes"],
+            last_modified=metadata["last_modified"],
+        )
+
+    async def get_table_versions(self, table_ids: list[str]) -> dict[str, Optional[str]]:
+        tables = await asyncio.gather(*(self.get_table_metadata(t) for t in table_ids))
+        return {t: info["last_modified"] for t, info in zip(table_ids, tables, strict=True)}
+
+    async def cancel_all(self):
+        """Local queries aren't cancelled, they finish in the worker threads."""
+
+    def evaluate_query(self, results: dict, baseline: Optional[dict] = None) -> dict:
+        """Score of the query results relative to the original query's `baseline` results."""
+        return evaluate_query(results, baseline)
@@ -1,57 +1,94 @@
 from src.common.env_setup import *
 from src.lgraph.sql_analyzer import *
-from src.lgraph.bq_client import BigQueryClient
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import RetryPolicy
 from src.lgraph.models import SqlImprovementState
+from src.common import services
+from src.common.batch import run_batch
+from src.common.bq_executor import get_job_executor
+from src.common.budget import budget_scope, get_query_budget
+from src.common.result_cache import get_result_cache, sql_fingerprint
+from src.common.streaming import format_sse, stream_graph_updates
+from src.common.sql_parser import extract_tables
 import base64
-from quart import Quart, render_template, request, jsonify
+from quart import Quart, Response, render_template, request, jsonify, stream_with_context
 import asyncio
 import signal
-from langfuse.callback import CallbackHandler
 
-credentials = setup_aiplatform()
 logger = logging.getLogger(__name__)
-langfuse_callback = setup_langfuse_callback()
-llm = create_llm(callbacks=[langfuse_callback])
-bq_client = BigQueryClient(project_id=GCP_PROJECT, credentials=credentials)
-sql_analyzer = SqlAnalyzer(llm, bq_client)
+result_cache = get_result_cache()
 app = Quart(__name__)
 
 
-workflow = StateGraph(SqlImprovementState)
-workflow.add_node("verify_sql", sql_analyzer.verify_and_run_original_sql)
-workflow.add_node("identify_tables", sql_analyzer.get_table_info)
-workflow.add_node("find_antipatterns", sql_analyzer.generate_info)
-workflow.add_node("previous_optimizatons", sql_analyzer.get_previous_optimizations)
-workflow.add_node("suggestions", sql_analyzer.get_suggestions)
-workflow.add_node("optimize", sql_analyzer.get_optimized_query)
-workflow.add_node("verify_optimized_sql", sql_analyzer.verify_and_run_optimized_sql)
-
-workflow.add_edge(START, "verify_sql")
-workflow.add_edge("verify_sql", "identify_tables")
-workflow.add_edge("identify_tables", "find_antipatterns")
-workflow.add_edge(
-    "find_antipatterns", "previous_optimizatons"
-)  # use search for similar previous usecases
-workflow.add_edge("find_antipatterns", "suggestions")
-workflow.add_edge("suggestions", "optimize")
-workflow.add_edge("previous_optimizatons", "optimize")
-workflow.add_edge("optimize", "verify_optimized_sql")  # use tools to verify the performance
-workflow.add_conditional_edges(
-    "verify_optimized_sql",
-    sql_analyzer.llm_router,
-    {"Continue": "find_antipatterns", "Finish": END},
-)
-
-app.chain = workflow.compile().with_config({"callbacks": [langfuse_callback]})
-app.chain.retry_policy = RetryPolicy()
+def build_workflow(sql_analyzer: SqlAnalyzer) -> StateGraph:
+    workflow = StateGraph(SqlImprovementState)
+    workflow.add_node("verify_sql", sql_analyzer.verify_and_run_original_sql)
+    workflow.add_node("identify_tables", sql_analyzer.get_table_info)
+    workflow.add_node("previous_optimizatons", sql_analyzer.get_previous_optimizations)
+    workflow.add_node("verify_optimized_sql", sql_analyzer.verify_and_run_optimized_sql)
+
+    # running the original query, fetching the table schemas and finding antipatterns are
+    # independent, so they run concurrently and join before the LLM suggests optimizations
+    analysis_nodes = ["verify_sql", "identify_tables", "previous_optimizatons"]
+    if FUSED_ANALYSIS:
+        # one structured LLM call finds antipatterns, suggests and optimizes, it needs the tables
+        workflow.add_node("analyze", sql_analyzer.fused_analysis)
+        join_node, loop_node = "analyze", "analyze"
+        workflow.add_edge("analyze", "verify_optimized_sql")
+    else:
+        workflow.add_node("find_antipatterns", sql_analyzer.generate_info)
+        workflow.add_node("reanalyze", sql_analyzer.generate_info)
+        workflow.add_node("suggestions", sql_analyzer.get_suggestions)
+        workflow.add_node("optimize", sql_analyzer.get_optimized_query)
+        analysis_nodes.append("find_antipatterns")
+        join_node, loop_node = "suggestions", "reanalyze"
+        workflow.add_edge("suggestions", "optimize")
+        workflow.add_edge("optimize", "verify_optimized_sql")  # use tools to verify the performance
+        # another iteration only repeats the antipattern analysis, the join would wait forever
+        workflow.add_edge("reanalyze", "suggestions")
+    for node in analysis_nodes:
+        workflow.add_edge(START, node)
+    workflow.add_edge(analysis_nodes, join_node)
+    workflow.add_conditional_edges(
+        "verify_optimized_sql",
+        sql_analyzer.llm_router,
+        {"Continue": loop_node, "Finish": END},
+    )
+    return workflow
+
+
+_chain = None
+
+
+def get_chain():
+    """Compiled workflow, built with the shared clients on first use rather than on import."""
+    global _chain
+    if _chain is None:
+        sql_analyzer = SqlAnalyzer(services.get_lgraph_llm(), services.get_lgraph_bq_client())
+        _chain = (
+            build_workflow(sql_analyzer)
+            .compile()
+            .with_config({"callbacks": [services.get_langfuse_callback()]})
+        )
+    return _chain
+
+
+async def get_cache_key(sql: str) -> Optional[str]:
+    """Result cache key of the query, None if caching is disabled or not possible."""
+    if result_cache is None:
+        return None
+    try:
+        table_ids = extract_tables(sql, GCP_PROJECT, BQ_DEFAULT_DATASET).tables
+        table_versions = await services.get_lgraph_bq_client().get_table_versions(table_ids)
+    except Exception as e:
+        logger.info(f"Skipping result cache: {e}")
+        return None
+    return sql_fingerprint(sql, table_versions, workflow="lgraph")
 
 
 @app.route("/", methods=["GET", "POST"])
 async def index():
     try:
-        graph_image = app.chain.get_graph().draw_mermaid_png()
+        graph_image = get_chain().get_graph().draw_mermaid_png()
         image_base64 = base64.b64encode(graph_image).decode("utf-8")
     except Exception as e:
         logging.info(f"Error while generating graph: {e}")
@@ -59,35 +96,123 @@ async def index():
     return await render_template("index.html", image_base64=image_base64)
 
 
+RUN_CONFIG = {
+    "metadata": {
+        "langfuse_user_id": "user-id",
+        "langfuse_session_id": "your-session-id",
+    }
+}
+
+
+async def run_analysis(sql: str, endpoint: str) -> tuple[dict, bool]:
+    """
+    Args:
+        sql: Query to analyze.
+        endpoint: Endpoint serving the request, selects its query budget.
+
+    Returns:
+        The final graph state, served from the result cache if possible, and whether it was.
+        The state's `budget` reports the BigQuery usage of the request against its budget.
+    """
+    with budget_scope(get_query_budget(endpoint)) as budget:
+        state, cached = await _run_analysis(sql)
+    return {**state, "budget": budget.report()}, cached
+
+
+async def _run_analysis(sql: str) -> tuple[dict, bool]:
+    cache_key = await get_cache_key(sql)
+    if cache_key:
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached is not None:
+            return cached, True
+
+    state = await get_chain().ainvoke(SqlImprovementState(sql=sql), config=RUN_CONFIG)
+    if cache_key and "error" not in state:
+        await asyncio.to_thread(result_cache.put, cache_key, state)
+    return state, False
+
+
 @app.route("/analyze", methods=["GET"])
 async def analyze():
     sql = request.args.get("sql")
     if not sql or not sql.strip():
         return jsonify({"error": "SQL query cannot be empty!"}), 400
 
-    sql = SqlImprovementState(sql=sql.strip())
     try:
-        state = await app.chain.ainvoke(
-            sql,
-            config={
-                "metadata": {
-                    "langfuse_user_id": "user-id",
-                    "langfuse_session_id": "your-session-id",
-                }
-            },
-        )
+        state, cached = await run_analysis(sql.strip(), request.endpoint)
         if "error" in state:
             return jsonify(state), 400
-        return jsonify(state)
+        response = jsonify(state)
+        if cached:
+            response.headers["X-Cache"] = "HIT"
+        return response
     except Exception as e:
         return jsonify({"error": f"{e}"}), 400
 
 
+@app.route("/analyze/batch", methods=["POST"])
+async def analyze_batch():
+    """Analyze the JSONL queries of the request body and stream NDJSON results."""
+    endpoint = request.endpoint
+
+    async def analyze_item(item: dict) -> dict:
+        state, cached = await run_analysis(item["sql"].strip(), endpoint)
+        if "error" in state:
+            return {"error": state["error"], "result": state}
+        return {"result": state, "cached": cached}
+
+    @stream_with_context
+    async def stream():
+        async for line in run_batch(request.body, analyze_item):
+            yield line
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+
+@app.route("/analyze/stream", methods=["GET"])
+async def analyze_stream():
+    """
+    Stream every node's state update as a server-sent event, then the final state and the
+    request's query `budget` report.
+    """
+    sql = request.args.get("sql")
+    if not sql or not sql.strip():
+        return jsonify({"error": "SQL query cannot be empty!"}), 400
+    sql = sql.strip()
+    budget = get_query_budget(request.endpoint)
+
+    cache_key = await get_cache_key(sql)
+    cached = await asyncio.to_thread(result_cache.get, cache_key) if cache_key else None
+
+    async def cache_result(state: dict):
+        if cache_key:
+            await asyncio.to_thread(result_cache.put, cache_key, state)
+
+    async def stream():
+        if cached is not None:
+            yield format_sse(cached, event="result")
+            return
+        with budget_scope(budget) as tracker:
+            async for event in stream_graph_updates(
+                get_chain(), SqlImprovementState(sql=sql), RUN_CONFIG, on_complete=cache_result
+            ):
+                yield event
+        yield format_sse(tracker.report(), event="budget")
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let proxies hold events back
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+    return response
+
+
 async def shutdown(loop, signal=None):
     """Cleanup tasks tied to the application's shutdown."""
     if signal:
         logging.info(f"Received exit signal {signal.name}...")
     logging.info("Performing cleanup tasks...")
+    await get_job_executor().cancel_all()
     logging.info("Asyncio event loop stopped")
     tasks = [t for t in asyncio.all_tasks(loop=loop) if t is not asyncio.current_task()]
     [task.cancel() for task in asyncio.as_completed(tasks)]
@@ -1,35 +1,76 @@
 from src.common.env_setup import *
 from src.lgraph.sql_analyzer import *
-from src.lgraph.bq_client import BigQueryClient
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import RetryPolicy
 from src.lgraph.models import SqlImprovementState
+from src.common import services
+from src.common.batch import run_batch
+from src.common.bq_executor import get_job_executor
+from src.common.budget import (
+    BudgetExceededError,
+    budget_scope,
+    get_query_budget,
+    rejected_results,
+)
+from src.common.result_cache import get_result_cache, sql_fingerprint
+from src.common.streaming import format_sse, stream_graph_updates
+from src.common.sql_parser import SqlParseError, extract_tables
+from src.common.antipattern_detector import detect_static_antipatterns
+from src.common.context_cache import ainvoke_prompt
+from src.common.equivalence import equivalence_note, measure_with_equivalence
+from src.common.trials import significance_note
+from src.lgraph.sql_analyzer import original_plan_summary
 import base64
-from quart import Quart, render_template, request, jsonify
+from quart import Quart, Response, render_template, request, jsonify, stream_with_context
 import asyncio
 import signal
-from langfuse.callback import CallbackHandler
 from langchain.tools import Tool
+from typing import Awaitable
 from typing_extensions import Literal
 from langgraph.types import Command
 
 
-credentials = setup_aiplatform()
 logger = logging.getLogger(__name__)
-langfuse_callback = setup_langfuse_callback()
-llm = create_llm(callbacks=[langfuse_callback])
-bq_client = BigQueryClient(project_id=GCP_PROJECT, credentials=credentials)
-sql_analyzer = SqlAnalyzer(llm, bq_client)
+result_cache = get_result_cache()
 app = Quart(__name__)
 
 
-async def query_run_and_stats(table_id: str):
-    return bq_client.evaluate_query(await bq_client.execute_sql_query(table_id))
+async def query_run_and_stats(sql: str):
+    bq_client = services.get_lgraph_bq_client()
+    try:
+        if BQ_DRY_RUN_SCORING:
+            results = await bq_client.dry_run_sql_query(sql)
+        elif BQ_BENCHMARK_TRIALS > 1:
+            results = await bq_client.benchmark_sql_query(
+                sql, BQ_BENCHMARK_TRIALS, BQ_BENCHMARK_WARMUP
+            )
+        else:
+            results = await bq_client.execute_sql_query(sql)
+    except BudgetExceededError as e:
+        # an over budget query is scored 0, the other tool calls of the round still count
+        logger.info(f"Query rejected: {e}")
+        results = rejected_results(sql, e, BQ_DRY_RUN_SCORING)
+    return bq_client.evaluate_query(results)
+
+
+async def measure_and_verify(measurement: Awaitable, state: SqlImprovementState) -> tuple:
+    """
+    Await a measurement while the result equivalence of the optimized and the original query
+    is checked, the verdict is None if not checked.
+    """
+    if not VERIFY_EQUIVALENCE or BQ_DRY_RUN_SCORING or not state.get("optimized_sql"):
+        return await measurement, None
+    return await measure_with_equivalence(
+        measurement, services.get_lgraph_bq_client(), state["sql"], state["optimized_sql"]
+    )
+
+
+async def get_table_metadata(table_id: str) -> SchemaInfo:
+    return await services.get_lgraph_bq_client().get_table_metadata(table_id)
 
 
 table_metadata_tool = Tool.from_function(
-    coroutine=bq_client.get_table_metadata,
-    func=bq_client.get_table_metadata,
+    coroutine=get_table_metadata,
+    func=get_table_metadata,
     name="get_table_metadata",
     description="Fetch BigQuery table schema and stats.",
 )
@@ -38,7 +79,7 @@ query_run_and_stats_tool = Tool.from_function(
     coroutine=query_run_and_stats,
     func=query_run_and_stats,
     name="query_run_and_stats",
-    description="Run the BigQuery sql and calculates the stats",
+    description="Run (or dry run, if configured) the BigQuery sql and calculates the stats",
 )
 
 
@@ -54,9 +95,17 @@ async def planner_agent(
         optimized_score = state.get("optimized_sql_res", {}).get("score", 0)
         optimized_sql = state.get("optimized_sql", "")
         original_sql = state.get("sql", "")
+        significance = significance_note(
+            state.get("sql_res", {}).get("metadata"),
+            state.get("optimized_sql_res", {}).get("metadata"),
+        )
+        equivalence = equivalence_note(state.get("optimized_sql_res", {}).get("metadata"))
         previous_optimization = f"""
         The original SQL had a performance score of {original_score:.3f}.
         The optimized SQL has a performance score of {optimized_score:.3f}.
+        Scores are relative to the original SQL (1.0), 2.0 means twice as cheap and fast.
+        {significance}
+        {equivalence}
 
         Original SQL:
         {original_sql}
@@ -87,7 +136,7 @@ async def planner_agent(
     If you see an optimized query where score is higher then original - go directly to option 1).
     Answer:
     """
-    msg = await llm.ainvoke(planner_agent_prompt)
+    msg = await services.get_lgraph_llm().ainvoke(planner_agent_prompt)
     choice = msg.content.strip().lower().split(",")
     return Command(goto="plan_exectution_agent", update={"exectution_plan": choice})
 
@@ -100,7 +149,7 @@ async def plan_exectution_agent(
     logger.info(commands)
 
     if next_command == "__end__":
-        model_with_tools = llm.bind_tools([query_run_and_stats_tool])
+        model_with_tools = services.get_lgraph_llm().bind_tools([query_run_and_stats_tool])
         prompt = f"""
         Decide which query is better, evaluate the origial query (sql) and suggested query (optimized_sql) using stats in the following order sql, optimized_sql.
         sql:
@@ -113,8 +162,12 @@ async def plan_exectution_agent(
         update = {"attempt": state["attempt"] + 1, "exectution_plan": []}
 
         if msg.tool_calls:
-            stats = await asyncio.gather(
-                *(query_run_and_stats_tool.ainvoke(tool_call) for tool_call in msg.tool_calls)
+            # the equivalence gate runs next to the performance measurement
+            stats, equivalence = await measure_and_verify(
+                asyncio.gather(
+                    *(query_run_and_stats_tool.ainvoke(tool_call) for tool_call in msg.tool_calls)
+                ),
+                state,
             )
             for stat in stats:
                 logger.info(stat.content)
@@ -123,6 +176,13 @@ async def plan_exectution_agent(
                     update["sql_res"] = s
                 else:
                     update["optimized_sql_res"] = s
+            # the tool scores every query on its own, the optimized one has to be rescored
+            # relative to the original
+            baseline = (update.get("sql_res") or state.get("sql_res") or {}).get("metadata")
+            if "optimized_sql_res" in update and baseline:
+                results = {**update["optimized_sql_res"]["metadata"], "equivalence": equivalence}
+                bq_client = services.get_lgraph_bq_client()
+                update["optimized_sql_res"] = bq_client.evaluate_query(results, baseline)
 
         return Command(goto="planner_agent", update=update)
     else:
@@ -130,7 +190,14 @@ async def plan_exectution_agent(
 
 
 async def get_table_info(state: SqlImprovementState) -> Command[Literal["plan_exectution_agent"]]:
-    model_with_tools = llm.bind_tools([table_metadata_tool])
+    try:
+        table_ids = extract_tables(state["sql"], GCP_PROJECT, BQ_DEFAULT_DATASET).tables
+        tables = await asyncio.gather(*(get_table_metadata(t) for t in table_ids))
+        return Command(goto="plan_exectution_agent", update={"tables": list(tables)})
+    except SqlParseError as e:
+        logger.info(f"Falling back to LLM table extraction: {e}")
+
+    model_with_tools = services.get_lgraph_llm().bind_tools([table_metadata_tool])
     prompt = f"""
         Extract all table names from the following SQL query and Fetch BigQuery table schema & stats.
         Return the fully-qualified table names in the format 'project.dataset.table_id' as a comma-separated list and apply corresponding tools.
@@ -148,26 +215,18 @@ async def get_table_info(state: SqlImprovementState) -> Command[Literal["plan_ex
 
 
 async def get_suggestions(state: SqlImprovementState) -> Command[Literal["plan_exectution_agent"]]:
-    msg = await llm.ainvoke(get_antipatterns_prompt(state["sql"]))
-    antipatterns = []
-    current_pattern = {}
-    for line in msg.content.split("\n"):
-        if not line:
-            if current_pattern:
-                antipatterns.append(current_pattern)
-                current_pattern = {}
-            continue
-        line = line.strip()
-        line = line.replace("*", "")
-        if ":" in line:
-            key, value = line.split(":", 1)
-            key = key.strip().upper()
-            value = value.strip()
-            if key in ["CODE", "NAME", "DESCRIPTION", "IMPACT", "LOCATION", "SUGGESTION"]:
-                current_pattern[key.lower()] = value
-    if current_pattern:
-        antipatterns.append(current_pattern)
-    return Command(goto="plan_exectution_agent", update={"antipatterns": antipatterns})
+    static_antipatterns, checked_codes = detect_static_antipatterns(state["sql"])
+    msg = await ainvoke_prompt(
+        services.get_lgraph_llm(),
+        get_antipatterns_prompt(state["sql"], exclude_codes=checked_codes),
+    )
+    antipatterns = [
+        ap for ap in parse_antipatterns(msg.content) if ap.get("code") not in checked_codes
+    ]
+    return Command(
+        goto="plan_exectution_agent",
+        update={"antipatterns": static_antipatterns + antipatterns},
+    )
 
 
 async def get_optimized_query(
@@ -177,8 +236,15 @@ async def get_optimized_query(
     improvements = state.get("improvements") or None
     tables = state.get("tables") or None
     antipatterns = state.get("antipatterns") or None
-    msg = await llm.ainvoke(
-        get_optimized_sql_prompt2(state["sql"], improvements, antipatterns, tables)
+    msg = await ainvoke_prompt(
+        services.get_lgraph_llm(),
+        get_optimized_sql_prompt2(
+            state["sql"],
+            improvements,
+            antipatterns,
+            tables,
+            plan_summary=original_plan_summary(state),
+        ),
     )
 
     def clean_sql_string(sql_string):
@@ -197,14 +263,36 @@ graph.add_node("suggestions", get_suggestions)
 graph.add_node("optimized_query", get_optimized_query)
 graph.add_edge(START, "planner_agent")
 
-app.chain = graph.compile().with_config({"callbacks": [langfuse_callback], "recursion_limit": 50})
-app.chain.retry_policy = RetryPolicy()
+_chain = None
+
+
+def get_chain():
+    """Compiled graph, traced by the shared Langfuse handler, built on first use."""
+    global _chain
+    if _chain is None:
+        _chain = graph.compile().with_config(
+            {"callbacks": [services.get_langfuse_callback()], "recursion_limit": 50}
+        )
+    return _chain
+
+
+async def get_cache_key(sql: str) -> Optional[str]:
+    """Result cache key of the query, None if caching is disabled or not possible."""
+    if result_cache is None:
+        return None
+    try:
+        table_ids = extract_tables(sql, GCP_PROJECT, BQ_DEFAULT_DATASET).tables
+        table_versions = await services.get_lgraph_bq_client().get_table_versions(table_ids)
+    except Exception as e:
+        logger.info(f"Skipping result cache: {e}")
+        return None
+    return sql_fingerprint(sql, table_versions, workflow="lgraph_dynamic")
 
 
 @app.route("/", methods=["GET", "POST"])
 async def index():
     try:
-        graph_image = app.chain.get_graph().draw_mermaid_png()
+        graph_image = get_chain().get_graph().draw_mermaid_png()
         image_base64 = base64.b64encode(graph_image).decode("utf-8")
     except Exception as e:
         logging.info(f"Error while generating graph: {e}")
@@ -212,35 +300,128 @@ async def index():
     return await render_template("index.html", image_base64=image_base64)
 
 
+RUN_CONFIG = {
+    "metadata": {
+        "langfuse_user_id": "user-id",
+        "langfuse_session_id": "your-session-id",
+    }
+}
+
+
+async def run_analysis(sql: str, endpoint: str) -> tuple[dict, bool]:
+    """
+    Args:
+        sql: Query to analyze.
+        endpoint: Endpoint serving the request, selects its query budget.
+
+    Returns:
+        The final graph state, served from the result cache if possible, and whether it was.
+        The state's `budget` reports the BigQuery usage of the request against its budget.
+    """
+    with budget_scope(get_query_budget(endpoint)) as budget:
+        state, cached = await _run_analysis(sql)
+    return {**state, "budget": budget.report()}, cached
+
+
+async def _run_analysis(sql: str) -> tuple[dict, bool]:
+    cache_key = await get_cache_key(sql)
+    if cache_key:
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached is not None:
+            return cached, True
+
+    state = await get_chain().ainvoke(
+        SqlImprovementState(sql=sql, attempt=0, improvements=[]), config=RUN_CONFIG
+    )
+    if cache_key and "error" not in state:
+        await asyncio.to_thread(result_cache.put, cache_key, state)
+    return state, False
+
+
 @app.route("/analyze", methods=["GET"])
 async def analyze():
     sql = request.args.get("sql")
     if not sql or not sql.strip():
         return jsonify({"error": "SQL query cannot be empty!"}), 400
 
-    sql = SqlImprovementState(sql=sql.strip(), attempt=0, improvements=[])
     try:
-        state = await app.chain.ainvoke(
-            sql,
-            config={
-                "metadata": {
-                    "langfuse_user_id": "user-id",
-                    "langfuse_session_id": "your-session-id",
-                }
-            },
-        )
+        state, cached = await run_analysis(sql.strip(), request.endpoint)
         if "error" in state:
             return jsonify(state), 400
-        return jsonify(state)
+        response = jsonify(state)
+        if cached:
+            response.headers["X-Cache"] = "HIT"
+        return response
     except Exception as e:
         return jsonify({"error": f"{e}"}), 400
 
 
+@app.route("/analyze/batch", methods=["POST"])
+async def analyze_batch():
+    """Analyze the JSONL queries of the request body and stream NDJSON results."""
+    endpoint = request.endpoint
+
+    async def analyze_item(item: dict) -> dict:
+        state, cached = await run_analysis(item["sql"].strip(), endpoint)
+        if "error" in state:
+            return {"error": state["error"], "result": state}
+        return {"result": state, "cached": cached}
+
+    @stream_with_context
+    async def stream():
+        async for line in run_batch(request.body, analyze_item):
+            yield line
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+
+@app.route("/analyze/stream", methods=["GET"])
+async def analyze_stream():
+    """
+    Stream every node's state update as a server-sent event, then the final state and the
+    request's query `budget` report.
+    """
+    sql = request.args.get("sql")
+    if not sql or not sql.strip():
+        return jsonify({"error": "SQL query cannot be empty!"}), 400
+    sql = sql.strip()
+    budget = get_query_budget(request.endpoint)
+
+    cache_key = await get_cache_key(sql)
+    cached = await asyncio.to_thread(result_cache.get, cache_key) if cache_key else None
+
+    async def cache_result(state: dict):
+        if cache_key:
+            await asyncio.to_thread(result_cache.put, cache_key, state)
+
+    async def stream():
+        if cached is not None:
+            yield format_sse(cached, event="result")
+            return
+        with budget_scope(budget) as tracker:
+            async for event in stream_graph_updates(
+                get_chain(),
+                SqlImprovementState(sql=sql, attempt=0, improvements=[]),
+                RUN_CONFIG,
+                on_complete=cache_result,
+            ):
+                yield event
+        yield format_sse(tracker.report(), event="budget")
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let proxies hold events back
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+    return response
+
+
 async def shutdown(loop, signal=None):
     """Cleanup tasks tied to the application's shutdown."""
     if signal:
         logging.info(f"Received exit signal {signal.name}...")
     logging.info("Performing cleanup tasks...")
+    await get_job_executor().cancel_all()
     logging.info("Asyncio event loop stopped")
     tasks = [t for t in asyncio.all_tasks(loop=loop) if t is not asyncio.current_task()]
     [task.cancel() for task in asyncio.as_completed(tasks)]
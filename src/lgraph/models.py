@@ -17,6 +17,9 @@ class SchemaInfo(TypedDict):
     columns: list[ColumnInfo]
     row_count: Optional[int] = None
     size_bytes: Optional[int] = None
+    last_modified: Optional[str] = None
+    partition_column: Optional[str] = None
+    clustering_columns: Optional[list[str]] = None
 
 
 @dataclass
@@ -2,6 +2,20 @@ from langchain_core.messages import HumanMessage
 from pydantic import BaseModel, Field
 from typing_extensions import TypedDict
 from src.common.utils import *
+from src.common.env_setup import (
+    BQ_BENCHMARK_TRIALS,
+    BQ_BENCHMARK_WARMUP,
+    BQ_DRY_RUN_SCORING,
+    BQ_DEFAULT_DATASET,
+    GCP_PROJECT,
+    VERIFY_EQUIVALENCE,
+)
+from src.common.sql_parser import SqlParseError, extract_tables
+from src.common.antipattern_detector import detect_static_antipatterns
+from src.common.budget import BudgetExceededError, rejected_results
+from src.common.context_cache import ainvoke_prompt
+from src.common.equivalence import equivalence_note, measure_with_equivalence
+from src.common.trials import significance_note
 from langchain_google_genai import ChatGoogleGenerativeAI
 from typing import Optional
 from dataclasses import dataclass
@@ -14,49 +28,72 @@ import random
 logger = logging.getLogger(__name__)
 
 
+def original_plan_summary(state: SqlImprovementState) -> Optional[str]:
+    """Bottleneck stages of the original query's execution plan, if it was executed."""
+    return (state.get("sql_res") or {}).get("metadata", {}).get("plan_summary")
+
+
 class SqlAnalyzer:
-    def __init__(self, llm: ChatGoogleGenerativeAI, bq_client: BigQueryClient):
+    def __init__(
+        self,
+        llm: ChatGoogleGenerativeAI,
+        bq_client: BigQueryClient,
+        dry_run: bool = BQ_DRY_RUN_SCORING,
+        trials: int = BQ_BENCHMARK_TRIALS,
+        warmup: int = BQ_BENCHMARK_WARMUP,
+        verify_equivalence: bool = VERIFY_EQUIVALENCE,
+    ):
         self.llm = llm
         self.bq_client = bq_client
-        pass
+        self.dry_run = dry_run
+        self.trials = trials
+        self.warmup = warmup
+        self.verify_equivalence = verify_equivalence
+
+    async def _run_sql(self, sql: str) -> dict:
+        """
+        Score input for a query: a dry run estimate, the median stats of several runs,
+        or the stats of a single run.
+        """
+        if self.dry_run:
+            return await self.bq_client.dry_run_sql_query(sql)
+        if self.trials > 1:
+            return await self.bq_client.benchmark_sql_query(sql, self.trials, self.warmup)
+        return await self.bq_client.execute_sql_query(sql)
 
     async def get_table_info(self, state: SqlImprovementState) -> SqlImprovementState:
         """First Improvement"""
 
-        async def fetch_metadata(table):
-            return await asyncio.to_thread(self.bq_client.get_table_metadata, table)
+        try:
+            table_ids = extract_tables(state["sql"], GCP_PROJECT, BQ_DEFAULT_DATASET).tables
+        except SqlParseError as e:
+            logger.info(f"Falling back to LLM table extraction: {e}")
+            table_ids = await self._get_table_ids_from_llm(state["sql"])
 
-        msg = await self.llm.ainvoke(get_table_schema_prompt(state["sql"]))
-        if "no_tables_found" not in msg.content.strip():
+        if table_ids:
             tables = await asyncio.gather(
-                *(fetch_metadata(table.strip()) for table in msg.content.split(","))
+                *(self.bq_client.get_table_metadata(table) for table in table_ids)
             )
             return {"tables": tables}
         else:
             raise RuntimeError("No tables found in the provided SQL query.")  # no retry by default
 
+    async def _get_table_ids_from_llm(self, sql: str) -> list[str]:
+        msg = await self.llm.ainvoke(get_table_schema_prompt(sql))
+        if "no_tables_found" in msg.content.strip():
+            return []
+        return [table.strip() for table in msg.content.split(",")]
+
     async def generate_info(self, state: SqlImprovementState) -> SqlImprovementState:
         """First Improvement"""
-        msg = await self.llm.ainvoke(get_antipatterns_prompt(state["sql"]))
-        antipatterns = []
-        current_pattern = {}
-        for line in msg.content.split("\n"):
-            if not line:
-                if current_pattern:
-                    antipatterns.append(current_pattern)
-                    current_pattern = {}
-                continue
-            line = line.strip()
-            line = line.replace("*", "")
-            if ":" in line:
-                key, value = line.split(":", 1)
-                key = key.strip().upper()
-                value = value.strip()
-                if key in ["CODE", "NAME", "DESCRIPTION", "IMPACT", "LOCATION", "SUGGESTION"]:
-                    current_pattern[key.lower()] = value
-        if current_pattern:
-            antipatterns.append(current_pattern)
-        return {"antipatterns": antipatterns}
+        static_antipatterns, checked_codes = detect_static_antipatterns(state["sql"])
+        msg = await ainvoke_prompt(
+            self.llm, get_antipatterns_prompt(state["sql"], exclude_codes=checked_codes)
+        )
+        antipatterns = [
+            ap for ap in parse_antipatterns(msg.content) if ap.get("code") not in checked_codes
+        ]
+        return {"antipatterns": static_antipatterns + antipatterns}
 
     async def get_previous_optimizations(self, state: SqlImprovementState) -> SqlImprovementState:
         return {}
@@ -64,8 +101,14 @@ class SqlAnalyzer:
     async def get_suggestions(self, state: SqlImprovementState) -> SqlImprovementState:
         """Get optimization suggestions using a focused prompt."""
         try:
-            msg = await self.llm.ainvoke(
-                get_suggestions_prompt(state["sql"], state["antipatterns"], state["tables"])
+            msg = await ainvoke_prompt(
+                self.llm,
+                get_suggestions_prompt(
+                    state["sql"],
+                    state["antipatterns"],
+                    state["tables"],
+                    plan_summary=original_plan_summary(state),
+                ),
             )
             suggestions = []
             for line in msg.content.split("\n"):
@@ -81,10 +124,15 @@ class SqlAnalyzer:
     async def get_optimized_query(self, state: SqlImprovementState) -> SqlImprovementState:
         """Get optimization suggestions using a focused prompt."""
         try:
-            msg = await self.llm.ainvoke(
+            msg = await ainvoke_prompt(
+                self.llm,
                 get_optimized_sql_prompt(
-                    state["sql"], state["improvements"], state["antipatterns"], state["tables"]
-                )
+                    state["sql"],
+                    state["improvements"],
+                    state["antipatterns"],
+                    state["tables"],
+                    plan_summary=original_plan_summary(state),
+                ),
             )
 
             def clean_sql_string(sql_string):
@@ -96,6 +144,26 @@ class SqlAnalyzer:
             print(f"Error getting suggestions: {str(e)}")
             return {"optimized_sql": ""}
 
+    async def fused_analysis(self, state: SqlImprovementState) -> SqlImprovementState:
+        """
+        Antipatterns, suggestions and the optimized query from one structured LLM call, instead
+        of the `generate_info`, `get_suggestions` and `get_optimized_query` round trips.
+        """
+        static_antipatterns, checked_codes = detect_static_antipatterns(state["sql"])
+        prompt = get_fused_analysis_prompt(
+            state["sql"],
+            state.get("tables"),
+            plan_summary=original_plan_summary(state),
+            exclude_codes=checked_codes,
+        )
+        try:
+            # function calling constrains the answer to the schema, no free text to parse
+            analysis = await self.llm.with_structured_output(FusedAnalysis).ainvoke(str(prompt))
+        except Exception as e:
+            logger.warning(f"Fused analysis failed: {e}")
+            analysis = None
+        return fused_analysis_update(analysis, static_antipatterns, checked_codes)
+
     async def verify_and_run_original_sql(self, state: SqlImprovementState) -> SqlImprovementState:
         # if random.random() < 0.6:  # 60% chance of failure
         #     raise Exception("Simulated BigQuery query failure")  # retry 3 times by default
@@ -104,15 +172,28 @@ class SqlAnalyzer:
             raise ValueError("No SQL found to execute.")
         state["sql"] = sql_to_run
 
-        res = self.bq_client.execute_sql_query(state["sql"])
+        res = await self._run_sql(state["sql"])
         return {"sql_res": self.bq_client.evaluate_query(res)}
 
     async def verify_and_run_optimized_sql(self, state: SqlImprovementState) -> SqlImprovementState:
-        async def run_sql(sql):
-            return await asyncio.to_thread(self.bq_client.execute_sql_query, sql)
-
-        results = await asyncio.gather(*[run_sql(state["optimized_sql"])])
-        return {"optimized_sql_res": self.bq_client.evaluate_query(results[0])}
+        try:
+            if self.verify_equivalence and not self.dry_run:
+                # the equivalence gate runs next to the performance measurement
+                res, equivalence = await measure_with_equivalence(
+                    self._run_sql(state["optimized_sql"]),
+                    self.bq_client,
+                    state["sql"],
+                    state["optimized_sql"],
+                )
+                res["equivalence"] = equivalence
+            else:
+                res = await self._run_sql(state["optimized_sql"])
+        except BudgetExceededError as e:
+            # an over budget candidate is rejected, not a failure of the whole request
+            logger.info(f"Optimized query rejected: {e}")
+            res = rejected_results(state["optimized_sql"], e, self.dry_run)
+        baseline = (state.get("sql_res") or {}).get("metadata")
+        return {"optimized_sql_res": self.bq_client.evaluate_query(res, baseline)}
 
     async def llm_router(self, state: SqlImprovementState) -> str:
         """
@@ -122,11 +203,19 @@ class SqlAnalyzer:
         optimized_score = state.get("optimized_sql_res", {}).get("score", 0)
         optimized_sql = state.get("optimized_sql", "")
         original_sql = state.get("sql", "")
+        significance = significance_note(
+            state.get("sql_res", {}).get("metadata"),
+            state.get("optimized_sql_res", {}).get("metadata"),
+        )
+        equivalence = equivalence_note(state.get("optimized_sql_res", {}).get("metadata"))
 
         prompt = f"""
         You are a SQL performance optimization agent.
         The original SQL had a performance score of {original_score:.3f}.
         The optimized SQL has a performance score of {optimized_score:.3f}.
+        Scores are relative to the original SQL (1.0), 2.0 means twice as cheap and fast.
+        {significance}
+        {equivalence}
 
         Original SQL:
         {original_sql}
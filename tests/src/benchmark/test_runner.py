@@ -0,0 +1,76 @@
+import asyncio
+
+from src.benchmark.runner import (
+    WorkflowRun,
+    compare_reports,
+    load_corpus,
+    run_benchmark,
+)
+from src.common import usage
+
+
+async def _workflow(sql: str) -> WorkflowRun:
+    usage.set_node("analyze")
+    usage.current_recorder().add_llm_call(100, 20)
+    usage.current_recorder().add_query(1000)
+    return WorkflowRun(result={"sql": sql}, improvement=1.5)
+
+
+async def _failing_workflow(sql: str) -> WorkflowRun:
+    raise RuntimeError("no model")
+
+
+def test_load_corpus(tmp_path):
+    jsonl = tmp_path / "corpus.jsonl"
+    jsonl.write_text('{"id": "a", "sql": "SELECT 1"}\n\n{"sql": "SELECT 2"}\n')
+    assert load_corpus(str(jsonl)) == [
+        {"id": "a", "sql": "SELECT 1"},
+        {"id": "q2", "sql": "SELECT 2"},
+    ]
+
+    sql = tmp_path / "corpus.sql"
+    sql.write_text("SELECT ';'\nFROM t;\nSELECT 2;\n")
+    assert [query["sql"] for query in load_corpus(str(sql))] == ["SELECT ';'\nFROM t", "SELECT 2"]
+
+
+def test_run_benchmark():
+    corpus = [{"id": "q1", "sql": "SELECT 1"}, {"id": "q2", "sql": "SELECT 2"}]
+    report = asyncio.run(
+        run_benchmark(corpus, {"fake": _workflow, "failing": _failing_workflow}, repeat=2)
+    )
+
+    fake = report["workflows"]["fake"]
+    assert len(fake["runs"]) == 4
+    summary = fake["summary"]
+    assert summary["errors"] == 0
+    assert summary["improvement"] == 1.5
+    assert summary["llm_calls"] == 1
+    assert summary["bytes_billed"] == 1000
+    assert summary["nodes"]["analyze"]["input_tokens"] == 100
+
+    failing = report["workflows"]["failing"]["summary"]
+    assert failing["errors"] == 4
+    assert failing["improvement"] is None
+
+
+def test_compare_reports():
+    def report(wall_seconds, bytes_billed, improvement):
+        summary = {
+            "wall_seconds": {"median": wall_seconds},
+            "bytes_billed": bytes_billed,
+            "errors": 0,
+            "improvement": improvement,
+        }
+        return {"workflows": {"lgraph": {"summary": summary}}}
+
+    comparison = compare_reports(report(10.0, 0, 1.5), report(11.0, 0, 1.5))
+    assert comparison["regressions"] == []
+    assert comparison["workflows"]["lgraph"]["bytes_billed"]["change"] is None
+
+    comparison = compare_reports(report(13.0, 10, 1.0), report(10.0, 0, 1.5))
+    assert comparison["regressions"] == [
+        "lgraph.wall_seconds",
+        "lgraph.bytes_billed",
+        "lgraph.improvement",
+    ]
+    assert comparison["workflows"]["lgraph"]["wall_seconds"]["change"] == 0.3
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from src.common.antipattern_detector import detect_antipatterns  # noqa: E402
+
+
+def codes(sql):
+    return {ap["code"] for ap in detect_antipatterns(sql)}
+
+
+def test_select_star_cross_join():
+    found = codes("SELECT * FROM p.d.customer c CROSS JOIN p.d.sales s LIMIT 1")
+
+    assert {"WCD001", "IJN001", "FTS001"} <= found
+    assert "LDT001" not in found
+
+
+def test_not_in_subquery_without_null_check():
+    found = codes("SELECT a FROM p.d.t WHERE a NOT IN (SELECT b FROM p.d.u WHERE b > 0)")
+
+    assert {"NIN001", "WNC001"} <= found
+
+
+def test_correlated_scalar_subquery_on_same_table():
+    found = codes(
+        "SELECT s.id, (SELECT SUM(i.v) FROM p.d.sales i WHERE i.id = s.id) AS total"
+        " FROM p.d.sales s WHERE s.v > 0"
+    )
+
+    assert {"NSC001", "ISJ001"} <= found
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "p.d.t, UNNEST(t.arr) AS e",
+        "p.d.t CROSS JOIN UNNEST(t.arr) AS e",
+        "p.d.t, t.arr AS e",
+    ],
+)
+def test_correlated_unnest_is_not_a_self_join(source):
+    found = codes(f"SELECT t.id, e FROM {source} WHERE t.id > 0")
+
+    assert not {"ISJ001", "ALS001", "IJN001"} & found
+
+
+def test_ordinal_order_by_and_null_comparison():
+    found = codes("SELECT a, b FROM p.d.t WHERE b = NULL ORDER BY 1")
+
+    assert {"ODR001", "CND001"} <= found
+
+
+def test_finding_shape_and_location():
+    (finding,) = [
+        ap
+        for ap in detect_antipatterns("SELECT a\nFROM p.d.t\nWHERE a = NULL")
+        if ap["code"] == "CND001"
+    ]
+
+    assert set(finding) == {"code", "name", "description", "impact", "location", "suggestion"}
+    assert finding["location"] == "line 3: a = NULL"
+
+
+def test_clean_query_has_no_findings():
+    assert codes("SELECT a, b FROM p.d.t AS t WHERE a > 1") == set()
+
+
+def test_mixed_case_cte_reference():
+    found = codes("WITH Recent AS (SELECT a FROM p.d.t WHERE a > 1) SELECT a FROM recent")
+
+    assert "UNC001" not in found
+    assert "FTS001" not in found
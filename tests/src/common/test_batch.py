@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+from src.common.batch import run_batch
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _analyze(item):
+    if item["sql"] == "fail":
+        raise RuntimeError("boom")
+    await asyncio.sleep(0.05 if item["sql"] == "slow" else 0)
+    return {"result": item["sql"].upper()}
+
+
+async def _collect(chunks, max_workers):
+    return [json.loads(line) async for line in run_batch(chunks, _analyze, max_workers)]
+
+
+def test_run_batch_streams_in_completion_order():
+    body = _chunks(
+        b'{"sql": "slow", "id": "a"}\n{"sql": "fa',
+        b'st", "request_id": "b"}\n{"sql": "fail"}\nnot json\n\n{"sql": ""}',
+    )
+    results = asyncio.run(_collect(body, max_workers=2))
+    by_index = {r["index"]: r for r in results}
+
+    assert results[-1]["index"] == 0
+    assert by_index[0] == {"index": 0, "id": "a", "result": "SLOW"}
+    assert by_index[1] == {"index": 1, "id": "b", "result": "FAST"}
+    assert by_index[2]["error"] == "boom"
+    assert by_index[3]["error"].startswith("Invalid batch line")
+    assert by_index[4]["error"].startswith("Invalid batch line")
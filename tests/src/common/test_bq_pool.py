@@ -0,0 +1,51 @@
+import socket
+
+import pytest
+
+pytest.importorskip("google.cloud.bigquery")
+
+from src.common.bq_pool import (  # noqa: E402
+    BigQueryClientPool,
+    PooledHTTPAdapter,
+    keepalive_socket_options,
+)
+
+
+class _Pool(BigQueryClientPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.created = []
+
+    def _create(self, project_id, credentials, location):
+        self.created.append((project_id, credentials, location))
+        return object()
+
+
+def test_clients_are_shared_per_project_location_and_credentials():
+    pool = _Pool()
+    credentials, other_credentials = object(), object()
+
+    client = pool.get("p", credentials)
+
+    assert pool.get("p", credentials) is client
+    assert pool.get("p", other_credentials) is not client
+    assert pool.get("p", credentials, location="EU") is not client
+    assert pool.get("q", credentials) is not client
+    assert len(pool.created) == 4
+
+
+def test_keepalive_socket_options():
+    assert keepalive_socket_options(0) == []
+    options = keepalive_socket_options(60)
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in options
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        assert (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60) in options
+
+
+def test_adapter_pools_connections_with_keepalive():
+    adapter = PooledHTTPAdapter(keepalive_seconds=60, pool_maxsize=32)
+
+    pool = adapter.poolmanager.connection_from_url("https://bigquery.googleapis.com")
+
+    assert pool.pool.maxsize == 32
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in pool.conn_kw["socket_options"]
@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+
+import pytest
+
+pytest.importorskip("google.cloud.bigquery")
+
+from google.cloud import bigquery  # noqa: E402
+
+from src.common.bq_executor import AsyncJobExecutor  # noqa: E402
+from src.common.budget import (  # noqa: E402
+    JOB_TIMEOUT_MARGIN_SECONDS,
+    MIN_BYTES_BILLED_PER_TABLE,
+    BudgetExceededError,
+    BudgetTracker,
+    JobLimits,
+    QueryBudget,
+    budget_scope,
+    current_budget,
+    get_query_budget,
+    rejected_results,
+)
+
+
+class _Job:
+    def __init__(
+        self, bytes_billed=0, slot_millis=0, bytes_processed=0, tables=0, error_result=None
+    ):
+        self.job_id = "job"
+        self.total_bytes_billed = bytes_billed
+        self.slot_millis = slot_millis
+        self.total_bytes_processed = bytes_processed
+        self.referenced_tables = [f"p.d.t{i}" for i in range(tables)]
+        self.error_result = error_result
+        self.state = "DONE"
+        self.dry_run = False
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def reload(self):
+        pass
+
+    def result(self):
+        raise AssertionError("result() of a job stopped at its budget")
+
+
+class _Client:
+    def __init__(self, estimate, tables=0):
+        self.estimate = estimate
+        self.tables = tables
+        self.dry_runs = 0
+
+    def query(self, sql, job_config=None):
+        assert job_config.dry_run
+        self.dry_runs += 1
+        return _Job(bytes_processed=self.estimate, tables=self.tables)
+
+
+def test_query_budget_per_endpoint(monkeypatch):
+    monkeypatch.setenv(
+        "QUERY_BUDGETS",
+        '{"default": {"job_seconds": 60}, "analyze_batch": {"total_bytes_billed": 1000}}',
+    )
+
+    assert get_query_budget("analyze_batch") == QueryBudget(total_bytes_billed=1000)
+    assert get_query_budget("analyze") == QueryBudget(job_seconds=60)
+
+
+def test_query_budget_defaults_to_no_limits(monkeypatch):
+    monkeypatch.delenv("QUERY_BUDGETS", raising=False)
+
+    assert get_query_budget("analyze") == QueryBudget()
+
+
+def test_query_budget_rejects_unknown_fields(monkeypatch):
+    monkeypatch.setenv("QUERY_BUDGETS", '{"default": {"bytes": 1}}')
+
+    with pytest.raises(ValueError, match="bytes"):
+        get_query_budget("analyze")
+
+
+def test_job_limits_are_capped_by_the_remaining_budget():
+    tracker = BudgetTracker(QueryBudget(job_bytes_billed=100, total_bytes_billed=150))
+    assert tracker.job_limits().bytes_billed == 100
+
+    tracker.record(_Job(bytes_billed=120))
+
+    assert tracker.job_limits().bytes_billed == 30
+    tracker.record(_Job(bytes_billed=30))
+    with pytest.raises(BudgetExceededError):
+        tracker.job_limits()
+
+
+def test_prepare_job_sets_the_limits():
+    tracker = BudgetTracker(QueryBudget(job_bytes_billed=100, job_seconds=1.5))
+    client = _Client(estimate=80)
+
+    job_config, limits = tracker.prepare_job(client, "SELECT 1", None)
+
+    assert client.dry_runs == 1
+    assert job_config.maximum_bytes_billed == 100
+    # past the local deadline, which cancels the job first
+    assert int(job_config.job_timeout_ms) == 1500 + JOB_TIMEOUT_MARGIN_SECONDS * 1000
+    assert limits.deadline is not None
+
+
+def test_prepare_job_without_bytes_limit_skips_the_estimate():
+    tracker = BudgetTracker(QueryBudget())
+    client = _Client(estimate=80)
+    job_config = bigquery.QueryJobConfig(use_query_cache=False)
+
+    prepared, _ = tracker.prepare_job(client, "SELECT 1", job_config)
+
+    assert client.dry_runs == 0
+    assert prepared is job_config
+    assert prepared.maximum_bytes_billed is None
+
+
+def test_prepare_job_rejects_an_estimate_over_budget():
+    tracker = BudgetTracker(QueryBudget(job_bytes_billed=100))
+
+    with pytest.raises(BudgetExceededError, match="200 bytes"):
+        tracker.prepare_job(_Client(estimate=200), "SELECT 1", None)
+
+
+def test_prepare_job_estimates_the_minimum_bytes_billed():
+    tracker = BudgetTracker(QueryBudget(job_bytes_billed=MIN_BYTES_BILLED_PER_TABLE))
+
+    with pytest.raises(BudgetExceededError):
+        tracker.prepare_job(_Client(estimate=100, tables=2), "SELECT 1", None)
+
+
+@pytest.mark.parametrize(
+    "error_result",
+    [
+        {"reason": "bytesBilledLimitExceeded", "message": "Query exceeded limit for bytes billed"},
+        {"reason": "timeout", "message": "Operation timed out after 1.0 seconds."},
+    ],
+)
+def test_jobs_stopped_by_bigquery_exceed_their_budget(error_result):
+    job = _Job(error_result=error_result)
+
+    class Client(_Client):
+        def query(self, sql, job_config=None):
+            return super().query(sql, job_config) if job_config.dry_run else job
+
+    async def run():
+        with budget_scope(QueryBudget(job_bytes_billed=100, job_seconds=1.0)) as tracker:
+            with pytest.raises(BudgetExceededError, match="exceeded its budget"):
+                await AsyncJobExecutor().run(Client(estimate=0), "SELECT 1")
+        return tracker
+
+    tracker = asyncio.run(run())
+
+    assert tracker.report()["consumed"]["cancelled_jobs"] == 1
+    assert tracker.report()["consumed"]["jobs"] == 1
+
+
+def test_job_error_ignores_other_errors():
+    tracker = BudgetTracker(QueryBudget(job_seconds=1.0))
+    job = _Job(error_result={"reason": "invalidQuery", "message": "Syntax error"})
+
+    assert tracker.job_error(job, tracker.job_limits()) is None
+    assert tracker.report()["consumed"]["cancelled_jobs"] == 0
+
+
+def test_check_job_cancels_jobs_over_their_slot_time():
+    tracker = BudgetTracker(QueryBudget())
+    job = _Job(slot_millis=500)
+
+    tracker.check_job(job, JobLimits(slot_millis=1000))
+    assert not job.cancelled
+
+    job.slot_millis = 1500
+    with pytest.raises(BudgetExceededError, match="slot milliseconds"):
+        tracker.check_job(job, JobLimits(slot_millis=1000))
+    assert job.cancelled
+    assert tracker.report()["consumed"]["cancelled_jobs"] == 1
+
+
+def test_check_job_cancels_jobs_past_their_deadline():
+    tracker = BudgetTracker(QueryBudget())
+    job = _Job()
+
+    with pytest.raises(BudgetExceededError, match="seconds"):
+        tracker.check_job(job, JobLimits(seconds=1.0, deadline=0.0))
+    assert job.cancelled
+
+
+def test_report():
+    tracker = BudgetTracker(QueryBudget(total_slot_millis=1000))
+    tracker.record(_Job(bytes_billed=10, slot_millis=20))
+    tracker.record(_Job(bytes_billed=5, slot_millis=None))
+
+    report = tracker.report()
+
+    assert report["limits"] == {"total_slot_millis": 1000}
+    assert report["consumed"]["bytes_billed"] == 15
+    assert report["consumed"]["slot_millis"] == 20
+    assert report["consumed"]["jobs"] == 2
+
+
+def test_budget_scope():
+    assert current_budget() is None
+    with budget_scope(QueryBudget()) as tracker:
+        assert current_budget() is tracker
+    assert current_budget() is None
+
+
+def test_rejected_results_score_zero():
+    from src.common.scoring import evaluate_query
+
+    baseline = {"total_bytes_billed": 100, "execution_time_seconds": 1.0, "sql": "SELECT 1"}
+    results = rejected_results("SELECT 2", BudgetExceededError("over budget"))
+
+    evaluated = evaluate_query(results, baseline)
+
+    assert evaluated["score"] == 0.0
+    assert evaluated["metadata"]["error"] == "over budget"
+
+
+def test_budget_scope_of_a_stream_closed_in_another_context():
+    def stream():
+        with budget_scope(QueryBudget()):
+            yield "update"
+
+    events = stream()
+    contextvars.copy_context().run(next, events)
+
+    contextvars.copy_context().run(events.close)  # e.g. the client disconnected
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from src.common import context_cache  # noqa: E402
+from src.common.context_cache import ContextCacheRegistry, Prompt, ainvoke_prompt  # noqa: E402
+
+
+class _Registry(ContextCacheRegistry):
+    def __init__(self, names, **kwargs):
+        super().__init__(**kwargs)
+        self.names = list(names)
+        self.created = []
+
+    def _create(self, llm, prefix):
+        self.created.append(prefix)
+        return self.names.pop(0)
+
+
+class _LLM:
+    model = "models/gemini-2.0-flash"
+    cached_content = None
+
+    def __init__(self):
+        self.calls = []
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return prompt
+
+
+def test_prompt_is_its_text():
+    prompt = Prompt("static ", "query")
+    assert prompt == "static query"
+    assert (prompt.prefix, prompt.suffix) == ("static ", "query")
+
+
+def test_registry_registers_long_prefixes_once():
+    registry = _Registry(["cachedContents/a", None], min_tokens=10, ttl_seconds=60)
+    llm = _LLM()
+    assert registry.get(llm, "short") is None
+    assert registry.get(llm, "x" * 100) == "cachedContents/a"
+    assert registry.get(llm, "x" * 100) == "cachedContents/a"
+    # a failed registration isn't retried within the TTL either
+    assert registry.get(llm, "y" * 100) is None
+    assert registry.get(llm, "y" * 100) is None
+    assert registry.created == ["x" * 100, "y" * 100]
+
+
+def test_concurrent_first_uses_register_once():
+    class _SlowRegistry(_Registry):
+        def _create(self, llm, prefix):
+            time.sleep(0.05)
+            return super()._create(llm, prefix)
+
+    registry = _SlowRegistry(["cachedContents/a"], min_tokens=10, ttl_seconds=60)
+    barrier = threading.Barrier(4)
+
+    def get(_):
+        barrier.wait()
+        return registry.get(_LLM(), "x" * 100)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        names = list(pool.map(get, range(4)))
+
+    assert names == ["cachedContents/a"] * 4
+    assert registry.created == ["x" * 100]
+
+
+def test_ainvoke_prompt_sends_suffix_with_cached_content(monkeypatch):
+    registry = _Registry(["cachedContents/a"], min_tokens=10, ttl_seconds=60)
+    monkeypatch.setattr(context_cache, "get_context_cache_registry", lambda: registry)
+    llm = _LLM()
+    asyncio.run(ainvoke_prompt(llm, Prompt("x" * 100, "query")))
+    asyncio.run(ainvoke_prompt(llm, "plain prompt"))
+    assert llm.calls == [
+        ("query", {"cached_content": "cachedContents/a"}),
+        ("plain prompt", {}),
+    ]
+
+
+def test_analysis_prompts_share_their_prefix():
+    from src.common.utils import (
+        ANTIPATTERNS_PROMPT_PREFIX,
+        get_antipatterns_prompt,
+        get_optimized_sql_prompt,
+        get_suggestions_prompt,
+    )
+
+    tables = [{"table_name": "p.d.t", "columns": [{"column_name": "a", "column_type": "INT64"}]}]
+    suggestions = get_suggestions_prompt("SELECT a FROM p.d.t", [], tables)
+    optimized = get_optimized_sql_prompt("SELECT a FROM p.d.t", [], [{"code": "X"}], tables)
+    assert suggestions.prefix == optimized.prefix
+    assert "a INT64" in suggestions.prefix
+    antipatterns = get_antipatterns_prompt("SELECT 1", exclude_codes={"P001"})
+    assert antipatterns.prefix is ANTIPATTERNS_PROMPT_PREFIX
+    assert "P001" in antipatterns.suffix
+
+
+def test_context_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("GEMINI_CONTEXT_CACHE", raising=False)
+    assert context_cache.get_context_cache_registry() is None
@@ -0,0 +1,112 @@
+import pytest
+
+duckdb = pytest.importorskip("duckdb")
+pytest.importorskip("sqlglot")
+
+from src.common.duckdb_backend import DuckDBBackend  # noqa: E402
+from src.common.equivalence import check_equivalence  # noqa: E402
+
+
+@pytest.fixture
+def backend(tmp_path):
+    (tmp_path / "shop" / "orders").mkdir(parents=True)
+    connection = duckdb.connect()
+    connection.execute(
+        "COPY (SELECT range AS id, range % 10 AS customer_id, 'x' || range AS note"
+        f" FROM range(1000)) TO '{tmp_path}/shop/customers.parquet'"
+    )
+    for part in range(2):
+        connection.execute(
+            f"COPY (SELECT range AS customer_id, range * {part + 1} AS amount FROM range(10))"
+            f" TO '{tmp_path}/shop/orders/part{part}.parquet'"
+        )
+    return DuckDBBackend(str(tmp_path), default_dataset="shop")
+
+
+def test_transpile(backend):
+    (sql,) = backend.transpile('SELECT id FROM `project.shop.customers` WHERE note = "x1"')
+    assert sql.replace('"', "") == "SELECT id FROM shop.customers WHERE note = 'x1'"
+    assert backend.transpile("WITH c AS (SELECT id FROM customers) SELECT * FROM c") == [
+        "WITH c AS (SELECT id FROM shop.customers) SELECT * FROM c"
+    ]
+    # CTE names are case-insensitive
+    assert backend.transpile("WITH C AS (SELECT id FROM customers) SELECT * FROM c") == [
+        "WITH C AS (SELECT id FROM shop.customers) SELECT * FROM c"
+    ]
+
+
+def test_execute_counts_scanned_columns(backend):
+    sizes = backend.column_bytes("shop.customers")
+    stats = backend.execute("SELECT SUM(id) FROM shop.customers WHERE customer_id = 1")
+    assert stats["total_bytes_billed"] == sizes["id"] + sizes["customer_id"]
+    assert stats["server_time_seconds"] > 0
+    assert stats["dry_run"] is False
+
+    stats = backend.execute(
+        "SELECT c.note, SUM(o.amount) FROM customers c JOIN shop.orders o USING (customer_id)"
+        " GROUP BY 1"
+    )
+    orders = backend.column_bytes("shop.orders")
+    assert stats["total_bytes_billed"] == (
+        sizes["customer_id"] + sizes["note"] + orders["customer_id"] + orders["amount"]
+    )
+
+
+def test_dry_run(backend):
+    sizes = backend.column_bytes("shop.customers")
+    stats = backend.dry_run("SELECT id FROM `p.shop.customers`")
+    assert stats["total_bytes_billed"] == sizes["id"]
+    assert stats["referenced_tables"] == ["shop.customers"]
+    assert backend.dry_run("SELECT missing FROM shop.customers")["error"]
+
+
+def test_table_metadata(backend):
+    metadata = backend.table_metadata("project.shop.orders")
+    assert metadata["row_count"] == 20
+    assert metadata["columns"] == [
+        {"column_name": "customer_id", "column_type": "INT64"},
+        {"column_name": "amount", "column_type": "INT64"},
+    ]
+    with pytest.raises(KeyError):
+        backend.table_metadata("shop.missing")
+
+
+def test_fingerprint_macro(backend):
+    rows = backend.query_rows(
+        "SELECT FARM_FINGERPRINT('a') = FARM_FINGERPRINT('a') AS same,"
+        " FARM_FINGERPRINT('a') = FARM_FINGERPRINT('b') AS clash"
+    )
+    assert rows == [{"same": True, "clash": False}]
+
+
+def test_equivalence_fingerprints(backend):
+    class Client:
+        def query_single_row(self, sql):
+            (row,) = backend.query_rows(sql)
+            return row
+
+    def status(original, optimized):
+        return check_equivalence(Client(), original, optimized)["status"]
+
+    # the rows are fingerprinted by column position
+    assert status("SELECT id, note FROM customers", "SELECT id AS i, note AS n FROM customers") == (
+        "equivalent"
+    )
+    assert status("SELECT id, note FROM customers", "SELECT note, id FROM customers") == (
+        "different"
+    )
+    assert (
+        status(
+            "SELECT id, note FROM customers ORDER BY id, note",
+            "SELECT id AS i, note FROM customers ORDER BY id, note",
+        )
+        == "equivalent"
+    )
+    # float aggregates may differ by rounding
+    assert (
+        status(
+            "SELECT SUM(id / 3) AS total FROM customers",
+            "SELECT SUM(id / 3) + 1e-9 AS total FROM customers",
+        )
+        == "inconclusive"
+    )
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from src.common.equivalence import (  # noqa: E402
+    build_fingerprint_query,
+    check_equivalence,
+    measure_with_equivalence,
+    plan_equivalence_check,
+)
+
+
+class _Client:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query_single_row(self, sql):
+        self.queries.append(sql)
+        return self.rows[len(self.queries) - 1]
+
+
+def test_plan_equivalence_check():
+    assert plan_equivalence_check("SELECT a FROM d.t") == (False, None)
+    assert plan_equivalence_check("SELECT a FROM d.t ORDER BY a LIMIT 5") == (True, None)
+    assert plan_equivalence_check("SELECT t.a, b AS c FROM d.t ORDER BY a, 2") == (True, None)
+    # ties of a non-unique sort key come back in any order
+    assert plan_equivalence_check("SELECT a, b FROM d.t ORDER BY a") == (False, None)
+    assert plan_equivalence_check("SELECT * FROM d.t ORDER BY a") == (False, None)
+    assert plan_equivalence_check("SELECT a, b FROM d.t ORDER BY a LIMIT 5")[0] is None
+    assert plan_equivalence_check("SELECT a FROM d.t LIMIT 5")[0] is None
+    assert plan_equivalence_check("DELETE FROM d.t WHERE TRUE")[0] is None
+
+
+def test_build_fingerprint_query():
+    unordered = build_fingerprint_query("SELECT a FROM d.t;", order_sensitive=False)
+    assert "FROM (SELECT a FROM d.t) AS t" in unordered
+    assert "BIT_XOR(FARM_FINGERPRINT" in unordered
+
+    ordered = build_fingerprint_query("SELECT a FROM d.t ORDER BY a", order_sensitive=True)
+    assert "ARRAY(SELECT AS STRUCT a FROM d.t ORDER BY a)" in ordered
+
+
+@pytest.mark.parametrize("order_sensitive", [False, True])
+def test_fingerprint_is_positional(order_sensitive):
+    def wrapper(sql):
+        query = build_fingerprint_query(sql, order_sensitive)
+        inner = sql.replace("SELECT", "SELECT AS STRUCT", 1) if order_sensitive else sql
+        assert inner in query
+        return query.replace(inner, "{sql}")
+
+    # FORMAT('%T') renders the rows without the column names, so renamed columns give the same
+    # fingerprint, while the rows of reordered columns have their values in another order
+    original = wrapper("SELECT a, b FROM d.t ORDER BY a, b")
+    assert "FORMAT('%T'" in original
+    assert "TO_JSON_STRING" not in original
+    assert wrapper("SELECT a AS x, b AS y FROM d.t ORDER BY 1, 2") == original
+    assert wrapper("SELECT b, a FROM d.t ORDER BY a, b") == original
+
+
+def test_check_equivalence():
+    row = {"row_count": 3, "fingerprint": 42}
+    client = _Client([row, dict(row)])
+    result = check_equivalence(client, "SELECT a FROM d.t", "SELECT DISTINCT a FROM d.t")
+    assert result["status"] == "equivalent"
+    assert len(client.queries) == 2
+
+    client = _Client([row, {"row_count": 3, "fingerprint": 7}])
+    assert check_equivalence(client, "SELECT a FROM d.t", "SELECT b FROM d.t")["status"] == (
+        "different"
+    )
+
+    result = check_equivalence(_Client([]), "SELECT a FROM d.t LIMIT 1", "SELECT a FROM d.t")
+    assert result["status"] == "inconclusive"
+
+
+def test_check_equivalence_of_float_results():
+    original = {"row_count": 3, "fingerprint": 42, "has_float": True}
+
+    # a SUM of FLOAT64 values may differ in the last bits
+    rounded = {"row_count": 3, "fingerprint": 7, "has_float": True}
+    result = check_equivalence(
+        _Client([original, rounded]),
+        "SELECT SUM(x) AS s FROM d.t",
+        "SELECT SUM(x) AS total FROM (SELECT x FROM d.t)",
+    )
+    assert result["status"] == "inconclusive"
+    assert "FLOAT64" in result["reason"]
+
+    same = dict(original)
+    assert check_equivalence(_Client([original, same]), "SELECT 1.5", "SELECT 1.5")["status"] == (
+        "equivalent"
+    )
+
+    fewer_rows = {"row_count": 2, "fingerprint": 7, "has_float": True}
+    result = check_equivalence(_Client([original, fewer_rows]), "SELECT 1.5", "SELECT 2.5")
+    assert result["status"] == "different"
+
+
+class _SlowClient:
+    def __init__(self):
+        self.cancelled = 0
+
+    async def query_single_row(self, sql):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_failed_measurement_cancels_the_equivalence_check():
+    client = _SlowClient()
+
+    async def measurement():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("over budget")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(
+            measure_with_equivalence(
+                measurement(), client, "SELECT a FROM d.t", "SELECT a FROM d.t"
+            )
+        )
+
+    assert client.cancelled == 2
+
+
+def test_measurement_with_equivalence():
+    row = {"row_count": 3, "fingerprint": 42}
+
+    class _AsyncClient:
+        async def query_single_row(self, sql):
+            return row
+
+    async def measurement():
+        return {"total_bytes_billed": 1}
+
+    result, equivalence = asyncio.run(
+        measure_with_equivalence(
+            measurement(), _AsyncClient(), "SELECT a FROM d.t", "SELECT a FROM d.t"
+        )
+    )
+
+    assert result == {"total_bytes_billed": 1}
+    assert equivalence["status"] == "equivalent"
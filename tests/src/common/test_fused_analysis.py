@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("sqlglot")
+pytest.importorskip("pydantic")
+
+from src.common.utils import (  # noqa: E402
+    FUSED_ANALYSIS_PROMPT_PREFIX,
+    fused_analysis_update,
+    get_fused_analysis_prompt,
+)
+from src.common.models import (  # noqa: E402
+    Antipattern,
+    FusedAnalysis,
+    ProposedImprovement,
+    QuerySuggestions,
+)
+
+SQL = "SELECT id FROM `p.d.t` WHERE id IN (SELECT id FROM `p.d.u`)"
+
+
+def _antipattern(code):
+    return Antipattern(
+        code=code,
+        name=code,
+        description="",
+        impact="High",
+        location="WHERE",
+        suggestion="",
+    )
+
+
+def test_prompt_prefix_is_shared_and_suffix_has_the_call_details():
+    prompt = get_fused_analysis_prompt(SQL, plan_summary="S00: 10s", exclude_codes={"B", "A"})
+
+    assert prompt.prefix.startswith(FUSED_ANALYSIS_PROMPT_PREFIX)
+    assert SQL in prompt.prefix
+    assert "don't report them: A, B" in prompt.suffix
+    assert "S00: 10s" in prompt.suffix
+    assert get_fused_analysis_prompt(SQL).suffix == ""
+
+
+def test_update_skips_checked_codes_and_cleans_the_sql():
+    analysis = FusedAnalysis(
+        antipatterns=[_antipattern("SELECT_STAR"), _antipattern("SUBQUERY_IN_WHERE")],
+        suggestions=QuerySuggestions(
+            original_sql=SQL,
+            improvements=[ProposedImprovement(improved_sql="SELECT 1", rationale="Use a join")],
+        ),
+        optimized_sql="```sql\nSELECT t.id FROM `p.d.t` t JOIN `p.d.u` u USING (id)\n```",
+    )
+    static = [{"code": "SELECT_STAR"}]
+
+    update = fused_analysis_update(analysis, static, {"SELECT_STAR"})
+
+    assert [a["code"] for a in update["antipatterns"]] == ["SELECT_STAR", "SUBQUERY_IN_WHERE"]
+    assert update["improvements"] == ["Use a join"]
+    assert update["optimized_sql"] == "SELECT t.id FROM `p.d.t` t JOIN `p.d.u` u USING (id)"
+
+
+def test_update_without_an_answer_keeps_the_static_findings():
+    static = [{"code": "SELECT_STAR"}]
+
+    assert fused_analysis_update(None, static, {"SELECT_STAR"}) == {
+        "antipatterns": static,
+        "improvements": [],
+        "optimized_sql": "",
+    }
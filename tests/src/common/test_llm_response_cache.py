@@ -0,0 +1,27 @@
+from src.common import usage
+from src.common.llm_response_cache import LLMResponseCache
+from src.common.sqlite_store import SqliteStore
+
+
+def _cache(tmp_path, nodes=("identify_tables",)):
+    return LLMResponseCache(SqliteStore(str(tmp_path / "llm.sqlite")), frozenset(nodes))
+
+
+def test_key_ignores_whitespace_but_not_parameters():
+    key = LLMResponseCache.key("gemini", "Extract the tables\n\n  SELECT 1", 1.0)
+    assert key == LLMResponseCache.key("gemini", "Extract the tables SELECT 1 ", 1.0)
+    assert key != LLMResponseCache.key("gemini", "Extract the tables SELECT 1", 0.0)
+    assert key != LLMResponseCache.key("gemini-pro", "Extract the tables SELECT 1", 1.0)
+
+
+def test_only_opted_in_nodes_are_cached(tmp_path):
+    cache = _cache(tmp_path)
+    assert not cache.enabled()
+    usage.set_node("identify_tables")
+    try:
+        assert cache.enabled()
+        cache.put("key", "p.d.t")
+    finally:
+        usage.set_node(None)
+    # the store is persistent, another cache on the same file serves the response
+    assert _cache(tmp_path).get("key") == "p.d.t"
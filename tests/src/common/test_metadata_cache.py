@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from src.common.metadata_cache import TableMetadataCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def schema(name, modified="2024-01-01T00:00:00"):
+    return {"table_name": name, "columns": [], "last_modified": modified}
+
+
+def test_hit_after_miss():
+    cache = TableMetadataCache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return schema("t")
+
+    assert cache.get("p.d.t", loader) == cache.get("p.d.t", loader)
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_callers_get_their_own_copy():
+    cache = TableMetadataCache()
+
+    first = cache.get("p.d.t", lambda: schema("t"))
+    first["columns"].append({"column_name": "injected"})
+
+    assert cache.get("p.d.t", lambda: schema("t"))["columns"] == []
+    assert asyncio.run(cache.aget("p.d.t", lambda: schema("t")))["columns"] == []
+
+
+def test_lru_eviction():
+    cache = TableMetadataCache(max_entries=2)
+    cache.get("a", lambda: schema("a"))
+    cache.get("b", lambda: schema("b"))
+    cache.get("a", lambda: schema("a"))
+    cache.get("c", lambda: schema("c"))
+
+    assert cache.version("a") is not None
+    assert cache.version("b") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_reloaded():
+    clock = FakeClock()
+    cache = TableMetadataCache(ttl_seconds=10, clock=clock)
+    cache.get("t", lambda: schema("t"))
+
+    clock.now = 5
+    assert cache.get("t", lambda: schema("t", "2024-02-01T00:00:00"))["last_modified"] == (
+        "2024-01-01T00:00:00"
+    )
+
+    clock.now = 11
+    value = cache.get("t", lambda: schema("t", "2024-02-01T00:00:00"))
+    assert value["last_modified"] == "2024-02-01T00:00:00"
+    assert cache.version("t") == "2024-02-01T00:00:00"
+    assert cache.stats()["misses"] == 2
+
+
+def test_concurrent_lookups_are_coalesced():
+    cache = TableMetadataCache()
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(5)
+        return schema("t")
+
+    async def lookups():
+        tasks = [asyncio.create_task(cache.aget("t", loader)) for _ in range(50)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(lookups())
+    assert len(loads) == 1
+    assert all(r["table_name"] == "t" for r in results)
+    assert cache.stats()["coalesced"] == 49
@@ -0,0 +1,42 @@
+from src.common.query_plan import find_bottlenecks, plan_summary
+
+
+def _stage(name, slot_ms, **overrides):
+    stage = {
+        "id": name,
+        "name": name,
+        "records_read": 1000,
+        "records_written": 10,
+        "slot_ms": slot_ms,
+        "parallel_inputs": 8,
+        "wait_ratio_avg": 0.1,
+        "wait_ratio_max": 0.2,
+        "compute_ratio_avg": 0.4,
+        "compute_ratio_max": 0.5,
+        "shuffle_output_bytes": 0,
+        "shuffle_output_bytes_spilled": 0,
+        "steps": ["READ", "WRITE"],
+    }
+    return {**stage, **overrides}
+
+
+def test_find_bottlenecks_orders_by_slot_time():
+    stages = [
+        _stage("S00: Input", 100),
+        _stage("S01: Join+", 700, compute_ratio_max=2.0, steps=["READ", "JOIN", "WRITE"]),
+        _stage("S02: Repartition", 150, shuffle_output_bytes_spilled=3 * 1024**3),
+        _stage("S03: Output", 50),
+    ]
+    bottlenecks = find_bottlenecks(stages)
+    assert [b["stage"]["name"] for b in bottlenecks] == ["S01: Join+", "S02: Repartition"]
+    assert "skewed join" in bottlenecks[0]["issues"][0]
+    assert bottlenecks[1]["issues"] == [
+        "spills 3.0 GB of shuffle output to disk",
+        "repartitions its input",
+    ]
+
+
+def test_plan_summary():
+    summary = plan_summary([_stage("S00: Input", 100), _stage("S01: Output", 10)])
+    assert summary == "S00: Input: 91% of slot time, 1,000 rows read, 10 written"
+    assert plan_summary([]) == ""
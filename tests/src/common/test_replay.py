@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from src.common.replay import RECORD, REPLAY, ReplayClient, ReplayMissError, ReplayStore
+from src.common.sqlite_store import SqliteStore
+
+
+class _Client:
+    def __init__(self):
+        self.calls = 0
+
+    def execute_sql_query(self, sql: str) -> dict:
+        self.calls += 1
+        return {"sql": sql, "run": self.calls}
+
+    async def query_single_row(self, sql: str) -> dict:
+        self.calls += 1
+        return {"row_count": self.calls}
+
+    def evaluate_query(self, results: dict) -> dict:
+        return {"score": 1.0, "metadata": results}
+
+
+def _store(tmp_path, mode, latency_scale=0.0):
+    return ReplayStore(SqliteStore(str(tmp_path / "replay.sqlite")), mode, latency_scale)
+
+
+def test_record_then_replay(tmp_path):
+    client = ReplayClient(_Client(), _store(tmp_path, RECORD))
+    assert client.execute_sql_query("SELECT 1") == {"sql": "SELECT 1", "run": 1}
+    assert client.execute_sql_query("SELECT 1") == {"sql": "SELECT 1", "run": 2}
+    assert asyncio.run(client.query_single_row("SELECT 2")) == {"row_count": 3}
+
+    offline = _Client()
+    client = ReplayClient(offline, _store(tmp_path, REPLAY))
+    # identical calls replay in recording order and wrap around
+    assert [client.execute_sql_query("SELECT 1")["run"] for _ in range(3)] == [1, 2, 1]
+    assert asyncio.run(client.query_single_row("SELECT 2")) == {"row_count": 3}
+    assert client.evaluate_query({"a": 1})["score"] == 1.0
+    assert offline.calls == 0
+
+    with pytest.raises(ReplayMissError):
+        client.execute_sql_query("SELECT 3")
+
+
+def test_rerecording_overwrites(tmp_path):
+    ReplayClient(_Client(), _store(tmp_path, RECORD)).execute_sql_query("SELECT 1")
+    client = _Client()
+    client.calls = 10
+    ReplayClient(client, _store(tmp_path, RECORD)).execute_sql_query("SELECT 1")
+
+    replayed = ReplayClient(_Client(), _store(tmp_path, REPLAY))
+    assert [replayed.execute_sql_query("SELECT 1")["run"] for _ in range(2)] == [11, 11]
+
+
+def test_replay_rebuilds_models(tmp_path):
+    pydantic = pytest.importorskip("pydantic")
+
+    class Stats(pydantic.BaseModel):
+        sql: str
+        total_bytes_billed: int
+
+    class ModelClient:
+        def get_sql_query_stats(self, sql: str) -> Stats:
+            return Stats(sql=sql, total_bytes_billed=10)
+
+    ReplayClient(ModelClient(), _store(tmp_path, RECORD)).get_sql_query_stats("SELECT 1")
+    stats = ReplayClient(ModelClient(), _store(tmp_path, REPLAY)).get_sql_query_stats("SELECT 1")
+    assert stats == Stats(sql="SELECT 1", total_bytes_billed=10)
+
+
+def test_simulated_latency(tmp_path):
+    store = _store(tmp_path, RECORD)
+    store.record(store.key("execute_sql_query", [["SELECT 1"], {}]), {"run": 1}, seconds=2.0)
+    assert _store(tmp_path, REPLAY, latency_scale=0.5).replay(
+        store.key("execute_sql_query", [["SELECT 1"], {}])
+    ) == ({"run": 1}, 1.0)
@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from src.common.result_cache import normalize_sql, sql_fingerprint  # noqa: E402
+
+
+def test_formatting_and_comments_do_not_change_the_fingerprint():
+    versions = {"p.d.t": "2024-01-01T00:00:00"}
+    a = sql_fingerprint("select a,  b\nfrom p.d.t -- dashboard", versions, workflow="lgraph")
+    b = sql_fingerprint("SELECT a, b FROM p.d.t", versions, workflow="lgraph")
+
+    assert a == b
+    assert normalize_sql("select a from p.d.t /* x */") == "SELECT a FROM p.d.t"
+
+
+def test_table_modification_changes_the_fingerprint():
+    sql = "SELECT a FROM p.d.t"
+
+    assert sql_fingerprint(sql, {"p.d.t": "v1"}, workflow="crew") != sql_fingerprint(
+        sql, {"p.d.t": "v2"}, workflow="crew"
+    )
+    assert sql_fingerprint(sql, {"p.d.t": "v1"}, workflow="crew") != sql_fingerprint(
+        sql, {"p.d.t": "v1"}, workflow="flow"
+    )
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from src.common.schema_context import (  # noqa: E402
+    build_schema_context,
+    estimate_tokens,
+    referenced_names,
+)
+
+SQL = """
+SELECT customer_id, SUM(o.amount) AS total, COUNT(*) AS orders
+FROM `proj.sales.orders` AS o
+WHERE o.address.city = 'Berlin'
+GROUP BY customer_id
+"""
+
+
+def _wide_table(width: int = 800) -> dict:
+    columns = [{"column_name": f"metric_{i}", "column_type": "FLOAT64"} for i in range(width)]
+    columns += [
+        {"column_name": "customer_id", "column_type": "STRING"},
+        {"column_name": "amount", "column_type": "NUMERIC"},
+        {"column_name": "address", "column_type": "RECORD"},
+        {"column_name": "order_date", "column_type": "DATE"},
+    ]
+    return {
+        "table_name": "proj.sales.orders",
+        "columns": columns,
+        "row_count": 1000,
+        "size_bytes": 10**9,
+        "partition_column": "order_date",
+        "clustering_columns": ["customer_id"],
+    }
+
+
+def test_referenced_names():
+    assert {"customer_id", "amount", "address", "city"} <= referenced_names(SQL)
+    assert referenced_names("SELECT * FROM t") is None
+    assert referenced_names("not sql at all") is None
+
+
+def test_prunes_columns_of_wide_tables():
+    context = build_schema_context(SQL, [_wide_table()])
+    assert context.splitlines()[1:] == [
+        "proj.sales.orders: 1000 rows, 1000000000 bytes, partitioned by order_date,"
+        " clustered by customer_id",
+        "  customer_id STRING, order_date DATE, amount NUMERIC, address RECORD",
+        "  (800 more columns not shown)",
+    ]
+    full = build_schema_context("SELECT * FROM `proj.sales.orders`", [_wide_table()], 0)
+    assert estimate_tokens(full) > 10 * estimate_tokens(context)
+
+
+def test_token_budget():
+    context = build_schema_context("SELECT * FROM `proj.sales.orders`", [_wide_table()], 200)
+    assert estimate_tokens(context) <= 200
+    # partition and cluster keys come first
+    assert context.splitlines()[2].startswith("  customer_id STRING, order_date DATE, metric_0")
+    assert context.endswith("more columns not shown)")
+
+
+def test_no_tables():
+    assert build_schema_context(SQL, None) == ""
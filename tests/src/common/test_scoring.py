@@ -0,0 +1,59 @@
+import pytest
+
+from src.common.scoring import evaluate_query, get_scoring_weights, score_candidates
+
+
+def _results(bytes_billed, slot_millis, seconds, **extra):
+    return {
+        "total_bytes_billed": bytes_billed,
+        "slot_millis": slot_millis,
+        "execution_time_seconds": seconds,
+        **extra,
+    }
+
+
+def test_original_scores_one():
+    assert evaluate_query(_results(10**9, 5000, 2.0))["score"] == pytest.approx(1.0)
+    assert evaluate_query(_results(10**9, 5000, 2.0, error="boom"))["score"] == 0.0
+
+
+def test_latency_is_scored_on_server_time():
+    weights = {"execution_time_seconds": 1.0}
+    baseline = _results(1, 1, 5.0, server_time_seconds=2.0)
+    # slower on the wall clock (e.g. a slow result download), twice as fast on the server
+    candidate = _results(1, 1, 6.0, server_time_seconds=1.0)
+
+    score = evaluate_query(candidate, baseline, weights)["score"]
+
+    assert score == pytest.approx(2.0, rel=1e-2)
+
+
+def test_score_candidates():
+    baseline = _results(10**9, 8000, 4.0)
+    candidates = [
+        _results(10**9, 8000, 4.0),
+        _results(5 * 10**8, 4000, 2.0),
+        _results(10**8, 16000, 8.0),
+        _results(0, 0, 0.0, error="invalid"),
+    ]
+    scored = score_candidates(baseline, candidates)
+    assert scored["scores"][0] == pytest.approx(1.0)
+    assert scored["scores"][1] == pytest.approx(2.0, rel=1e-3)
+    assert scored["scores"][3] == 0.0
+    assert scored["ranking"] == [1, 2, 0, 3]
+    assert scored["pareto_front"] == [1, 2]
+
+
+def test_dry_run_scores_bytes_only():
+    baseline = _results(10**9, None, 0.0, dry_run=True)
+    scored = evaluate_query(_results(10**8, None, 0.0, dry_run=True), baseline)
+    assert scored["ratios"].keys() == {"total_bytes_billed"}
+    assert scored["score"] == pytest.approx(10.0, rel=1e-3)
+
+
+def test_scoring_weights_from_env(monkeypatch):
+    monkeypatch.setenv("SCORING_WEIGHTS", '{"total_bytes_billed": 3, "slot_millis": 1}')
+    assert get_scoring_weights() == {"total_bytes_billed": 0.75, "slot_millis": 0.25}
+    monkeypatch.setenv("SCORING_WEIGHTS", '{"rows": 1}')
+    with pytest.raises(ValueError):
+        get_scoring_weights()
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+from src.common.services import _vertex_credentials, get_credentials, shared
+
+
+def test_service_is_created_once_per_arguments():
+    created = []
+
+    @shared
+    def get_client(name, timeout=1):
+        created.append((name, timeout))
+        return object()
+
+    assert get_client("a") is get_client("a")
+    assert get_client("a", timeout=2) is get_client("a", timeout=2)
+    assert get_client("a") is not get_client("b")
+    assert created == [("a", 1), ("a", 2), ("b", 1)]
+
+
+def test_concurrent_first_uses_share_one_service():
+    created = []
+
+    @shared
+    def get_client():
+        time.sleep(0.05)
+        created.append(1)
+        return object()
+
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(get_client())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(client is clients[0] for client in clients)
+
+
+def test_cache_clear_recreates_the_service():
+    @shared
+    def get_client():
+        return object()
+
+    client = get_client()
+    get_client.cache_clear()
+
+    assert get_client() is not client
+
+
+def test_vertex_credentials(monkeypatch, tmp_path):
+    info = {"type": "service_account", "project_id": "p"}
+    monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", json.dumps(info))
+    assert _vertex_credentials() == info
+
+    path = tmp_path / "credentials.json"
+    path.write_text(json.dumps(info))
+    monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", str(path))
+    assert _vertex_credentials() == info
+
+    # workload identity and application default credentials
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS")
+    assert _vertex_credentials() is None
+
+
+def test_replay_skips_the_credentials(monkeypatch):
+    monkeypatch.setenv("REPLAY_MODE", "replay")
+    get_credentials.cache_clear()
+    try:
+        assert get_credentials() is None
+    finally:
+        get_credentials.cache_clear()
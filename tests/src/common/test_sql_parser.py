@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("sqlglot")
+
+from src.common.sql_parser import SqlParseError, extract_tables  # noqa: E402
+
+
+def test_extracts_fully_qualified_tables_and_aliases():
+    refs = extract_tables(
+        "select * from gd-gcp-rnd-analytical-platform.adp_rnd_dwh_performance.customer c"
+        " CROSS join `gd-gcp-rnd-analytical-platform.adp_rnd_dwh_performance.catalog_sales` s"
+        " WHERE c.c_customer_sk = s.cs_ship_customer_sk limit 1"
+    )
+
+    assert refs.tables == [
+        "gd-gcp-rnd-analytical-platform.adp_rnd_dwh_performance.customer",
+        "gd-gcp-rnd-analytical-platform.adp_rnd_dwh_performance.catalog_sales",
+    ]
+    assert refs.aliases["c"].endswith(".customer")
+    assert refs.aliases["s"].endswith(".catalog_sales")
+
+
+def test_resolves_defaults_and_skips_ctes():
+    refs = extract_tables(
+        "WITH recent AS (SELECT id FROM sales.orders) "
+        "SELECT * FROM recent JOIN customers USING (id)",
+        default_project="proj",
+        default_dataset="crm",
+    )
+
+    assert sorted(refs.tables) == ["proj.crm.customers", "proj.sales.orders"]
+    assert refs.ctes == ["recent"]
+
+
+def test_cte_names_are_case_insensitive():
+    refs = extract_tables(
+        "WITH Recent AS (SELECT a FROM d.t) SELECT a FROM recent", default_project="p"
+    )
+
+    assert refs.tables == ["p.d.t"]
+    assert refs.ctes == ["Recent"]
+
+
+def test_unqualifiable_table_raises():
+    with pytest.raises(SqlParseError):
+        extract_tables("SELECT * FROM customers", default_project="proj")
+
+
+def test_garbage_raises():
+    with pytest.raises(SqlParseError):
+        extract_tables("selec * frm")
@@ -0,0 +1,29 @@
+from src.common.sqlite_store import SqliteStore
+
+
+def test_roundtrip_and_persistence(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    SqliteStore(path).put("key", {"score": 1.5, "tables": ["a", "b"]})
+
+    assert SqliteStore(path).get("key") == {"score": 1.5, "tables": ["a", "b"]}
+    assert SqliteStore(path).get("missing") is None
+
+
+def test_least_recently_read_entries_are_evicted(tmp_path):
+    store = SqliteStore(str(tmp_path / "store.sqlite"), max_entries=2)
+    store.put("a", 1)
+    store.put("b", 2)
+    store.get("a")
+    store.put("c", 3)
+
+    assert len(store) == 2
+    assert store.get("a") == 1
+    assert store.get("b") is None
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    store = SqliteStore(str(tmp_path / "store.sqlite"), ttl_seconds=-1)
+    store.put("a", 1)
+
+    assert store.get("a") is None
+    assert len(store) == 0
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from src.common.streaming import format_sse, stream_graph_updates
+
+
+class _Chain:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def astream(self, inputs, config=None, stream_mode=None):
+        yield "updates", {"identify_tables": {"tables": ["t"]}}
+        yield "values", {**inputs, "tables": ["t"]}
+        if self.fail:
+            raise RuntimeError("boom")
+
+
+async def _collect(chain, completed):
+    async def on_complete(state):
+        completed.append(state)
+
+    return [e async for e in stream_graph_updates(chain, {"sql": "x"}, on_complete=on_complete)]
+
+
+def test_format_sse():
+    assert format_sse({"a": 1}) == 'data: {"a": 1}\n\n'
+    assert format_sse({"a": 1}, event="result") == 'event: result\ndata: {"a": 1}\n\n'
+
+
+def test_stream_graph_updates():
+    completed = []
+    events = asyncio.run(_collect(_Chain(), completed))
+    assert events[0].startswith("event: update\n")
+    assert json.loads(events[0].split("data: ")[1])["node"] == "identify_tables"
+    assert events[1] == format_sse({"sql": "x", "tables": ["t"]}, event="result")
+    assert completed == [{"sql": "x", "tables": ["t"]}]
+
+    completed = []
+    events = asyncio.run(_collect(_Chain(fail=True), completed))
+    assert events[-1] == format_sse({"error": "boom"}, event="error")
+    assert completed == []
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.common.throttle import (
+    AIMDLimiter,
+    Throttle,
+    TokenBucket,
+    create_throttle,
+    is_overload_error,
+)
+
+
+class TooManyRequests(Exception):
+    pass
+
+
+def _throttle(max_limit=4, **kwargs):
+    kwargs.setdefault("retry_base_seconds", 0.001)
+    return Throttle("test", AIMDLimiter(max_limit=max_limit), **kwargs)
+
+
+def test_overload_errors():
+    assert is_overload_error(TooManyRequests("429 Too Many Requests"))
+    assert is_overload_error(RuntimeError("Exceeded rate limits: too many concurrent queries"))
+    assert is_overload_error(RuntimeError("RESOURCE_EXHAUSTED: quota exceeded"))
+    assert not is_overload_error(ValueError("Syntax error: Unexpected keyword WHERE"))
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    bucket = TokenBucket(rate_per_second=10, capacity=2)
+
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_aimd_halves_once_per_window_and_grows_additively():
+    limiter = AIMDLimiter(max_limit=8)
+    started = [limiter.acquire() for _ in range(3)]
+
+    limiter.release(started[0], overloaded=True)
+    limiter.release(started[1], overloaded=True)  # started before the decrease
+
+    assert limiter.limit == 4
+
+    for _ in range(4):
+        limiter.release(limiter.acquire(), overloaded=False)
+
+    assert limiter.limit == pytest.approx(5, abs=0.2)
+    limiter.release(started[2], overloaded=None)  # other errors don't change the limit
+    assert limiter.in_flight == 0
+
+
+def test_limiter_caps_concurrent_threads():
+    throttle = _throttle(max_limit=2)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    threads = [threading.Thread(target=throttle.call, args=(work,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+
+
+def test_call_retries_overload_errors():
+    throttle = _throttle(max_retries=2)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TooManyRequests("429")
+        return "ok"
+
+    assert throttle.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert throttle.limiter.limit < 4
+
+
+def test_call_raises_other_errors_and_exhausted_retries():
+    throttle = _throttle(max_retries=1)
+    attempts = []
+
+    def failing(error):
+        attempts.append(1)
+        raise error
+
+    with pytest.raises(ValueError):
+        throttle.call(failing, ValueError("bad query"))
+    assert len(attempts) == 1
+    with pytest.raises(TooManyRequests):
+        throttle.call(failing, TooManyRequests("429"))
+    assert len(attempts) == 3
+    assert throttle.limiter.in_flight == 0
+
+
+def test_nested_calls_of_the_same_throttle_take_one_slot():
+    throttle = _throttle(max_limit=1)
+
+    assert throttle.call(lambda: throttle.call(lambda: "inner")) == "inner"
+
+
+def test_async_calls_wait_for_slots():
+    throttle = _throttle(max_limit=2)
+    running, peak = [0], [0]
+
+    async def work():
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return True
+
+    async def main():
+        return await asyncio.gather(*(throttle.acall(work) for _ in range(6)))
+
+    assert all(asyncio.run(main()))
+    assert peak[0] == 2
+    assert throttle.limiter.in_flight == 0
+
+
+def test_create_throttle_sizes_the_bucket_from_the_quota():
+    assert create_throttle("a", requests_per_minute=0, max_concurrency=3).bucket is None
+    throttle = create_throttle("b", requests_per_minute=120, max_concurrency=3)
+    assert throttle.bucket.rate_per_second == 2
+    assert throttle.bucket.capacity == 2
+    assert throttle.limiter.max_limit == 3
@@ -0,0 +1,38 @@
+from src.common.trials import aggregate_trials, compare, mann_whitney_u, summarize
+
+
+def test_summarize():
+    summary = summarize([3.0, 1.0, 2.0, 4.0, 5.0])
+    assert summary["n"] == 5
+    assert summary["median"] == 3.0
+    assert summary["mean"] == 3.0
+    assert summary["variance"] == 2.5
+    assert summary["p95"] == 4.8
+
+
+def test_mann_whitney_exact_and_approximate():
+    u, p = mann_whitney_u([1.0, 2.0, 3.0, 4.0], [5.0, 6.0, 7.0, 8.0])
+    assert u == 0
+    assert abs(p - 2 / 70) < 1e-9
+
+    _, p = mann_whitney_u(list(range(20)), [x + 0.5 for x in range(20)])
+    assert p > 0.5
+
+
+def test_compare_flags_noise():
+    assert compare([10.0, 10.2, 9.9, 10.1], [5.0, 5.1, 4.9, 5.2])["significant"]
+    noisy = compare([10.0, 12.0, 9.0, 11.0], [9.5, 11.5, 10.5, 12.5])
+    assert not noisy["significant"]
+    assert compare([10.0], [5.0])["p_value"] is None
+
+
+def test_aggregate_trials_uses_server_time():
+    runs = [
+        {"execution_time_seconds": 9.0, "server_time_seconds": t, "slot_millis": s, "sql": "x"}
+        for t, s in [(1.0, 100), (3.0, 300), (2.0, 200)]
+    ]
+    result = aggregate_trials(runs)
+    assert result["execution_time_seconds"] == 2.0
+    assert result["server_time_seconds"] == 2.0
+    assert result["slot_millis"] == 200
+    assert result["trials"]["execution_time_seconds"]["samples"] == [1.0, 3.0, 2.0]
@@ -0,0 +1,60 @@
+import asyncio
+from contextvars import copy_context
+
+from src.common import usage
+from src.common.usage import UsageClient, recording
+
+
+class _Client:
+    def execute_sql_query(self, sql: str, dry_run: bool = False) -> dict:
+        return {"dry_run": dry_run, "total_bytes_billed": 100}
+
+    async def benchmark_sql_query(self, sql: str, trials: int = 3, warmup: int = 0) -> dict:
+        return {"dry_run": False, "total_bytes_billed": 10}
+
+    def get_table_metadata(self, table: str) -> dict:
+        return {"table": table}
+
+
+def test_usage_client_records_jobs_and_bytes():
+    client = UsageClient(_Client())
+    with recording() as recorder:
+        client.execute_sql_query("SELECT 1")
+        client.execute_sql_query("SELECT 1", dry_run=True)
+        asyncio.run(client.benchmark_sql_query("SELECT 1", trials=5, warmup=1))
+        assert client.get_table_metadata("t") == {"table": "t"}
+
+    totals = recorder.totals()
+    # dry runs bill nothing, every trial and warmup run bills the query's bytes
+    assert totals["bq_jobs"] == 1 + 1 + 6
+    assert totals["bytes_billed"] == 100 + 60
+
+
+def test_usage_client_without_recorder():
+    assert UsageClient(_Client()).execute_sql_query("SELECT 1")["total_bytes_billed"] == 100
+
+
+def test_usage_per_node():
+    with recording() as recorder:
+        usage.current_recorder().add_llm_call(10, 2)
+
+        def node():
+            usage.set_node("analyze")
+            usage.current_recorder().add_llm_call(5, 1)
+
+        # a node set in a copied context doesn't leak into the caller's
+        copy_context().run(node)
+        recorder.add_node_run("analyze", 0.5)
+        usage.current_recorder().add_llm_call(1, 1)
+
+    report = recorder.report()
+    assert report["nodes"]["workflow"]["llm_calls"] == 2
+    assert report["nodes"]["analyze"] == {
+        **report["nodes"]["analyze"],
+        "runs": 1,
+        "wall_seconds": 0.5,
+        "llm_calls": 1,
+        "input_tokens": 5,
+    }
+    assert report["totals"]["input_tokens"] == 16
+    assert usage.current_recorder() is None
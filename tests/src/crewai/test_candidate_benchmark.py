@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("google.cloud.bigquery")
+
+from src.common.models import ProposedImprovement, QuerySuggestions  # noqa: E402
+from src.crewai import candidate_benchmark  # noqa: E402
+from src.crewai.candidate_benchmark import CandidateBenchmark  # noqa: E402
+from src.crewai.models import QueryStats  # noqa: E402
+
+
+class _Client:
+    """Runs every query in `delay` seconds, billing the bytes listed for it."""
+
+    def __init__(self, bytes_billed: dict[str, int], delay: float = 0.0):
+        self.bytes_billed = bytes_billed
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def get_sql_query_stats(self, sql, dry_run=False, trials=1, warmup=0) -> QueryStats:
+        with self._lock:
+            self.queries.append(sql)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if sql not in self.bytes_billed:
+                raise ValueError(f"Syntax error: {sql}")
+            return QueryStats(
+                total_bytes_processed=self.bytes_billed[sql],
+                total_bytes_billed=self.bytes_billed[sql],
+                billing_tier=1,
+                execution_time_seconds=1.0,
+                cache_hit=False,
+                num_dml_affected_rows=0,
+                sql=sql,
+                dry_run=dry_run,
+            )
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def _suggestions(*candidates: str) -> QuerySuggestions:
+    return QuerySuggestions(
+        original_sql="SELECT original",
+        improvements=[ProposedImprovement(improved_sql=sql, rationale="") for sql in candidates],
+    )
+
+
+def _benchmark(client, **kwargs) -> CandidateBenchmark:
+    kwargs = {"dry_run": False, "trials": 1, "warmup": 0, "verify_equivalence": False} | kwargs
+    return CandidateBenchmark(client, **kwargs)
+
+
+def test_candidates_run_at_most_max_parallel_at_once():
+    candidates = [f"SELECT {i}" for i in range(6)]
+    client = _Client(dict.fromkeys(["SELECT original", *candidates], 100), delay=0.05)
+
+    _benchmark(client, max_parallel=2).run(_suggestions(*candidates))
+
+    assert client.max_running == 2
+    assert len(client.queries) == 7
+
+
+def test_candidates_are_scored_against_the_original():
+    client = _Client({"SELECT original": 100, "SELECT cheaper": 50, "SELECT same": 100})
+
+    analysis = _benchmark(client).run(_suggestions("SELECT cheaper", "SELECT same"))
+
+    # the original is run but not reported as a candidate
+    assert client.queries.count("SELECT original") == 1
+    assert [stats.sql for stats in analysis.execution_stats] == ["SELECT cheaper", "SELECT same"]
+    assert analysis.scores[0] > analysis.scores[1]
+    assert analysis.ranking == [0, 1]
+
+
+def test_failed_candidate_scores_zero():
+    client = _Client({"SELECT original": 100, "SELECT cheaper": 50})
+
+    analysis = _benchmark(client).run(_suggestions("SELECT broken", "SELECT cheaper"))
+
+    failed = analysis.execution_stats[0]
+    assert failed.sql == "SELECT broken"
+    assert "Syntax error" in failed.error
+    assert analysis.scores[0] == 0.0
+    assert analysis.ranking == [1, 0]
+
+
+def test_equivalence_is_attached_to_the_candidate_stats(monkeypatch):
+    def check_equivalence(bq_client, original_sql, optimized_sql):
+        assert original_sql == "SELECT original"
+        status = "equivalent" if optimized_sql == "SELECT same" else "different"
+        return {"status": status}
+
+    monkeypatch.setattr(candidate_benchmark, "check_equivalence", check_equivalence)
+    client = _Client(dict.fromkeys(["SELECT original", "SELECT same", "SELECT other"], 100))
+
+    analysis = _benchmark(client, verify_equivalence=True).run(
+        _suggestions("SELECT same", "SELECT other")
+    )
+
+    assert [stats.equivalence for stats in analysis.execution_stats] == [
+        {"status": "equivalent"},
+        {"status": "different"},
+    ]
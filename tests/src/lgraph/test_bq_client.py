@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("google.cloud.bigquery")
+
+from src.common import replay  # noqa: E402
+from src.common.replay import ReplayMissError  # noqa: E402
+from src.lgraph import bq_client  # noqa: E402
+
+
+def test_replayed_client_needs_no_credentials(monkeypatch, tmp_path):
+    def no_pool():
+        raise AssertionError("BigQuery client created")
+
+    monkeypatch.setenv("REPLAY_MODE", "replay")
+    monkeypatch.setenv("REPLAY_STORE", str(tmp_path / "replay.sqlite"))
+    monkeypatch.setattr(replay, "_replay_store", None)
+    monkeypatch.setattr(bq_client, "get_bq_client_pool", no_pool)
+
+    client = bq_client.create_bq_client("project")
+
+    # the call is looked up in the recordings, without connecting to BigQuery
+    with pytest.raises(ReplayMissError):
+        asyncio.run(client.get_table_versions(["project.d.t"]))
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("langgraph")
+pytest.importorskip("google.cloud.bigquery")
+
+from src.common import services  # noqa: E402
+from src.common.budget import BudgetExceededError  # noqa: E402
+from src.common.scoring import evaluate_query  # noqa: E402
+from src.lgraph import main_dynamic  # noqa: E402
+
+
+class _OverBudgetClient:
+    async def execute_sql_query(self, sql):
+        raise BudgetExceededError("The query would process 200 bytes")
+
+    async def dry_run_sql_query(self, sql):
+        raise BudgetExceededError("The query would process 200 bytes")
+
+    async def benchmark_sql_query(self, sql, trials, warmup=0):
+        raise BudgetExceededError("The query would process 200 bytes")
+
+    def evaluate_query(self, results, baseline=None):
+        return evaluate_query(results, baseline)
+
+
+def test_over_budget_tool_call_scores_zero(monkeypatch):
+    monkeypatch.setattr(services, "get_lgraph_bq_client", lambda: _OverBudgetClient())
+    tool_call = {
+        "name": "query_run_and_stats",
+        "args": {"__arg1": "SELECT 2"},
+        "id": "call",
+        "type": "tool_call",
+    }
+
+    message = asyncio.run(main_dynamic.query_run_and_stats_tool.ainvoke(tool_call))
+
+    stats = json.loads(message.content)
+    assert stats["score"] == 0.0
+    assert stats["metadata"]["sql"] == "SELECT 2"
+    assert "200 bytes" in stats["metadata"]["error"]